@@ -1,18 +1,25 @@
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 import os
 from dotenv import load_dotenv
+from app.replicas import RoutingSession
+from app.view_counter import ViewCounter
 
 load_dotenv()
 
-db = SQLAlchemy()
-migrate = Migrate()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+view_counter = ViewCounter()
+
+def create_app(profile=None):
+    from app.config import PROFILES, apply_sqlite_pragmas, describe_engine, engine_options, profile_name
 
-def create_app():
     app = Flask(__name__)
     
     # Configuration
+    app.config['PROFILE'] = profile_name(profile)
+    app.config.from_object(PROFILES[app.config['PROFILE']])
+    app.logger.setLevel(app.config['LOG_LEVEL'])
     # Prefer full DATABASE_URL if provided (useful for local testing or alternative DBs)
     database_url = os.getenv('DATABASE_URL')
     if not database_url:
@@ -28,22 +35,107 @@ def create_app():
             database_url = 'sqlite:///mathmerise.db'
 
     app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database_url, app.config)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key')
+    app.config['PER_PAGE'] = int(os.getenv('PER_PAGE', 24))
+    app.config['SITE_BUILD_DIR'] = os.getenv('SITE_BUILD_DIR', os.path.join(app.instance_path, 'site'))
     
     # Initialize extensions
     db.init_app(app)
-    migrate.init_app(app, db)
+    # First, so its hooks wrap everyone else's.
+    from app.metrics import metrics
+    metrics.init_app(app)
+    from app.diagnostics import diagnostics
+    diagnostics.init_app(app)
+    # Flask-Migrate pulls in Alembic, which production web workers never use.
+    if app.config['PROFILE'] != 'production' or click.get_current_context(silent=True) is not None:
+        from flask_migrate import Migrate
+        Migrate(app, db, render_as_batch=True)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            apply_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+        app.logger.info(describe_engine(db.engine, app.config['SQLALCHEMY_ENGINE_OPTIONS']))
+    view_counter.init_app(app)
+
+    from app.replicas import replicas
+    replicas.init_app(app)
+
+    from app.search import search_index
+    search_index.init_app(app)
+
+    from app.suggest import suggestions
+    suggestions.init_app(app)
+
+    from app.mathrender import math_renderer
+    math_renderer.init_app(app)
+
+    from app.recommend import recommendations
+    recommendations.init_app(app)
+
+    from app.cache import response_cache
+    response_cache.init_app(app)
+
+    from app.http_cache import http_cache
+    http_cache.init_app(app)
+
+    from app.streaming import streaming
+    streaming.init_app(app)
+
+    from app.assets import assets
+    assets.init_app(app)
+
+    from app.perf import perf_cli
+    app.cli.add_command(perf_cli)
+
+    from app.content import content_cli
+    app.cli.add_command(content_cli)
+
+    from app.site import site_cli
+    app.cli.add_command(site_cli)
+
+    from app.stats import stats_cli
+    app.cli.add_command(stats_cli)
     
     # Import and register blueprints
-    from app.routes import topics, admin
+    from app.routes import topics, admin, api
     from app import routes
     app.register_blueprint(routes.bp)
     app.register_blueprint(topics.bp)
     app.register_blueprint(admin.bp)
+    app.register_blueprint(api.bp)
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Production schemas come from migrations (flask db upgrade); creating
+    # them here would cost every new worker a round of metadata queries.
+    if app.config['AUTO_CREATE_SCHEMA']:
+        with app.app_context():
+            db.create_all()
     
     return app
+
+
+def after_fork(app):
+    """Drop database connections inherited from a preloading parent process.
+
+    Called from gunicorn's ``post_fork`` hook; ``close=False`` leaves the
+    parent's sockets alone and only stops this worker from reusing them.
+    Then starts building the recommendation snapshot and the suggestion
+    index, and measuring replica lag, in the background, so the first
+    requests do not wait for them.
+    """
+    from app.recommend import recommendations
+    from app.replicas import replicas
+    from app.suggest import suggestions
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    for replica in app.extensions['replicas'].replicas:
+        replica.engine.dispose(close=False)
+    with app.app_context():
+        if app.config['RECOMMEND_BACKGROUND']:
+            recommendations.start_refresh()
+        if app.config['SUGGEST_BACKGROUND']:
+            suggestions.start_rebuild()
+        if app.config['REPLICA_BACKGROUND']:
+            replicas.start_checks()
@@ -0,0 +1,222 @@
+"""ASGI serving with non-blocking database reads.
+
+``uvicorn asgi:app`` serves the same Flask app as ``gunicorn run:app``.
+GET and HEAD requests to the endpoints in ``ASGI_ASYNC_ENDPOINTS`` (the
+public read pages) are handled on the event loop: Flask's usual dispatch,
+with its before-request hooks, HTTP and response caches, error handlers and
+teardown, runs inside SQLAlchemy's greenlet bridge with ``db.session`` bound
+to an :class:`~sqlalchemy.ext.asyncio.AsyncSession` on aiosqlite or
+asyncpg. The views, queries and templates are the ones the WSGI app uses,
+but every statement they issue awaits its result, so a slow query parks one
+coroutine instead of holding a worker. Every other request, including all
+writes, runs through the WSGI app on a pool of ``ASGI_THREADS`` threads.
+Either way the body is sent chunk by chunk as the app yields it, so streamed
+pages (:mod:`app.streaming`) stream here too.
+
+The async engine connects to ``ASYNC_DATABASE_URL`` if set, otherwise to the
+primary database with its driver swapped (``psycopg2`` for ``asyncpg``,
+``pysqlite`` for ``aiosqlite``). Async reads do not use read replicas.
+
+Nothing on the event loop may block it, so work that is neither a query nor
+rendering is kept off the read pages: the recommendation snapshot and the
+suggestion index are built on background threads, and rendered formulas
+are stored when they are saved (or by ``flask math render``), never by a
+read. The filesystem response cache
+reads and writes files on every page, so with ``RESPONSE_CACHE=filesystem``
+all requests go through the thread pool instead.
+"""
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.util import await_only
+from werkzeug.exceptions import HTTPException
+
+from app import db
+from app.cache import FileSystemCache
+from app.config import apply_sqlite_pragmas
+
+ASYNC_DRIVERS = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+
+READ_ENDPOINTS = ('main.index', 'main.search', 'topics.all_topics', 'topics.category', 'topics.view_topic')
+
+
+def async_database_url(url):
+    """``url`` with its driver replaced by the matching asyncio driver."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No asyncio driver for {backend!r} databases; set ASYNC_DATABASE_URL')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def wsgi_environ(scope, body):
+    """The WSGI environ for an ASGI HTTP ``scope`` with request ``body`` bytes."""
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode().decode('latin-1'),
+        'PATH_INFO': path.encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if name in environ and name.startswith('HTTP_'):
+            # Repeated headers are joined as one list; HTTP/2 clients may
+            # split Cookie into several, which join with '; ' instead.
+            value = f"{environ[name]}{'; ' if name == 'HTTP_COOKIE' else ','}{value}"
+        environ[name] = value
+    return environ
+
+
+def call_wsgi(app, environ, deliver):
+    """Run ``app`` for ``environ``, passing each ASGI response message to ``deliver``.
+
+    Body chunks are delivered as the app produces them, so a streamed page
+    goes out while it renders. The app's iterable is consumed on the calling
+    thread (or greenlet) from start to end, as a streamed response keeps its
+    request context open on it.
+    """
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]), headers]
+
+    chunks = app(environ, start_response)
+    try:
+        status, headers = started
+        deliver({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        for chunk in chunks:
+            if chunk:
+                deliver({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        deliver({'type': 'http.response.body'})
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+class AsyncApp:
+    """ASGI application serving ``app``; see the module docstring."""
+
+    def __init__(self, app):
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        app.config.setdefault('ASYNC_DATABASE_URI', os.getenv('ASYNC_DATABASE_URL'))
+        app.config.setdefault('ASGI_ASYNC_ENDPOINTS', READ_ENDPOINTS)
+        app.config.setdefault('ASGI_THREADS', int(os.getenv('ASGI_THREADS', 8)))
+        self.app = app
+        with app.app_context():
+            url = app.config['ASYNC_DATABASE_URI'] or async_database_url(db.engine.url)
+        if make_url(url).get_backend_name() == 'sqlite':
+            self.engine = create_async_engine(url)
+            apply_sqlite_pragmas(self.engine.sync_engine, app.config['SQLITE_PRAGMAS'])
+        else:
+            self.engine = create_async_engine(url, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+        self.executor = ThreadPoolExecutor(app.config['ASGI_THREADS'], thread_name_prefix='wsgi')
+        app.extensions['asgi'] = self
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = await self._read_body(receive)
+            environ = wsgi_environ(scope, body)
+            if self.is_async(environ):
+                await self._dispatch_async(environ, send)
+            else:
+                loop = asyncio.get_running_loop()
+
+                def deliver(message):
+                    # Waiting for each send keeps a slow client from piling
+                    # up the rest of the page in memory.
+                    asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+                await loop.run_in_executor(self.executor, call_wsgi, self.app, environ, deliver)
+
+    async def _read_body(self, receive):
+        parts = []
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            parts.append(message.get('body', b''))
+            if not message.get('more_body'):
+                break
+        return b''.join(parts)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def is_async(self, environ):
+        """Whether the request in ``environ`` is a read served on the event loop."""
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return False
+        if isinstance(self.app.extensions['response_cache'].backend, FileSystemCache):
+            return False
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return False
+        return endpoint in self.app.config['ASGI_ASYNC_ENDPOINTS']
+
+    async def _dispatch_async(self, environ, send):
+        from sqlalchemy.ext.asyncio import AsyncSession
+
+        async with AsyncSession(self.engine, expire_on_commit=False) as session:
+            await session.run_sync(self._dispatch, environ, send)
+
+    def _dispatch(self, session, environ, send):
+        # Runs in a greenlet: db.session's I/O through ``session`` yields to
+        # the event loop. The session is scoped to this request's own app
+        # context, and Flask-SQLAlchemy removes it when that is torn down.
+        app_ctx = self.app.app_context()
+        ctx = self.app.request_context(environ)
+        error = None
+        app_ctx.push()
+        try:
+            try:
+                ctx.push()
+                db.session.registry.set(session)
+                response = self.app.full_dispatch_request()
+            except Exception as e:
+                error = e
+                response = self.app.handle_exception(e)
+            call_wsgi(response, environ, lambda message: await_only(send(message)))
+        finally:
+            ctx.pop(error)
+            app_ctx.pop(error)
@@ -0,0 +1,266 @@
+"""Fingerprinted, precompressed static assets.
+
+``flask assets build`` minifies every stylesheet and script under
+``static/``, writes each file to ``static/dist/`` under a name that includes
+a hash of its contents (``css/style.3f2a9c1b04de.css``), next to gzip and,
+when the ``brotli`` package is installed, brotli variants, and records the
+mapping in ``static/dist/manifest.json``.
+
+With a manifest present (and ``ASSETS_USE_MANIFEST``, on outside debug
+mode), ``url_for('static', filename='css/style.css')`` points at the hashed
+file, so templates need no changes. Hashed files never change, so they are
+served with ``Cache-Control: public, max-age=31536000, immutable``, and the
+static view sends the brotli or gzip variant when the client's
+``Accept-Encoding`` allows it. Anything not in the manifest is served as
+before.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import AppGroup
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MINIFIED = ('.css', '.js')
+# Other text types are worth precompressing too; images and fonts are not.
+COMPRESSED = MINIFIED + ('.svg', '.json', '.txt', '.map')
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/|\s+', re.S)
+_CSS_PUNCTUATION = re.compile(r'\s*([{};,>])\s*')
+# A space before ':' can be a descendant combinator (``a :hover``); after it, never.
+_CSS_COLON = re.compile(r':\s+')
+# Trailing spaces, the line break, blank lines and the next line's indentation.
+_JS_LINE_BREAK = re.compile(r'[ \t]*\n\s*')
+
+
+def _compact_css(css):
+    return _CSS_COLON.sub(':', _CSS_PUNCTUATION.sub(r'\1', css)).replace(';}', '}')
+
+
+def minify_css(source):
+    """Drop comments and redundant whitespace, leaving strings untouched."""
+    chunks, code, position = [], [], 0
+    for match in _CSS_TOKENS.finditer(source):
+        code.append(source[position:match.start()])
+        if match.group(1):
+            chunks.append(_compact_css(''.join(code)))
+            chunks.append(match.group(1))
+            code = []
+        else:
+            code.append(' ')
+        position = match.end()
+    code.append(source[position:])
+    chunks.append(_compact_css(''.join(code)))
+    return ''.join(chunks).strip()
+
+
+def _compact_js(code):
+    return _JS_LINE_BREAK.sub('\n', code)
+
+
+def minify_js(source):
+    """Strip comments, indentation and blank lines from a script.
+
+    Line breaks are kept, so automatic semicolon insertion still sees the
+    same statements; strings, template literals and regular expressions are
+    copied through unchanged.
+    """
+    chunks, code = [], []
+    i, length = 0, len(source)
+    # Whether a '/' here would start a regular expression rather than divide.
+    regex_allowed = True
+    while i < length:
+        char = source[i]
+        if char in '\'"`':
+            end = i + 1
+            while end < length and source[end] != char:
+                end += 2 if source[end] == '\\' else 1
+            chunks.append(_compact_js(''.join(code)))
+            chunks.append(source[i:end + 1])
+            code = []
+            i = end + 1
+            regex_allowed = False
+        elif source.startswith('//', i):
+            i = source.find('\n', i)
+            i = length if i == -1 else i
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            code.append(' ')
+        elif char == '/' and regex_allowed:
+            end, in_class = i + 1, False
+            while end < length and (source[end] != '/' or in_class):
+                if source[end] == '\\':
+                    end += 1
+                elif source[end] == '[':
+                    in_class = True
+                elif source[end] == ']':
+                    in_class = False
+                end += 1
+            end += 1
+            while end < length and source[end].isalpha():
+                end += 1
+            chunks.append(_compact_js(''.join(code)))
+            chunks.append(source[i:end])
+            code = []
+            i = end
+            regex_allowed = False
+        else:
+            code.append(char)
+            if not char.isspace():
+                regex_allowed = not (char.isalnum() or char in '_$)]')
+            i += 1
+    chunks.append(_compact_js(''.join(code)))
+    # Only the code around literals is compacted, so a template literal's
+    # own line breaks and indentation survive.
+    chunks[0] = chunks[0].lstrip()
+    chunks[-1] = chunks[-1].rstrip()
+    return ''.join(chunks) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def hashed_name(name, data):
+    root, ext = os.path.splitext(name)
+    return f'{root}.{hashlib.sha1(data).hexdigest()[:12]}{ext}'
+
+
+def build(static_folder, output='dist'):
+    """Write minified, hashed and compressed copies of ``static_folder``'s files.
+
+    Files from the previous build are kept for pages still cached with their
+    URLs; older ones are deleted. Returns the manifest and a list of
+    ``(name, original, minified, gzip, brotli)`` byte sizes.
+    """
+    target = os.path.join(static_folder, output)
+    previous = read_manifest(target)
+    manifest, sizes = {}, []
+    for directory, dirs, files in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(target):
+            dirs[:] = []
+            continue
+        dirs[:] = sorted(d for d in dirs if os.path.join(directory, d) != target)
+        for filename in sorted(files):
+            source = os.path.join(directory, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            ext = os.path.splitext(filename)[1].lower()
+            with open(source, 'rb') as stream:
+                original = stream.read()
+            data = original
+            if ext in MINIFIERS:
+                data = MINIFIERS[ext](original.decode('utf-8')).encode('utf-8')
+            built = hashed_name(name, data)
+            path = os.path.join(target, built)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as stream:
+                stream.write(data)
+            compressed = [None, None]
+            if ext in COMPRESSED:
+                compressed[1] = gzip.compress(data, 9, mtime=0)
+                if brotli is not None:
+                    compressed[0] = brotli.compress(data, quality=11)
+                for (_, suffix), body in zip(ENCODINGS, compressed):
+                    # Only worth keeping if the client downloads less.
+                    if body is not None and len(body) < len(data):
+                        with open(path + suffix, 'wb') as stream:
+                            stream.write(body)
+            manifest[name] = f'{output}/{built}'
+            sizes.append((name, len(original), len(data),
+                          *(len(body) if body is not None else None for body in reversed(compressed))))
+    with open(os.path.join(target, 'manifest.json'), 'w') as stream:
+        json.dump(manifest, stream, indent=1, sort_keys=True)
+
+    keep = {os.path.join(static_folder, path) for path in (*manifest.values(), *previous.values())}
+    for directory, dirs, files in os.walk(target):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            if filename != 'manifest.json' and re.sub(r'\.(gz|br)$', '', path) not in keep:
+                os.unlink(path)
+    return manifest, sizes
+
+
+def read_manifest(directory):
+    try:
+        with open(os.path.join(directory, 'manifest.json')) as stream:
+            return json.load(stream)
+    except FileNotFoundError:
+        return {}
+
+
+class Assets:
+    """Flask extension resolving and serving built assets."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_OUTPUT', 'dist')
+        app.config.setdefault('ASSETS_USE_MANIFEST', not app.debug)
+        app.extensions['assets'] = self.load(app)
+        app.url_defaults(self._hashed_url)
+        app.view_functions['static'] = self.serve
+        app.cli.add_command(assets_cli)
+
+    def load(self, app):
+        """Read the manifest, or return an empty one if nothing has been built."""
+        if not app.config['ASSETS_USE_MANIFEST']:
+            return {}
+        return read_manifest(os.path.join(app.static_folder, app.config['ASSETS_OUTPUT']))
+
+    def _hashed_url(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = current_app.extensions['assets'].get(values['filename'], values['filename'])
+
+    def serve(self, filename):
+        """Static view: built files get precompressed variants and immutable caching."""
+        app = current_app
+        prefix = app.config['ASSETS_OUTPUT'] + '/'
+        if not filename.startswith(prefix) or filename.endswith('manifest.json'):
+            return app.send_static_file(filename)
+        directory = app.static_folder
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + suffix)):
+                response = send_from_directory(directory, filename + suffix, mimetype=_mimetype(filename),
+                                               max_age=0, etag=True)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(directory, filename, max_age=0)
+        response.headers['Cache-Control'] = IMMUTABLE
+        response.vary.add('Accept-Encoding')
+        return response
+
+
+def _mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+
+assets = Assets()
+
+assets_cli = AppGroup('assets', help='Build fingerprinted static assets.')
+
+
+@assets_cli.command('build')
+def build_command():
+    """Minify, fingerprint and precompress everything under static/."""
+    manifest, sizes = build(current_app.static_folder, current_app.config['ASSETS_OUTPUT'])
+    current_app.extensions['assets'] = assets.load(current_app)
+    for name, original, minified, gzipped, brotlied in sizes:
+        compressed = ' '.join(f'{label} {size:,}' for label, size in (('gzip', gzipped), ('br', brotlied))
+                              if size is not None)
+        click.echo(f'{name} -> {manifest[name]}: {original:,} -> {minified:,} bytes {compressed}'.rstrip())
+    if brotli is None:
+        click.echo('brotli is not installed; only gzip variants were written.', err=True)
@@ -0,0 +1,402 @@
+"""Rendered-page cache for the public views.
+
+Views decorated with :meth:`ResponseCache.cached` are stored by path and query
+string. While rendering, a view declares the rows it depends on with
+:meth:`ResponseCache.tag` (``'topics'``, ``'topic:12'``, ``'category:3'`` ...),
+as early as it knows them and at the latest right after reading them.
+Commits that touch ``Category``, ``Topic``, ``Formula`` or ``Example`` bump the
+version of the matching tags, and an entry is served only while every tag it
+was stored under is still at the same version. A tag bumped after the view
+started may have been read before the commit, so such a page is not stored.
+A streamed page is stored once its last chunk has gone out, under the tag
+versions read before its rows were; a commit in between leaves an entry that
+is never served.
+
+Entries also expire ``RESPONSE_CACHE_MAX_AGE`` seconds after they were
+stored, since view counts (and the popular ordering) change without a commit
+through the session.
+
+``RESPONSE_CACHE`` picks the backend: ``memory`` (per-process LRU bounded by
+entry count and bytes), ``filesystem`` (shared by every worker on the host via
+``RESPONSE_CACHE_DIR``) or ``null``. Because a memory cache only sees its own
+worker's commits, it also drops everything when the catalog fingerprint
+changes, checked at most every ``RESPONSE_CACHE_CHECK_INTERVAL`` seconds.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request, session
+from sqlalchemy import inspect
+
+from app.commits import on_commit
+from app.models import Category, Example, Formula, Topic
+from app.queries import content_version
+
+
+class NullCache:
+    def clock(self):
+        return 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, entry):
+        return 0
+
+    def tag_versions(self, tags):
+        return {tag: 0 for tag in tags}
+
+    def invalidate(self, tags):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class MemoryCache:
+    """Thread-safe LRU bounded by entry count and total body size."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.versions = {}
+        # Every invalidation takes the next value, so a tag's version tells
+        # whether it changed after a given clock() reading.
+        self.sequence = 0
+
+    def clock(self):
+        with self.lock:
+            return self.sequence
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Store ``entry``; returns the number of entries evicted to make room."""
+        evicted = 0
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old['body'])
+            self.entries[key] = entry
+            self.size += len(entry['body'])
+            while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+                _, dropped = self.entries.popitem(last=False)
+                self.size -= len(dropped['body'])
+                evicted += 1
+        return evicted
+
+    def tag_versions(self, tags):
+        with self.lock:
+            return {tag: self.versions.get(tag, 0) for tag in tags}
+
+    def invalidate(self, tags):
+        with self.lock:
+            for tag in tags:
+                self.sequence += 1
+                self.versions[tag] = self.sequence
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class FileSystemCache:
+    """Entries and tag versions stored as files, shared by every worker on the host."""
+
+    def __init__(self, directory, max_entries=10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.tag_dir = os.path.join(directory, 'tags')
+        os.makedirs(self.tag_dir, exist_ok=True)
+        self.writes = 0
+
+    def clock(self):
+        return time.time_ns()
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def _tag_path(self, tag):
+        return os.path.join(self.tag_dir, hashlib.sha1(tag.encode()).hexdigest())
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                header, body = f.read().split(b'\n', 1)
+        except (OSError, ValueError):
+            return None
+        entry = json.loads(header)
+        entry['body'] = body
+        return entry
+
+    def set(self, key, entry):
+        header = {k: v for k, v in entry.items() if k != 'body'}
+        self._write(self._path(key), json.dumps(header).encode() + b'\n' + entry['body'])
+        self.writes += 1
+        if self.writes % 100 == 0:
+            return self._prune()
+        return 0
+
+    def _prune(self):
+        files = [
+            entry for entry in os.scandir(self.directory)
+            if entry.is_file() and not entry.name.startswith('.')
+        ]
+        excess = len(files) - self.max_entries
+        if excess <= 0:
+            return 0
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:excess]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+        return excess
+
+    def tag_versions(self, tags):
+        versions = {}
+        for tag in tags:
+            try:
+                with open(self._tag_path(tag)) as f:
+                    versions[tag] = int(f.read() or 0)
+            except (OSError, ValueError):
+                versions[tag] = 0
+        return versions
+
+    def invalidate(self, tags):
+        for tag, version in self.tag_versions(tags).items():
+            # Nanosecond clock rather than +1 so concurrent workers never
+            # write back the same version.
+            self._write(self._tag_path(tag), str(max(version + 1, time.time_ns())).encode())
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.unlink(entry.path)
+
+    def __len__(self):
+        return sum(1 for entry in os.scandir(self.directory) if entry.is_file())
+
+
+class _CacheState:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = Counter()
+        self.version = None
+        self.checked_at = 0.0
+
+
+class ResponseCache:
+    """Flask extension that caches whole rendered responses."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RESPONSE_CACHE', os.getenv('RESPONSE_CACHE', 'memory'))
+        app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+        app.config.setdefault(
+            'RESPONSE_CACHE_DIR',
+            os.getenv('RESPONSE_CACHE_DIR', os.path.join(app.instance_path, 'response-cache'))
+        )
+        app.config.setdefault('RESPONSE_CACHE_CHECK_INTERVAL', 10)
+        app.config.setdefault('RESPONSE_CACHE_MAX_AGE', int(os.getenv('RESPONSE_CACHE_MAX_AGE', 300)))
+
+        kind = app.config['RESPONSE_CACHE']
+        if kind == 'memory':
+            backend = MemoryCache(app.config['RESPONSE_CACHE_MAX_ENTRIES'], app.config['RESPONSE_CACHE_MAX_BYTES'])
+        elif kind == 'filesystem':
+            backend = FileSystemCache(app.config['RESPONSE_CACHE_DIR'], app.config['RESPONSE_CACHE_MAX_ENTRIES'])
+        elif kind in ('null', 'none', ''):
+            backend = NullCache()
+        else:
+            raise ValueError(f'Unknown RESPONSE_CACHE {kind!r}')
+        app.extensions['response_cache'] = _CacheState(backend)
+
+    def _state(self):
+        return current_app.extensions['response_cache']
+
+    def tag(self, *tags, **meta):
+        """Declare what the response being rendered depends on.
+
+        ``meta`` is stored with the entry and handed to the ``on_hit`` callback.
+        """
+        if 'cache_tags' in g:
+            versions = self._state().backend.tag_versions(tags)
+            if any(version > g.cache_started for version in versions.values()):
+                # Changed since the view started, perhaps after its rows were read.
+                g.cache_stale = True
+            g.cache_tags.update(versions)
+            g.cache_meta.update(meta)
+
+    def skip(self):
+        """Keep the response being rendered out of the cache, e.g. one built from stand-in data."""
+        if 'cache_tags' in g:
+            g.cache_stale = True
+
+    def invalidate(self, *tags):
+        state = self._state()
+        state.backend.invalidate(tags)
+        state.stats['invalidations'] += len(tags)
+
+    def clear(self):
+        self._state().backend.clear()
+
+    def stats(self):
+        state = self._state()
+        lookups = state.stats['hits'] + state.stats['misses']
+        return {
+            'backend': current_app.config['RESPONSE_CACHE'],
+            'entries': len(state.backend),
+            'hits': state.stats['hits'],
+            'misses': state.stats['misses'],
+            'stores': state.stats['stores'],
+            'evictions': state.stats['evictions'],
+            'invalidations': state.stats['invalidations'],
+            'hit_ratio': round(state.stats['hits'] / lookups, 4) if lookups else 0.0,
+        }
+
+    def _check_version(self, state):
+        # Only a per-process cache can miss another worker's commits.
+        if not isinstance(state.backend, MemoryCache):
+            return
+        now = time.monotonic()
+        if now - state.checked_at < current_app.config['RESPONSE_CACHE_CHECK_INTERVAL']:
+            return
+        version = content_version()
+        if state.version is not None and version != state.version:
+            state.backend.clear()
+        state.version = version
+        state.checked_at = now
+
+    def _lookup(self, state, key):
+        entry = state.backend.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.get('stored_at', 0) > current_app.config['RESPONSE_CACHE_MAX_AGE']:
+            return None
+        if state.backend.tag_versions(entry['tags']) != entry['tags']:
+            return None
+        return entry
+
+    def cached(self, on_hit=None):
+        """Cache successful GET responses of the decorated view."""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                state = self._state()
+                if request.method not in ('GET', 'HEAD') or isinstance(state.backend, NullCache):
+                    return view(*args, **kwargs)
+                if '_flashes' in session:
+                    # The page would be stored with someone's flash messages.
+                    return view(*args, **kwargs)
+
+                self._check_version(state)
+                key = request.full_path
+                entry = self._lookup(state, key)
+                if entry is not None:
+                    state.stats['hits'] += 1
+                    if on_hit is not None:
+                        on_hit(entry['meta'])
+                    response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                state.stats['misses'] += 1
+                g.cache_started = state.backend.clock()
+                g.cache_stale = False
+                g.cache_tags = {}
+                g.cache_meta = {}
+                response = current_app.make_response(view(*args, **kwargs))
+                response.headers['X-Cache'] = 'MISS'
+                if response.status_code == 200 and g.cache_tags and not g.cache_stale:
+                    entry = {
+                        'mimetype': response.mimetype,
+                        'tags': g.cache_tags,
+                        'meta': g.cache_meta,
+                        'stored_at': time.time(),
+                    }
+                    if response.is_streamed:
+                        response.response = _tee(response.response, state, key, entry)
+                    else:
+                        entry['body'] = response.get_data()
+                        _store(state, key, entry)
+                return response
+            return wrapper
+        return decorator
+
+
+response_cache = ResponseCache()
+
+
+def _store(state, key, entry):
+    state.stats['evictions'] += state.backend.set(key, entry)
+    state.stats['stores'] += 1
+
+
+def _tee(chunks, state, key, entry):
+    """Pass a streamed body through, storing it once all of it has been sent.
+
+    A body cut short (the client went away, the template raised) is not stored.
+    """
+    body = []
+    try:
+        for chunk in chunks:
+            body.append(chunk if isinstance(chunk, bytes) else chunk.encode())
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    entry['body'] = b''.join(body)
+    _store(state, key, entry)
+
+
+def _tags_for(session):
+    tags = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Category):
+            tags.update(('categories', f'category:{obj.id}'))
+        elif isinstance(obj, Topic):
+            tags.update(('topics', f'topic:{obj.id}', f'category:{obj.category_id}'))
+            history = inspect(obj).attrs.category_id.history
+            tags.update(f'category:{old}' for old in history.deleted or ())
+        elif isinstance(obj, (Formula, Example)):
+            tags.add(f'topic:{obj.topic_id}')
+    return tags
+
+
+def _invalidate(noticed):
+    if 'response_cache' in current_app.extensions:
+        response_cache.invalidate(*set().union(*noticed))
+
+
+on_commit('response_cache', lambda session: _tags_for(session) or None, _invalidate)
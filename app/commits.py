@@ -0,0 +1,51 @@
+"""Run code once a session's changes are committed.
+
+Several extensions keep something derived from the catalog (the response
+cache's tag versions, the recommendation snapshot, the suggestion index,
+replica stickiness) and must only act on writes that are committed: a flush
+can still be rolled back. Each registers with :func:`on_commit` instead of
+keeping its own ``after_flush`` / ``after_commit`` / ``after_soft_rollback``
+trio. What a watcher notices at each flush is kept in ``session.info`` and
+handed to it after the commit, in an app context; a rollback drops it.
+
+The listeners are on Flask-SQLAlchemy's session class rather than
+``db.session``, so modules imported before ``db`` exists can register.
+"""
+from flask import has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+_watchers = {}
+
+
+def on_commit(name, notice, apply):
+    """Register a watcher under ``name``.
+
+    ``notice(session)`` runs after every flush and returns what it found in
+    ``session.new``, ``dirty`` and ``deleted``, or None if nothing concerns it.
+    Once the transaction commits, ``apply(noticed)`` is called with the list
+    of those values, oldest first.
+    """
+    _watchers[name] = (notice, apply)
+
+
+@event.listens_for(Session, 'after_flush')
+def _notice(session, flush_context):
+    for name, (notice, _) in _watchers.items():
+        value = notice(session)
+        if value is not None:
+            session.info.setdefault('commit_watchers', {}).setdefault(name, []).append(value)
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply(session):
+    noticed = session.info.pop('commit_watchers', None)
+    if not noticed or not has_app_context():
+        return
+    for name, values in noticed.items():
+        _watchers[name][1](values)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard(session, previous_transaction):
+    session.info.pop('commit_watchers', None)
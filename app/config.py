@@ -0,0 +1,136 @@
+"""Configuration profiles and database engine tuning.
+
+``APP_PROFILE`` (falling back to ``FLASK_ENV``) picks one of ``PROFILES``:
+``development``, ``production`` or ``testing``. A profile holds the base
+settings; :func:`engine_options` then sizes the connection pool for the
+database in use.
+
+PostgreSQL (Cloud SQL) connections are a shared budget: every gunicorn
+worker has its own pool, so ``DB_MAX_CONNECTIONS`` (what the instance allows
+this service, minus headroom for migrations and admin sessions) is divided
+by ``WEB_CONCURRENCY`` workers. Each worker keeps one connection per thread
+and may burst into the rest of its share. Connections are recycled before
+Cloud SQL's proxy drops idle ones and pinged on checkout.
+
+SQLite gets no pool tuning; instead every new connection is switched to WAL
+(readers no longer block the writer), ``synchronous=NORMAL`` (safe under
+WAL, one fsync per checkpoint instead of per commit), a busy timeout so
+concurrent writers wait instead of failing with "database is locked", and
+memory-mapped reads.
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, '') else default
+
+
+class Config:
+    DEBUG = False
+    TESTING = False
+    LOG_LEVEL = 'INFO'
+    # Run db.create_all() at startup; production leaves the schema to migrations.
+    AUTO_CREATE_SCHEMA = True
+
+    # Connections this service may hold on the database server in total.
+    DB_MAX_CONNECTIONS = 20
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_TIMEOUT = 30
+    DB_POOL_PRE_PING = True
+
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+    }
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    DB_MAX_CONNECTIONS = 5
+
+
+class ProductionConfig(Config):
+    AUTO_CREATE_SCHEMA = os.getenv('AUTO_CREATE_SCHEMA') == '1'
+    DB_MAX_CONNECTIONS = 80
+    # Cloud SQL's proxy closes connections idle for ten minutes.
+    DB_POOL_RECYCLE = 540
+
+
+class TestingConfig(Config):
+    TESTING = True
+    LOG_LEVEL = 'WARNING'
+    DB_MAX_CONNECTIONS = 5
+
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def profile_name(name=None):
+    name = name or os.getenv('APP_PROFILE') or os.getenv('FLASK_ENV') or 'development'
+    if name not in PROFILES:
+        raise ValueError(f'Unknown APP_PROFILE {name!r}; expected one of {", ".join(PROFILES)}')
+    return name
+
+
+def worker_shape():
+    """Gunicorn worker processes and threads per worker this process runs with."""
+    return max(_env_int('WEB_CONCURRENCY', 1), 1), max(_env_int('WEB_THREADS', 1), 1)
+
+
+def engine_options(database_url, config):
+    """``SQLALCHEMY_ENGINE_OPTIONS`` for ``database_url`` under ``config``.
+
+    ``DB_MAX_CONNECTIONS``, ``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``,
+    ``DB_POOL_RECYCLE`` and ``DB_POOL_TIMEOUT`` in the environment override
+    the profile and computed values.
+    """
+    if make_url(database_url).get_backend_name() == 'sqlite':
+        return {}
+    workers, threads = worker_shape()
+    share = max(_env_int('DB_MAX_CONNECTIONS', config['DB_MAX_CONNECTIONS']) // workers, 1)
+    pool_size = _env_int('DB_POOL_SIZE', min(threads, share))
+    return {
+        'pool_size': pool_size,
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', max(share - pool_size, 0)),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', config['DB_POOL_RECYCLE']),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', config['DB_POOL_TIMEOUT']),
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run ``PRAGMA name=value`` for each of ``pragmas`` on every new connection."""
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def describe_engine(engine, options):
+    """One line summarising the effective engine settings, without credentials."""
+    url = engine.url.render_as_string(hide_password=True)
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            settings = {
+                name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size')
+            }
+    else:
+        workers, threads = worker_shape()
+        settings = {**options, 'workers': workers, 'threads': threads}
+    return f'Database {url}: ' + ' '.join(f'{name}={value}' for name, value in settings.items())
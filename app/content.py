@@ -0,0 +1,291 @@
+"""Write-time processing of topic content.
+
+Topic bodies are written as HTML by admins. Whenever a topic's content or
+description changes, the body is sanitized against an allowlist, its headings
+get stable ids and are collected into a table of contents, and the card
+excerpt and reading time are computed. The results are stored on the topic
+(``content_html``, ``toc``, ``excerpt``, ``reading_time``, ``has_tex``), so
+rendering a page is a plain column read.
+"""
+import os
+import re
+import sys
+import time
+from contextlib import ExitStack
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Topic
+
+ALLOWED_TAGS = frozenset(
+    'a abbr b blockquote br caption code dd div dl dt em figcaption figure h1 h2 h3 h4 h5 h6 '
+    'hr i img kbd li ol p pre s small span strong sub sup table tbody td tfoot th thead tr u ul'.split()
+)
+VOID_TAGS = frozenset(('br', 'hr', 'img'))
+# Elements removed together with everything inside them.
+DROP_CONTENT_TAGS = frozenset(('script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript'))
+ALLOWED_ATTRIBUTES = {
+    '*': frozenset(('class', 'id', 'title')),
+    'a': frozenset(('href',)),
+    'img': frozenset(('src', 'alt', 'width', 'height')),
+    'td': frozenset(('colspan', 'rowspan')),
+    'th': frozenset(('colspan', 'rowspan', 'scope')),
+    'ol': frozenset(('start',)),
+}
+URL_ATTRIBUTES = frozenset(('href', 'src'))
+ALLOWED_SCHEMES = frozenset(('', 'http', 'https', 'mailto'))
+TOC_LEVELS = ('h2', 'h3', 'h4')
+
+EXCERPT_LENGTH = 100
+WORDS_PER_MINUTE = 200
+
+
+def slugify(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-') or 'section'
+
+
+def has_tex(text):
+    """Whether ``text`` contains TeX delimiters only the browser can typeset."""
+    return bool(text) and any(mark in text for mark in ('\\(', '\\[', '$$'))
+
+
+class _Sanitizer(HTMLParser):
+    """Rebuilds an HTML fragment keeping only allowlisted tags and attributes."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open = []
+        self.dropping = 0
+        self.text = []
+        self.toc = []
+        self.ids = set()
+        self.heading = None
+
+    def _attributes(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag, frozenset())
+        kept = {}
+        for name, value in attrs:
+            name = name.lower()
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and urlsplit(value.strip()).scheme.lower() not in ALLOWED_SCHEMES:
+                continue
+            kept[name] = value
+        if tag == 'a' and 'href' in kept:
+            kept['rel'] = 'noopener nofollow'
+        return kept
+
+    @staticmethod
+    def _start(tag, attributes):
+        rendered = ''.join(f' {name}="{escape(value)}"' for name, value in attributes.items())
+        return f'<{tag}{rendered}>'
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        attributes = self._attributes(tag, attrs)
+        if tag in TOC_LEVELS and self.heading is None:
+            # The id is assigned when the heading closes and its text is known.
+            self.heading = (tag, len(self.out), attributes, [])
+            self.out.append(None)
+            self.open.append(tag)
+            return
+        self.out.append(self._start(tag, attributes))
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        while self.open:
+            current = self.open.pop()
+            self.out.append(f'</{current}>')
+            if self.heading is not None and current == self.heading[0]:
+                self._finish_heading()
+            if current == tag:
+                break
+
+    def _finish_heading(self):
+        tag, position, attributes, words = self.heading
+        self.heading = None
+        title = ' '.join(' '.join(words).split())
+        anchor = attributes.get('id') or slugify(title)
+        base, n = anchor, 2
+        while anchor in self.ids:
+            anchor, n = f'{base}-{n}', n + 1
+        self.ids.add(anchor)
+        attributes['id'] = anchor
+        self.out[position] = self._start(tag, attributes)
+        if title:
+            self.toc.append({'level': int(tag[1]), 'id': anchor, 'title': title})
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.out.append(escape(data, quote=False))
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading[3].append(data)
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.handle_endtag(self.open[-1])
+
+
+def sanitize(html):
+    """Return ``(safe_html, toc, text)`` for an HTML fragment."""
+    parser = _Sanitizer()
+    parser.feed(html or '')
+    parser.close()
+    return ''.join(parser.out), parser.toc, ' '.join(' '.join(parser.text).split())
+
+
+def excerpt(text, length=EXCERPT_LENGTH):
+    text = ' '.join((text or '').split())
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(' ', 1)[0].rstrip(' ,.;:')
+    return f'{cut}…'
+
+
+def reading_time(text):
+    """Whole minutes to read ``text``, at least one."""
+    return max(1, round(len(text.split()) / WORDS_PER_MINUTE))
+
+
+def process(content, description=None):
+    """Derived column values for a topic's content and description."""
+    html, toc, text = sanitize(content)
+    return {
+        'content_html': html,
+        'toc': toc,
+        'excerpt': excerpt(description or text),
+        'reading_time': reading_time(text),
+        'has_tex': has_tex(text),
+    }
+
+
+def apply(topic):
+    for name, value in process(topic.content, topic.description).items():
+        setattr(topic, name, value)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _process_topics(session, flush_context, instances):
+    for obj in session.new | session.dirty:
+        if not isinstance(obj, Topic):
+            continue
+        state = inspect(obj)
+        if obj in session.new or any(
+            state.attrs[name].history.has_changes() for name in ('content', 'description')
+        ):
+            apply(obj)
+
+
+content_cli = AppGroup('content', help='Manage topic content.')
+
+
+@content_cli.command('process')
+@click.option('--batch-size', default=500, show_default=True)
+def process_command(batch_size):
+    """Recompute sanitized HTML, contents, excerpts and reading times."""
+    count, last_id = 0, 0
+    while True:
+        topics = db.session.scalars(
+            select(Topic).where(Topic.id > last_id).order_by(Topic.id).limit(batch_size)
+        ).all()
+        if not topics:
+            break
+        for topic in topics:
+            apply(topic)
+        db.session.commit()
+        count += len(topics)
+        last_id = topics[-1].id
+    click.echo(f'Processed {count} topics.')
+
+
+@content_cli.command('import')
+@click.argument('source')
+@click.option('--batch-size', default=5000, show_default=True, help='Rows written per transaction.')
+@click.option('--render/--no-render', default=True, show_default=True,
+              help='Render formulas to MathML while importing.')
+def import_command(source, batch_size, render):
+    """Load categories, topics, formulas and examples.
+
+    SOURCE is a JSON Lines file ('-' for stdin) or a directory of CSV files.
+    """
+    from app.cache import response_cache
+    from app.search import search_index
+    from app.transfer import Importer, read_csv, read_jsonl
+
+    def progress(importer):
+        counts = ', '.join(f'{count} {kind}' for kind, count in importer.counts.items())
+        click.echo(f'{counts} ({importer.rate:,.0f} rows/s)', err=True)
+
+    importer = Importer(db.engine, batch_size=batch_size, render=render, progress=progress)
+    try:
+        with ExitStack() as stack:
+            if os.path.isdir(source):
+                records = read_csv(source)
+            elif source == '-':
+                records = read_jsonl(sys.stdin)
+            else:
+                records = read_jsonl(stack.enter_context(open(source, encoding='utf-8')))
+            for kind, record in records:
+                importer.add(kind, record)
+            counts = importer.finish()
+    except (OSError, ValueError, IntegrityError) as exc:
+        raise click.ClickException(
+            f'{exc} (batches already written were kept: {sum(importer.counts.values())} rows)'
+        )
+    elapsed, rate = time.perf_counter() - importer.started, importer.rate
+    # Rows were written outside the session, so nothing has seen them yet.
+    search_index.rebuild()
+    response_cache.clear()
+    click.echo(f'Imported {sum(counts.values())} rows in {elapsed:.1f}s ({rate:,.0f} rows/s).')
+
+
+@content_cli.command('export')
+@click.argument('destination')
+@click.option('--format', 'fmt', type=click.Choice(['jsonl', 'csv']), default=None,
+              help='Defaults to csv when DESTINATION is a directory or has no extension.')
+def export_command(destination, fmt):
+    """Dump the catalog to a JSON Lines file ('-' for stdout) or a directory of CSV files."""
+    from app.transfer import export_records, write_csv, write_jsonl
+
+    if fmt is None:
+        fmt = 'jsonl' if destination == '-' or os.path.splitext(destination)[1] else 'csv'
+    started = time.perf_counter()
+    with db.engine.connect() as connection:
+        records = export_records(connection)
+        if fmt == 'csv':
+            count = write_csv(records, destination)
+        elif destination == '-':
+            count = write_jsonl(records, sys.stdout)
+        else:
+            with open(destination, 'w', encoding='utf-8') as stream:
+                count = write_jsonl(records, stream)
+    elapsed = time.perf_counter() - started
+    click.echo(f'Exported {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s).', err=True)
@@ -0,0 +1,218 @@
+"""Production diagnostics: a slow-query log and an on-demand profiler.
+
+Both are off unless configured, and neither needs a redeploy to use once it is.
+
+``SLOW_QUERY_MS`` above zero logs every SQL statement that takes longer, at
+WARNING on the ``app.diagnostics`` logger, with the statement text, the shape
+of its parameters (types and counts, never the values, which may be user
+input) and the request it ran for. The most recent ``SLOW_QUERY_KEEP`` are
+also kept in memory per worker.
+
+``DIAGNOSTICS_TOKEN`` registers two endpoints that need an
+``Authorization: Bearer <token>`` header:
+
+* ``/admin/diagnostics/slow-queries``: this worker's recent slow queries as JSON;
+* ``/admin/diagnostics/profile?seconds=10&interval_ms=5``: samples the stack of
+  every other thread in the worker that answers, for ``seconds``, and returns
+  the counts in the collapsed-stack format that ``flamegraph.pl``,
+  speedscope and similar tools read (``thread;outer;...;inner count``).
+
+The profiler only looks at Python stacks at an interval, so the worker keeps
+serving at close to full speed. The request that asks for a profile occupies
+a thread for its duration, so the worker must serve requests concurrently:
+gunicorn with ``WEB_THREADS`` above 1, or the ASGI mode.
+"""
+import hmac
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Blueprint, Response, abort, current_app, has_app_context, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('diagnostics', __name__, url_prefix='/admin/diagnostics')
+
+MAX_STATEMENT = 2000
+_listening = False
+
+
+def parameter_shape(parameters, executemany=False):
+    """Describe statement parameters by type, e.g. ``(int, str × 3)``."""
+    if executemany and isinstance(parameters, (list, tuple)) and parameters:
+        return f'{len(parameters)} × {parameter_shape(parameters[0])}'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        runs = []
+        for value in parameters:
+            name = type(value).__name__
+            if runs and runs[-1][0] == name:
+                runs[-1][1] += 1
+            else:
+                runs.append([name, 1])
+        return '(' + ', '.join(name if count == 1 else f'{name} × {count}' for name, count in runs) + ')'
+    return type(parameters).__name__
+
+
+def _origin():
+    if not has_request_context():
+        return {'thread': threading.current_thread().name}
+    endpoint = request.url_rule.endpoint if request.url_rule else None
+    return {'method': request.method, 'path': request.path, 'endpoint': endpoint}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._diagnostics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_app_context():
+        return
+    threshold = current_app.config.get('SLOW_QUERY_MS', 0)
+    elapsed = (time.perf_counter() - context._diagnostics_started) * 1000
+    if threshold <= 0 or elapsed < threshold:
+        return
+    text = re.sub(r'\s+', ' ', statement).strip()
+    entry = {
+        'at': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+        'duration_ms': round(elapsed, 2),
+        'statement': text[:MAX_STATEMENT],
+        'parameters': parameter_shape(parameters, executemany),
+        'database': conn.engine.url.render_as_string(hide_password=True),
+        **_origin(),
+    }
+    state = current_app.extensions.get('diagnostics')
+    if state is not None:
+        state.slow_queries.append(entry)
+    where = entry.get('endpoint') or entry.get('path') or entry.get('thread')
+    logger.warning('Slow query %.1fms on %s: %s %s', elapsed, where, entry['statement'], entry['parameters'])
+
+
+def _listen():
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+class _DiagnosticsState:
+    def __init__(self, keep):
+        self.slow_queries = deque(maxlen=keep)
+        self.profiling = threading.Lock()
+
+
+class Diagnostics:
+    """Flask extension for the slow-query log and the profiling endpoint."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', float(os.getenv('SLOW_QUERY_MS', 0)))
+        app.config.setdefault('SLOW_QUERY_KEEP', 100)
+        app.config.setdefault('DIAGNOSTICS_TOKEN', os.getenv('DIAGNOSTICS_TOKEN') or None)
+        app.config.setdefault('PROFILE_MAX_SECONDS', 60)
+        app.extensions['diagnostics'] = _DiagnosticsState(app.config['SLOW_QUERY_KEEP'])
+        if app.config['SLOW_QUERY_MS'] > 0:
+            _listen()
+        if app.config['DIAGNOSTICS_TOKEN']:
+            app.register_blueprint(bp)
+
+
+_labels = {}
+
+
+def _frame_label(code):
+    label = _labels.get(code)
+    if label is None:
+        filename = code.co_filename
+        # Shortest path relative to an import root: 'app/queries.py', 'flask/app.py'.
+        for root in sorted((p for p in sys.path if p), key=len, reverse=True):
+            if filename.startswith(root + os.sep):
+                filename = filename[len(root) + 1:]
+                break
+        label = _labels[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'.replace(';', ':')
+    return label
+
+
+def sample_stacks(seconds, interval, exclude=()):
+    """Sample every thread's stack for ``seconds``; returns collapsed counts and the sample count."""
+    stacks = Counter()
+    samples = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in exclude:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            frames.append(names.get(ident, f'thread-{ident}').replace(';', ':').replace(' ', '_'))
+            stacks[';'.join(reversed(frames))] += 1
+        samples += 1
+        time.sleep(interval)
+    return stacks, samples
+
+
+def collapsed(stacks):
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
+
+
+def token_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        expected = current_app.config['DIAGNOSTICS_TOKEN']
+        header = request.headers.get('Authorization', '')
+        scheme, _, token = header.partition(' ')
+        if not expected or scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), expected.encode()):
+            abort(401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@bp.route('/slow-queries')
+@token_required
+def slow_queries():
+    entries = list(current_app.extensions['diagnostics'].slow_queries)
+    return jsonify(pid=os.getpid(), threshold_ms=current_app.config['SLOW_QUERY_MS'], queries=entries[::-1])
+
+
+@bp.route('/profile')
+@token_required
+def profile():
+    seconds = request.args.get('seconds', 10, type=float)
+    interval = request.args.get('interval_ms', 5, type=float)
+    if not 0 < seconds <= current_app.config['PROFILE_MAX_SECONDS']:
+        abort(400, f'seconds must be between 0 and {current_app.config["PROFILE_MAX_SECONDS"]}')
+    if not request.environ.get('wsgi.multithread'):
+        abort(409, 'This worker serves one request at a time, so it would only profile itself; '
+                   'run with WEB_THREADS above 1 or in the ASGI mode.')
+    lock = current_app.extensions['diagnostics'].profiling
+    if not lock.acquire(blocking=False):
+        abort(409, 'This worker is already being profiled.')
+    try:
+        stacks, samples = sample_stacks(seconds, max(interval, 1) / 1000, exclude={threading.get_ident()})
+    finally:
+        lock.release()
+    response = Response(collapsed(stacks), mimetype='text/plain')
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    response.headers['Content-Disposition'] = f'attachment; filename="profile-{os.getpid()}-{stamp}.collapsed"'
+    response.headers['X-Profile-Samples'] = str(samples)
+    response.cache_control.no_store = True
+    return response
+
+
+diagnostics = Diagnostics()
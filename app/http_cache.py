@@ -0,0 +1,76 @@
+"""Conditional GET support for the public pages.
+
+Views decorated with :meth:`HTTPCache.conditional` get an ``ETag``, a
+``Cache-Control`` header and, where one date covers every change to the page,
+``Last-Modified``. Listing pages have none: deleting a topic leaves every
+remaining timestamp where it was. The validators come
+from a cheap aggregate query run before the view, so a request whose
+``If-None-Match`` or ``If-Modified-Since`` still matches is answered with
+``304 Not Modified`` without loading the page's rows or rendering anything.
+
+View counts are left out of the validators (a page view would otherwise change
+the page it is viewing), which makes the ETags weak: two responses with the
+same tag are equivalent, not byte-identical.
+"""
+import hashlib
+import os
+from collections import namedtuple
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from werkzeug.http import is_resource_modified
+
+Validators = namedtuple('Validators', 'etag last_modified meta')
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+class HTTPCache:
+    """Flask extension adding validators and Cache-Control to page responses."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('HTTP_CACHE_MAX_AGE', int(os.getenv('HTTP_CACHE_MAX_AGE', 60)))
+
+    def conditional(self, validators, on_not_modified=None):
+        """Answer matching conditional GETs with 304 before calling the view.
+
+        ``validators`` is called with the view's arguments and returns a
+        :class:`Validators`, or None to let the view handle the request (for
+        example to raise a 404). ``on_not_modified`` receives its ``meta``.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pending flash messages are rendered into the page, so it
+                # must be built even if the client holds a current copy.
+                if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                    return view(*args, **kwargs)
+                current = validators(*args, **kwargs)
+                if current is None:
+                    return view(*args, **kwargs)
+
+                if is_resource_modified(request.environ, current.etag, last_modified=current.last_modified):
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                else:
+                    if on_not_modified is not None:
+                        on_not_modified(current.meta)
+                    response = current_app.response_class(status=304)
+                response.set_etag(current.etag, weak=True)
+                if current.last_modified is not None:
+                    response.last_modified = current.last_modified
+                response.cache_control.public = True
+                response.cache_control.max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+                return response
+            return wrapper
+        return decorator
+
+
+http_cache = HTTPCache()
@@ -0,0 +1,275 @@
+"""Server-side rendering of formula LaTeX to MathML.
+
+Formulas are converted with ``latex2mathml`` (pure Python, no network) when
+they are written, and the markup is stored in ``rendered_math`` under a hash
+of the renderer version and the LaTeX source, so identical sources share one
+row and a renderer upgrade simply misses and re-renders. The converter copies
+``\\text{}`` arguments through unescaped, so its output is checked against a
+MathML allowlist and anything that fails is left to MathJax. Pages only read
+the table: a source missing from it (written by raw SQL, or imported with
+``--no-render``) is rendered in the reading process and kept in its LRU, and
+``flask math render`` stores it for every worker. Pages embed the MathML
+directly; browsers display it natively, and MathJax is only loaded for pages
+with something the server could not render.
+
+``MATH_RENDERER=client`` (or ``latex2mathml`` not being installed) keeps the
+old behaviour of typesetting everything in the browser.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from html import escape
+from html.parser import HTMLParser
+from importlib.metadata import PackageNotFoundError, version
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from markupsafe import Markup
+from sqlalchemy import event, select
+
+from app import db
+from app.content import DROP_CONTENT_TAGS
+from app.models import Formula, RenderedMath
+
+try:
+    RENDERER = f"latex2mathml-{version('latex2mathml')}"
+except PackageNotFoundError:
+    RENDERER = None
+
+# Marks a cached source the renderer rejected.
+FAILED = ''
+
+
+# Bumped whenever the markup derived from a source changes, so rows stored
+# by an earlier version (say, before sanitizing) are no longer looked up.
+MARKUP_VERSION = 2
+
+MATHML_TAGS = frozenset(
+    'math semantics annotation mrow mi mn mo ms mtext mspace mglyph msub msup msubsup munder mover '
+    'munderover mmultiscripts mprescripts none mfrac msqrt mroot mstyle merror mpadded mphantom '
+    'menclose mtable mtr mlabeledtr mtd maligngroup malignmark'.split()
+)
+# Presentation attributes only: no href, style, event handlers or xlink.
+MATHML_ATTRIBUTES = frozenset(
+    'accent accentunder align close columnalign columnlines columnspacing columnspan depth display '
+    'displaystyle encoding fence form frame height largeop linethickness lspace mathbackground '
+    'mathcolor mathsize mathvariant maxsize minsize movablelimits notation open rowalign rowlines '
+    'rowspacing rowspan rspace scriptlevel separator separators stretchy symmetric width'.split()
+)
+MATHML_NAMESPACE = 'http://www.w3.org/1998/Math/MathML'
+
+
+def math_key(latex):
+    return hashlib.sha256(f'{RENDERER}\0{MARKUP_VERSION}\0{latex}'.encode()).hexdigest()
+
+
+class _MathSanitizer(HTMLParser):
+    """Rebuilds converter output keeping only MathML presentation markup.
+
+    latex2mathml copies ``\\text{}`` and friends into the markup verbatim, so
+    a formula can otherwise smuggle in ``<script>`` or an ``href``. Anything
+    dropped sets ``rejected``.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open = []
+        self.dropping = 0
+        self.rejected = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.rejected = True
+            self.dropping += 1
+            return
+        if self.dropping or tag not in MATHML_TAGS:
+            self.rejected = True
+            return
+        if tag == 'math':
+            attrs = [(name, value) for name, value in attrs if (name, value) != ('xmlns', MATHML_NAMESPACE)]
+        kept = [(name, value) for name, value in attrs if name in MATHML_ATTRIBUTES and value is not None]
+        self.rejected |= len(kept) != len(attrs)
+        if tag == 'math':
+            kept.insert(0, ('xmlns', MATHML_NAMESPACE))
+        self.out.append(f'<{tag}' + ''.join(f' {name}="{escape(value)}"' for name, value in kept) + '>')
+        self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag in MATHML_TAGS and not self.dropping:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        while self.open:
+            current = self.open.pop()
+            self.out.append(f'</{current}>')
+            if current == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            self.rejected = True
+        else:
+            self.out.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.handle_endtag(self.open[-1])
+
+
+def sanitize_mathml(markup):
+    """``markup`` rebuilt from allowlisted MathML, or None if anything had to be dropped."""
+    parser = _MathSanitizer()
+    parser.feed(markup)
+    parser.close()
+    return None if parser.rejected else ''.join(parser.out)
+
+
+def render_latex(latex):
+    """Render ``latex`` to sanitized block MathML, or return None if it cannot be converted.
+
+    Output the sanitizer had to cut (markup in ``\\text{}``, say) is left to
+    MathJax too, which typesets the escaped source faithfully.
+    """
+    # Imported on first use rather than at startup; it is slow to import.
+    from latex2mathml.converter import convert
+
+    try:
+        return sanitize_mathml(convert(latex, display='block'))
+    except Exception:
+        return None
+
+
+def store(connection, rows):
+    """Insert rendered rows, leaving existing keys alone."""
+    if not rows:
+        return
+    table = RenderedMath.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        from sqlalchemy.dialects import postgresql, sqlite
+
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert
+        connection.execute(insert(table).on_conflict_do_nothing(index_elements=['key']), rows)
+        return
+    existing = set(connection.scalars(select(table.c.key).where(table.c.key.in_([r['key'] for r in rows]))))
+    missing = [row for row in rows if row['key'] not in existing]
+    if missing:
+        connection.execute(table.insert(), missing)
+
+
+class _MathState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+
+
+class MathRenderer:
+    """Flask extension turning formula LaTeX into inline MathML."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('MATH_RENDERER', os.getenv('MATH_RENDERER', 'mathml'))
+        app.config.setdefault('MATH_CACHE_SIZE', 4096)
+        app.extensions['math'] = _MathState()
+        app.cli.add_command(math_cli)
+
+    @property
+    def enabled(self):
+        return RENDERER is not None and current_app.config['MATH_RENDERER'] == 'mathml'
+
+    def _remember(self, state, key, html):
+        with state.lock:
+            state.cache[key] = html
+            state.cache.move_to_end(key)
+            while len(state.cache) > current_app.config['MATH_CACHE_SIZE']:
+                state.cache.popitem(last=False)
+
+    def render_many(self, sources):
+        """Map each LaTeX source to Markup, or to None where the browser must typeset it.
+
+        Rendering is a pure function of the source, so results are kept in a
+        per-process LRU; misses are read from ``rendered_math`` in one query
+        and anything still missing is rendered here. Nothing is written: this
+        runs on GETs, which may be on a read replica or the event loop.
+        """
+        if not self.enabled:
+            return {latex: None for latex in sources}
+        state = current_app.extensions['math']
+        keys = {latex: math_key(latex) for latex in set(sources)}
+        found = {}
+        with state.lock:
+            for latex, key in keys.items():
+                if key in state.cache:
+                    state.cache.move_to_end(key)
+                    found[latex] = state.cache[key]
+        missing = {keys[latex]: latex for latex in keys if latex not in found}
+        if missing:
+            rows = db.session.execute(
+                select(RenderedMath.key, RenderedMath.html).where(RenderedMath.key.in_(list(missing)))
+            )
+            for key, html in rows:
+                found[missing.pop(key)] = html
+                self._remember(state, key, html)
+            for key, latex in missing.items():
+                html = render_latex(latex)
+                found[latex] = html or FAILED
+                self._remember(state, key, html or FAILED)
+        return {latex: Markup(html) if html else None for latex, html in found.items()}
+
+    def render_formulas(self, connection, sources):
+        """Render and store ``sources`` on ``connection`` (write path)."""
+        if not self.enabled:
+            return 0
+        state = current_app.extensions['math']
+        rows = []
+        for latex in set(sources):
+            key = math_key(latex)
+            html = render_latex(latex)
+            self._remember(state, key, html or FAILED)
+            if html:
+                rows.append({'key': key, 'renderer': RENDERER, 'html': html})
+        store(connection, rows)
+        return len(rows)
+
+
+math_renderer = MathRenderer()
+
+math_cli = AppGroup('math', help='Manage server-rendered formulas.')
+
+
+@math_cli.command('render')
+def render_command():
+    """Render and store markup for every distinct formula."""
+    if not math_renderer.enabled:
+        raise click.ClickException('Server-side rendering is disabled or latex2mathml is not installed.')
+    sources = db.session.scalars(select(Formula.latex).distinct()).all()
+    with db.engine.begin() as connection:
+        count = math_renderer.render_formulas(connection, sources)
+    click.echo(f'Rendered {count} of {len(sources)} formulas with {RENDERER}.')
+
+
+@event.listens_for(db.session, 'after_flush')
+def _render_written(session, flush_context):
+    if not (has_app_context() and 'math' in current_app.extensions):
+        return
+    sources = [
+        obj.latex for obj in session.new | session.dirty
+        if isinstance(obj, Formula) and obj.latex
+    ]
+    if sources:
+        math_renderer.render_formulas(session.connection(), sources)
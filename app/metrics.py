@@ -0,0 +1,244 @@
+"""Per-request timing: a ``Server-Timing`` header and Prometheus metrics.
+
+For every request the app serves, :class:`Metrics` measures the SQL
+statements sent (count and time between ``before_cursor_execute`` and
+``after_cursor_execute``, on the primary and the replicas alike), the time
+spent rendering Jinja templates and the time from the first ``before_request``
+hook to the last ``after_request`` hook. The numbers go out with the response::
+
+    Server-Timing: db;dur=3.1;desc="4 queries", render;dur=5.2, app;dur=9.8
+
+and into per-endpoint histograms served in the Prometheus text format at
+``/metrics``. For a streamed page (see :mod:`app.streaming`) the header can
+only cover the work done before the first byte; the histograms get the whole
+request, body included. Histograms are kept per process, so with several
+gunicorn workers each scrape sees the worker that answered it; scrape the
+workers individually or read them as a sample.
+
+``METRICS_ENABLED=0`` registers nothing at all: no hooks, no SQLAlchemy event
+listeners and no ``/metrics`` route.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import (Response, before_render_template, current_app, g, has_app_context, request,
+                   template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds in seconds; requests slower than the last land in +Inf.
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_listening = False
+
+
+class _Timing:
+    __slots__ = ('started', 'queries', 'db', 'render', 'depth', 'render_started', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db = 0.0
+        self.render = 0.0
+        self.depth = 0
+        self.render_started = 0.0
+        self.status = None
+
+
+def _timing():
+    return g.get('_request_timing') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _timing()
+    if timing is not None:
+        timing.queries += 1
+        timing.db += time.perf_counter() - context._metrics_started
+
+
+def _before_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None:
+        # Templates rendered from inside another render are already timed.
+        if timing.depth == 0:
+            timing.render_started = time.perf_counter()
+        timing.depth += 1
+
+
+def _after_render(sender, template, context, **extra):
+    timing = _timing()
+    if timing is not None and timing.depth:
+        timing.depth -= 1
+        if timing.depth == 0:
+            timing.render += time.perf_counter() - timing.render_started
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, values, amount):
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, amount)] += 1
+        series[1] += amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, (counts, total) in sorted(self.series.items()):
+            labels = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values))
+            cumulative = 0
+            for bound, count in zip((*map(_number, self.buckets), '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {_number(total)}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by label values."""
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        self.series[values] = self.series.get(values, 0) + amount
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, count in sorted(self.series.items()):
+            labels = ','.join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, values))
+            lines.append(f'{self.name}{{{labels}}} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = Counter('mathmerise_requests_total', 'Requests answered.', ('endpoint', 'status'))
+        self.histograms = (
+            Histogram('mathmerise_request_duration_seconds', 'Time from the first before_request hook '
+                      'to the last after_request hook.', ('endpoint',), DURATION_BUCKETS),
+            Histogram('mathmerise_db_duration_seconds', 'Time spent executing SQL statements.',
+                      ('endpoint',), DURATION_BUCKETS),
+            Histogram('mathmerise_render_duration_seconds', 'Time spent rendering templates.',
+                      ('endpoint',), DURATION_BUCKETS),
+            Histogram('mathmerise_db_queries', 'SQL statements executed per request.',
+                      ('endpoint',), QUERY_BUCKETS),
+        )
+
+    def record(self, endpoint, status, timing, total):
+        with self.lock:
+            self.requests.inc((endpoint, str(status)))
+            for histogram, amount in zip(self.histograms, (total, timing.db, timing.render, timing.queries)):
+                histogram.observe((endpoint,), amount)
+
+    def expose(self):
+        with self.lock:
+            lines = self.requests.expose()
+            for histogram in self.histograms:
+                lines.extend(histogram.expose())
+        return '\n'.join(lines) + '\n'
+
+
+class Metrics:
+    """Flask extension timing requests and serving ``/metrics``.
+
+    Call :meth:`init_app` before other extensions register request hooks, so
+    that its ``before_request`` runs first and its ``after_request`` last.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', os.getenv('METRICS_ENABLED', '1') != '0')
+        app.config.setdefault('METRICS_PATH', '/metrics')
+        if not app.config['METRICS_ENABLED']:
+            return
+        _listen()
+        app.extensions['metrics'] = _Registry()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._teardown)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        app.add_url_rule(app.config['METRICS_PATH'], 'metrics', self.expose)
+
+    def _start(self):
+        g._request_timing = _Timing()
+
+    def _finish(self, response):
+        timing = g.get('_request_timing')
+        if timing is None:
+            return response
+        total = time.perf_counter() - timing.started
+        response.headers['Server-Timing'] = server_timing(timing, total)
+        if response.is_streamed:
+            # The body is rendered after this hook; the request is recorded
+            # at teardown, which a streamed response reaches once it is sent.
+            timing.status = response.status_code
+            return response
+        del g._request_timing
+        self._record(timing, response.status_code, total)
+        return response
+
+    def _teardown(self, exc):
+        timing = g.pop('_request_timing', None)
+        if timing is not None and timing.status is not None:
+            self._record(timing, timing.status, time.perf_counter() - timing.started)
+
+    def _record(self, timing, status, total):
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        current_app.extensions['metrics'].record(endpoint, status, timing, total)
+
+    def expose(self):
+        return Response(current_app.extensions['metrics'].expose(),
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def server_timing(timing, total):
+    """The ``Server-Timing`` header value for a finished request."""
+    return (f'db;dur={timing.db * 1000:.1f};desc="{timing.queries} queries", '
+            f'render;dur={timing.render * 1000:.1f}, app;dur={total * 1000:.1f}')
+
+
+def _listen():
+    # Listening on the Engine class covers the primary, the replicas and the
+    # sync side of the ASGI mode's async engine; statements outside a
+    # request (background flushes, CLI commands) find no timing and are skipped.
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+metrics = Metrics()
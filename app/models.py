@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+from sqlalchemy import event
 
 class Category(db.Model):
     __tablename__ = 'category'
@@ -9,6 +10,10 @@ class Category(db.Model):
     slug = db.Column(db.String(100), unique=True, nullable=False)
     description = db.Column(db.Text)
     icon = db.Column(db.String(50))
+    # Maintained by app.stats; `flask stats reconcile` recomputes it.
+    topic_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    # Dates renames and description or icon edits for the listing validators.
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     topics = db.relationship('Topic', backref='category', lazy=True, cascade='all, delete-orphan')
     
     def __repr__(self):
@@ -16,17 +21,42 @@ class Category(db.Model):
 
 class Topic(db.Model):
     __tablename__ = 'topic'
+    __table_args__ = (
+        # Keyset pagination orderings, catalog-wide and within a category. The
+        # category-scoped ones also serve category_id lookups (related topics),
+        # and (views, id) serves the featured list.
+        db.Index('ix_topic_views_id', 'views', 'id'),
+        db.Index('ix_topic_title_id', 'title', 'id'),
+        db.Index('ix_topic_created_at_id', 'created_at', 'id'),
+        db.Index('ix_topic_category_views_id', 'category_id', 'views', 'id'),
+        db.Index('ix_topic_category_title_id', 'category_id', 'title', 'id'),
+        db.Index('ix_topic_category_created_at_id', 'category_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     slug = db.Column(db.String(255), unique=True, nullable=False)
     description = db.Column(db.Text)
-    content = db.Column(db.Text, nullable=False)
+    # Large bodies are deferred so lists don't pull them in; pages that show
+    # them undefer the 'body' group (see queries.topic_or_404).
+    content = db.deferred(db.Column(db.Text, nullable=False), group='body')
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Indexed for max(updated_at), which dates every listing page.
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     difficulty = db.Column(db.String(20), default='beginner')  # beginner, intermediate, advanced
-    views = db.Column(db.Integer, default=0)
+    views = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+
+    # Derived from content and description by app.content whenever they change.
+    content_html = db.deferred(db.Column(db.Text), group='body')
+    toc = db.deferred(db.Column(db.JSON), group='body')
+    excerpt = db.Column(db.String(300))
+    reading_time = db.Column(db.Integer)
+    has_tex = db.Column(db.Boolean, default=False)
+
+    # Maintained by app.stats; `flask stats reconcile` recomputes them.
+    formula_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    example_count = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     
     def __repr__(self):
         return f'<Topic {self.title}>'
@@ -35,9 +65,9 @@ class Formula(db.Model):
     __tablename__ = 'formula'
     
     id = db.Column(db.Integer, primary_key=True)
-    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
-    latex = db.Column(db.Text, nullable=False)
+    latex = db.deferred(db.Column(db.Text, nullable=False), group='body')
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -50,13 +80,58 @@ class Example(db.Model):
     __tablename__ = 'example'
     
     id = db.Column(db.Integer, primary_key=True)
-    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False)
+    topic_id = db.Column(db.Integer, db.ForeignKey('topic.id'), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
-    problem = db.Column(db.Text, nullable=False)
-    solution = db.Column(db.Text, nullable=False)
+    problem = db.deferred(db.Column(db.Text, nullable=False), group='body')
+    solution = db.deferred(db.Column(db.Text, nullable=False), group='body')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     topic = db.relationship('Topic', backref=db.backref('examples', cascade='all, delete-orphan'))
     
     def __repr__(self):
         return f'<Example {self.title}>'
+
+class RenderedMath(db.Model):
+    """Server-rendered markup for a LaTeX source, keyed by a hash of renderer and source."""
+    __tablename__ = 'rendered_math'
+
+    key = db.Column(db.String(64), primary_key=True)
+    renderer = db.Column(db.String(50), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RenderedMath {self.key[:12]}>'
+
+
+class TableCount(db.Model):
+    """Row count of a catalog table, maintained by app.stats."""
+    __tablename__ = 'table_count'
+
+    name = db.Column(db.String(50), primary_key=True)
+    rows = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TableCount {self.name}={self.rows}>'
+
+
+@event.listens_for(db.session, 'before_flush')
+def touch_parent_topics(session, flush_context, instances):
+    """Bump a topic's ``updated_at`` when its formulas or examples change.
+
+    Page validators and the catalog fingerprint then only need to look at
+    the topic rows.
+    """
+    topic_ids = set()
+    for obj in session.new | session.deleted:
+        if isinstance(obj, (Formula, Example)):
+            topic_ids.add(obj.topic_id if obj.topic is None else obj.topic.id)
+    for obj in session.dirty:
+        if isinstance(obj, (Formula, Example)) and session.is_modified(obj):
+            topic_ids.add(obj.topic_id)
+    topic_ids.discard(None)
+    now = datetime.utcnow()
+    for topic_id in topic_ids:
+        topic = session.get(Topic, topic_id)
+        if topic is not None and topic not in session.deleted:
+            topic.updated_at = now
@@ -0,0 +1,182 @@
+"""Keyset (seek) pagination for the list pages.
+
+A page is fetched by filtering on the sort key of the last row already seen
+(``WHERE (title, id) > (:title, :id) ORDER BY title, id LIMIT n``) instead of
+skipping rows with ``OFFSET``, so every page costs the same index range scan
+however deep it is, and rows inserted meanwhile never shift a page boundary.
+
+Cursors are the sort key of a boundary row, JSON-encoded and base64url'd. The
+sort columns must be non-null and end with a unique column (the primary key)
+so the key totally orders the rows.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from flask import abort, current_app
+from sqlalchemy import bindparam, tuple_
+
+from app import db
+
+# Rows fetched per round trip while a streamed page is rendered.
+STREAM_BATCH = 100
+
+
+class Keyset:
+    """An ordering over columns that together identify a row."""
+
+    def __init__(self, *columns, descending=False):
+        self.columns = columns
+        self.descending = descending
+
+    def order_by(self, reverse=False):
+        descending = self.descending != reverse
+        return [column.desc() if descending else column.asc() for column in self.columns]
+
+    def beyond(self, values, reverse=False):
+        """Condition selecting rows that come after ``values`` in this order."""
+        key = tuple_(*self.columns)
+        bound = tuple_(*(
+            bindparam(None, value, type_=column.type)
+            for column, value in zip(self.columns, values)
+        ))
+        return key < bound if self.descending != reverse else key > bound
+
+    def key(self, obj):
+        return [getattr(obj, column.key) for column in self.columns]
+
+    def encode(self, obj):
+        values = [
+            value.isoformat() if isinstance(value, datetime) else value
+            for value in self.key(obj)
+        ]
+        data = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode(self, cursor):
+        """Parse a cursor produced by :meth:`encode`; raises ValueError if malformed."""
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise ValueError(f'Malformed cursor {cursor!r}') from exc
+        if not isinstance(values, list) or len(values) != len(self.columns):
+            raise ValueError(f'Malformed cursor {cursor!r}')
+        decoded = []
+        for column, value in zip(self.columns, values):
+            if column.type.python_type is datetime:
+                if not isinstance(value, str):
+                    raise ValueError(f'Malformed cursor {cursor!r}')
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, column.type.python_type):
+                raise ValueError(f'Malformed cursor {cursor!r}')
+            decoded.append(value)
+        return decoded
+
+
+class KeysetPage:
+    """One page of rows plus the cursors of its neighbours."""
+
+    def __init__(self, items, keyset, has_prev, has_next):
+        self.items = items
+        self.keyset = keyset
+        self.has_prev = has_prev and bool(items)
+        self.has_next = has_next and bool(items)
+
+    @property
+    def prev_cursor(self):
+        return self.keyset.encode(self.items[0]) if self.has_prev else None
+
+    @property
+    def next_cursor(self):
+        return self.keyset.encode(self.items[-1]) if self.has_next else None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class KeysetStream:
+    """A forward page whose rows are fetched while a streamed template iterates them.
+
+    Rows come from the database ``STREAM_BATCH`` at a time and are not kept,
+    so it can be iterated only once, and its neighbour cursors are known only
+    after that.
+    """
+
+    def __init__(self, stmt, keyset, per_page, has_prev):
+        self.stmt = stmt
+        self.keyset = keyset
+        self.per_page = per_page
+        self.after_cursor = has_prev
+        self.first = self.last = None
+        self.more = False
+        self.done = False
+
+    def __iter__(self):
+        result = db.session.scalars(self.stmt)
+        try:
+            for position, obj in enumerate(result):
+                if position == self.per_page:
+                    self.more = True
+                    break
+                if position == 0:
+                    self.first = obj
+                self.last = obj
+                yield obj
+        finally:
+            result.close()
+        self.done = True
+
+    def _finished(self):
+        if not self.done:
+            raise RuntimeError('The neighbours of a streamed page are known once its rows have been iterated')
+        return self.first is not None
+
+    @property
+    def has_prev(self):
+        return self._finished() and self.after_cursor
+
+    @property
+    def has_next(self):
+        return self._finished() and self.more
+
+    @property
+    def prev_cursor(self):
+        return self.keyset.encode(self.first) if self.has_prev else None
+
+    @property
+    def next_cursor(self):
+        return self.keyset.encode(self.last) if self.has_next else None
+
+
+def paginate(stmt, keyset, after=None, before=None, per_page=None, stream=False):
+    """Run ``stmt`` for the page following ``after`` or preceding ``before``.
+
+    A malformed cursor aborts with 400. With ``stream``, a forward page is
+    returned as a :class:`KeysetStream` and its query runs when it is
+    iterated; a page before a cursor is fetched in reverse and flipped, so it
+    is always loaded here.
+    """
+    per_page = per_page or current_app.config['PER_PAGE']
+    cursor = before or after
+    reverse = bool(before)
+    if cursor:
+        try:
+            values = keyset.decode(cursor)
+        except ValueError:
+            abort(400)
+        stmt = stmt.filter(keyset.beyond(values, reverse))
+    stmt = stmt.order_by(*keyset.order_by(reverse)).limit(per_page + 1)
+    if stream and not reverse:
+        stmt = stmt.execution_options(yield_per=min(per_page + 1, STREAM_BATCH))
+        return KeysetStream(stmt, keyset, per_page, has_prev=bool(cursor))
+    items = db.session.scalars(stmt).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if reverse:
+        items.reverse()
+        return KeysetPage(items, keyset, has_prev=more, has_next=True)
+    return KeysetPage(items, keyset, has_prev=bool(cursor), has_next=more)
@@ -0,0 +1,142 @@
+"""Query-plan checks for the pages the app serves.
+
+``flask perf explain`` requests one URL per GET route through the test
+client (plus the sort variants of the list pages), records every statement
+a warm request sends to the database and runs ``EXPLAIN`` on each SELECT
+with the same parameters. Each URL is requested twice and only the second
+request is checked, so one-off work such as building the suggestion index
+is left out. Plans that read a whole table (SQLite ``SCAN table``,
+Postgres ``Seq Scan``) or sort rows in a temporary structure because no index
+matches the ORDER BY are reported, and the command exits non-zero.
+
+Plans depend on the data: Postgres prefers sequential scans on small tables,
+so run it against a database of realistic size.
+"""
+import re
+from urllib.parse import urlencode
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, select
+
+from app import db
+from app.cache import NullCache
+from app.models import Category, Topic
+
+perf_cli = AppGroup('perf', help='Inspect how the app uses the database.')
+
+LIST_SORTS = ('title', 'popular', 'newest')
+
+
+def sample_urls():
+    """One URL per GET route, filled in with rows that exist."""
+    topic = db.session.execute(select(Topic.slug, Topic.title).limit(1)).first()
+    category = db.session.scalar(select(Category.slug).limit(1))
+    word = topic.title.split()[0] if topic else 'algebra'
+    args = {
+        'topics.view_topic': {'slug': topic.slug if topic else None},
+        'topics.category': {'slug': category},
+    }
+    query = {
+        'main.search': {'q': word},
+        'api.suggest': {'q': word[:2]},
+    }
+    urls = []
+    for rule in current_app.url_map.iter_rules():
+        if 'GET' not in rule.methods or rule.endpoint == 'static':
+            continue
+        values = args.get(rule.endpoint, {})
+        if set(rule.arguments) - {k for k, v in values.items() if v is not None}:
+            continue
+        path = rule.build(values, append_unknown=False)[1]
+        if rule.endpoint in ('topics.all_topics', 'topics.category'):
+            urls.extend(f'{path}?sort={sort}' for sort in LIST_SORTS)
+        elif rule.endpoint in query:
+            urls.append(f'{path}?{urlencode(query[rule.endpoint])}')
+        else:
+            urls.append(path)
+    return sorted(urls)
+
+
+def explain(connection, statement, parameters):
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters)
+        return [row[-1] for row in rows]
+    if connection.dialect.name == 'postgresql':
+        rows = connection.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+        return [row[0] for row in rows]
+    raise click.ClickException(f'EXPLAIN is not supported for {connection.dialect.name}')
+
+
+def problems(plan):
+    """Plan lines that read a whole table or sort without an index."""
+    details = [line.strip() for line in plan]
+    # Full-text matches are ordered by a relevance score no index can hold.
+    fulltext = any('VIRTUAL TABLE' in detail for detail in details)
+    found = []
+    for detail in details:
+        if re.fullmatch(r'SCAN \S+', detail) or 'Seq Scan on' in detail:
+            found.append(detail)
+        elif 'USE TEMP B-TREE FOR ORDER BY' in detail and not fulltext:
+            found.append(detail)
+    return found
+
+
+def capture(client, url):
+    """Request ``url`` twice and return the SELECT statements of the second."""
+    client.get(url)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response.status_code, statements
+
+
+@perf_cli.command('explain')
+@click.option('--url', 'urls', multiple=True, help='URL to check; repeatable. Defaults to every GET route.')
+@click.option('--allow', multiple=True, default=('category',), show_default=True,
+              help='Table whose full scans are expected, e.g. a small lookup table; repeatable.')
+@click.option('--verbose', '-v', is_flag=True, help='Print every statement and plan.')
+def explain_command(urls, allow, verbose):
+    """EXPLAIN every query the routes issue and flag full scans."""
+    app = current_app._get_current_object()
+    urls = urls or sample_urls()
+    cache = app.extensions['response_cache']
+    backend, cache.backend = cache.backend, NullCache()
+    flagged = 0
+    try:
+        client = app.test_client()
+        for url in urls:
+            status, statements = capture(client, url)
+            click.echo(f'{url} [{status}] {len(statements)} queries')
+            seen = set()
+            with db.engine.connect() as connection:
+                for statement, parameters in statements:
+                    if statement in seen:
+                        continue
+                    seen.add(statement)
+                    plan = explain(connection, statement, parameters)
+                    found = [
+                        line for line in problems(plan)
+                        if not any(re.search(rf'\b{re.escape(table)}\b', line) for table in allow)
+                    ]
+                    flagged += len(found)
+                    if found or verbose:
+                        click.echo('  ' + ' '.join(statement.split()))
+                        for line in (plan if verbose else found):
+                            marker = '!!' if line.strip() in found else '  '
+                            click.echo(f'    {marker} {line.strip()}')
+    finally:
+        cache.backend = backend
+    if flagged:
+        click.echo(f'{flagged} full scan(s) or unindexed sort(s) found.')
+        raise SystemExit(1)
+    click.echo('No full scans found.')
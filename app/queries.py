@@ -0,0 +1,227 @@
+"""Read queries used by the blueprints.
+
+Every listing declares how its relationships are loaded, so templates that
+touch ``topic.category`` or ``topic.formulas`` in a loop never fall back to a
+lazy SELECT per row. Listings also load only the columns a card shows; the
+large text columns are deferred on the models and only the topic page
+undefers them.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import aliased, joinedload, load_only, selectinload, undefer_group
+
+from app import db
+from app.models import Category, Example, Formula, Topic
+from app.pagination import Keyset, paginate
+
+
+def all_categories():
+    return db.session.scalars(select(Category)).all()
+
+
+def category_or_404(slug):
+    return db.first_or_404(select(Category).filter_by(slug=slug))
+
+
+# What topic cards and admin rows display, plus the keyset ordering columns.
+CARD_COLUMNS = (
+    Topic.id, Topic.title, Topic.slug, Topic.excerpt, Topic.difficulty,
+    Topic.views, Topic.category_id, Topic.created_at, Topic.formula_count, Topic.example_count,
+)
+
+
+def topic_cards():
+    """Loader options for topic listings: card columns and the category."""
+    return load_only(*CARD_COLUMNS), joinedload(Topic.category)
+
+
+def featured_topics(limit=6):
+    stmt = (
+        select(Topic)
+        .options(*topic_cards())
+        .order_by(Topic.views.desc())
+        .limit(limit)
+    )
+    return db.session.scalars(stmt).all()
+
+
+# Orderings the topic lists can be paged in, each backed by a composite index
+# on Topic (plus a category-scoped variant for the category pages).
+TOPIC_ORDERS = {
+    'title': Keyset(Topic.title, Topic.id),
+    'popular': Keyset(Topic.views, Topic.id, descending=True),
+    'newest': Keyset(Topic.created_at, Topic.id, descending=True),
+}
+
+
+def topic_page(sort='title', category_id=None, after=None, before=None, per_page=None, stream=False):
+    """One page of topics with their category, in a ``TOPIC_ORDERS`` ordering.
+
+    ``stream`` defers the query to a streamed template; see :func:`paginate`.
+    """
+    keyset = TOPIC_ORDERS.get(sort, TOPIC_ORDERS['title'])
+    stmt = select(Topic).options(*topic_cards())
+    if category_id is not None:
+        stmt = stmt.filter(Topic.category_id == category_id)
+    return paginate(stmt, keyset, after=after, before=before, per_page=per_page, stream=stream)
+
+
+def category_page(after=None, before=None, per_page=None):
+    keyset = Keyset(Category.name, Category.id)
+    return paginate(select(Category), keyset, after=after, before=before, per_page=per_page)
+
+
+def topic_or_404(slug):
+    stmt = (
+        select(Topic)
+        .filter_by(slug=slug)
+        .options(
+            undefer_group('body'),
+            joinedload(Topic.category),
+            selectinload(Topic.formulas).undefer_group('body'),
+            selectinload(Topic.examples).undefer_group('body'),
+        )
+    )
+    return db.first_or_404(stmt)
+
+
+def related_topics(topic, limit=4):
+    stmt = (
+        select(Topic)
+        .options(*topic_cards())
+        .filter(Topic.category_id == topic.category_id, Topic.id != topic.id)
+        .limit(limit)
+    )
+    return db.session.scalars(stmt).all()
+
+
+def topics_by_ids(ids):
+    """Load topics for a list of ids, e.g. search hits, with their category."""
+    if not ids:
+        return []
+    stmt = select(Topic).options(*topic_cards()).filter(Topic.id.in_(ids))
+    return db.session.scalars(stmt).all()
+
+
+def content_version(connection=None):
+    """Cheap aggregate that changes whenever catalog rows are added, edited or removed.
+
+    View counts are deliberately not part of it.
+    """
+    connection = connection or db.session.connection()
+    categories = Category.__table__
+    topics = Topic.__table__
+    formulas = Formula.__table__
+    examples = Example.__table__
+    row = connection.execute(select(
+        select(func.count()).select_from(categories).scalar_subquery(),
+        select(func.max(categories.c.id)).scalar_subquery(),
+        select(func.max(categories.c.updated_at)).scalar_subquery(),
+        select(func.count()).select_from(topics).scalar_subquery(),
+        select(func.max(topics.c.updated_at)).scalar_subquery(),
+        select(func.count()).select_from(formulas).scalar_subquery(),
+        select(func.max(formulas.c.id)).scalar_subquery(),
+        select(func.count()).select_from(examples).scalar_subquery(),
+        select(func.max(examples.c.id)).scalar_subquery(),
+    )).one()
+    return [str(value) for value in row]
+
+
+def catalog_state():
+    """Validators for pages that list every category and topic.
+
+    Deletes only show in the counts, so no date here covers every change and
+    the pages are validated by ETag alone.
+    """
+    return db.session.execute(select(
+        select(func.count()).select_from(Category).scalar_subquery().label('categories'),
+        select(func.max(Category.id)).scalar_subquery().label('last_category'),
+        select(func.max(Category.updated_at)).scalar_subquery().label('categories_updated_at'),
+        select(func.count()).select_from(Topic).scalar_subquery().label('topics'),
+        select(func.max(Topic.updated_at)).scalar_subquery().label('updated_at'),
+    )).one()
+
+
+def category_state(slug):
+    """Validators for one category page, or None if the slug is unknown."""
+    in_category = Topic.category_id == Category.id
+    return db.session.execute(
+        select(
+            Category.id,
+            Category.name,
+            Category.description,
+            Category.icon,
+            select(func.count(Topic.id)).where(in_category).scalar_subquery().label('topics'),
+            select(func.max(Topic.updated_at)).where(in_category).scalar_subquery().label('updated_at'),
+        )
+        .filter(Category.slug == slug)
+    ).first()
+
+
+def topic_state(slug):
+    """Validators for one topic page, or None if the slug is unknown.
+
+    Formula and example edits touch their topic's ``updated_at``, so the
+    topic's own timestamp covers them; siblings cover the related list.
+    """
+    sibling = aliased(Topic)
+    return db.session.execute(
+        select(
+            Topic.id,
+            Topic.updated_at,
+            Category.name.label('category_name'),
+            select(func.count(sibling.id))
+            .where(sibling.category_id == Topic.category_id)
+            .scalar_subquery()
+            .label('siblings'),
+            select(func.max(sibling.updated_at))
+            .where(sibling.category_id == Topic.category_id)
+            .scalar_subquery()
+            .label('siblings_updated_at'),
+        )
+        .join(Category, Topic.category_id == Category.id)
+        .filter(Topic.slug == slug)
+    ).first()
+
+
+def topic_states():
+    """:func:`topic_state` for every topic in one query, keyed by slug."""
+    siblings = (
+        select(
+            Topic.category_id,
+            func.count(Topic.id).label('siblings'),
+            func.max(Topic.updated_at).label('siblings_updated_at'),
+        )
+        .group_by(Topic.category_id)
+        .subquery()
+    )
+    rows = db.session.execute(
+        select(
+            Topic.slug,
+            Topic.id,
+            Topic.updated_at,
+            Category.name.label('category_name'),
+            siblings.c.siblings,
+            siblings.c.siblings_updated_at,
+        )
+        .join(Category, Topic.category_id == Category.id)
+        .join(siblings, siblings.c.category_id == Topic.category_id)
+    )
+    return {row.slug: tuple(row)[1:] for row in rows}
+
+
+@contextmanager
+def count_queries(engine=None):
+    """Collect the SQL statements executed on ``engine`` inside the block."""
+    engine = engine or db.engine
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
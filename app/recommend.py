@@ -0,0 +1,322 @@
+"""Materialized featured and related-topic lists.
+
+The homepage's featured list and each topic page's related list are read from
+a snapshot computed in one pass over the catalog, so serving them is a
+dictionary lookup followed by a primary-key fetch. Related topics are ranked
+by shared keywords (title and description) and shared formula names,
+weighted by how rare each word is, with a bonus for the same category and
+difficulty. The featured list is the most viewed topics, at most
+``RECOMMEND_PER_CATEGORY`` from any one category while others are available.
+
+The snapshot is rebuilt after local writes and when the catalog fingerprint
+changes (writes from other workers). Every ``RECOMMEND_REFRESH_INTERVAL``
+seconds only the featured list is recomputed, from the most viewed rows, so
+view counts are picked up without another pass over the catalog. All of it
+runs on a background thread, started when a worker forks or by the first
+request, while the previous snapshot keeps serving. Until the first snapshot
+is ready, the featured list is read straight from the table and topic pages
+show no related topics. ``flask recommend refresh`` rebuilds on demand.
+"""
+import heapq
+import math
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from app import db, queries
+from app.cache import response_cache
+from app.commits import on_commit
+from app.models import Category, Formula, Topic
+from app.search.backends import tokenize
+
+STOPWORDS = frozenset(
+    'and are for from how its into the their this that what when with your using '
+    'about introduction basic basics learn'.split()
+)
+
+# Words on more topics than this say little about relatedness and are skipped
+# when gathering candidates.
+MAX_POSTINGS = 200
+
+# Same-category topics considered even when they share no words.
+CATEGORY_CANDIDATES = 20
+
+Snapshot = namedtuple('Snapshot', 'featured related version')
+
+# Served until the first snapshot has been built.
+PENDING = Snapshot((), {}, None)
+
+
+def keywords(*texts):
+    return {
+        word for text in texts for word in tokenize(text or '')
+        if len(word) > 2 and word not in STOPWORDS and not word.isdigit()
+    }
+
+
+def build_snapshot(rows, formulas, featured_size, related_size, per_category, version=None):
+    """Compute recommendations from catalog rows.
+
+    ``rows`` are ``(id, title, description, category_id, difficulty, views)``;
+    ``formulas`` maps topic id to a list of formula titles.
+    """
+    topics = {row[0]: row for row in rows}
+    words = {tid: keywords(row[1], row[2]) for tid, row in topics.items()}
+    formula_words = {tid: keywords(*formulas.get(tid, ())) for tid in topics}
+
+    postings = defaultdict(list)
+    formula_postings = defaultdict(list)
+    for tid in topics:
+        for word in words[tid]:
+            postings[word].append(tid)
+        for word in formula_words[tid]:
+            formula_postings[word].append(tid)
+    total = max(len(topics), 1)
+
+    def idf(posting):
+        return math.log(1 + total / len(posting))
+
+    by_views = sorted(topics, key=lambda tid: (-(topics[tid][5] or 0), tid))
+    by_category = defaultdict(list)
+    for tid in by_views:
+        by_category[topics[tid][3]].append(tid)
+
+    related = {}
+    for tid, (_, _, _, category_id, difficulty, _) in topics.items():
+        scores = defaultdict(float)
+        for word in words[tid]:
+            posting = postings[word]
+            if len(posting) <= MAX_POSTINGS:
+                weight = idf(posting)
+                for other in posting:
+                    scores[other] += weight
+        for word in formula_words[tid]:
+            posting = formula_postings[word]
+            if len(posting) <= MAX_POSTINGS:
+                weight = 2 * idf(posting)
+                for other in posting:
+                    scores[other] += weight
+        for other in by_category[category_id][:CATEGORY_CANDIDATES]:
+            scores.setdefault(other, 0.0)
+        scores.pop(tid, None)
+        ranked = heapq.nsmallest(
+            related_size,
+            scores,
+            key=lambda other: (
+                -(scores[other]
+                  + (1.5 if topics[other][3] == category_id else 0.0)
+                  + (0.5 if topics[other][4] == difficulty else 0.0)),
+                -(topics[other][5] or 0),
+                other,
+            ),
+        )
+        related[tid] = tuple(ranked)
+
+    featured = pick_featured(((tid, topics[tid][3]) for tid in by_views), featured_size, per_category)
+    return Snapshot(featured, related, version)
+
+
+def pick_featured(ranked, size, per_category):
+    """The featured list from ``(topic id, category id)`` pairs, most viewed first.
+
+    ``ranked`` is only read as far as needed.
+    """
+    featured, spill = [], []
+    counts = defaultdict(int)
+    for tid, category_id in ranked:
+        if len(featured) == size:
+            break
+        if counts[category_id] < per_category:
+            counts[category_id] += 1
+            featured.append(tid)
+        else:
+            spill.append(tid)
+    featured.extend(spill[:size - len(featured)])
+    return tuple(featured)
+
+
+class _RecommendState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        self.built_at = 0.0
+        self.checked_at = 0.0
+        self.stale = False
+        self.refreshing = False
+
+
+class Recommendations:
+    """Flask extension serving the featured and related-topic lists."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RECOMMEND_FEATURED', 6)
+        app.config.setdefault('RECOMMEND_RELATED', 4)
+        app.config.setdefault('RECOMMEND_PER_CATEGORY', 2)
+        app.config.setdefault('RECOMMEND_REFRESH_INTERVAL', 300)
+        app.config.setdefault('RECOMMEND_CHECK_INTERVAL', 30)
+        app.config.setdefault('RECOMMEND_BACKGROUND', True)
+        app.extensions['recommend'] = _RecommendState()
+        app.cli.add_command(recommend_cli)
+
+    def _state(self):
+        return current_app.extensions['recommend']
+
+    def compute(self):
+        config = current_app.config
+        version = queries.content_version()
+        rows = db.session.execute(select(
+            Topic.id, Topic.title, Topic.description, Topic.category_id, Topic.difficulty, Topic.views
+        )).all()
+        formulas = defaultdict(list)
+        for topic_id, title in db.session.execute(select(Formula.topic_id, Formula.title)):
+            formulas[topic_id].append(title)
+        return build_snapshot(
+            rows, formulas,
+            max(config['RECOMMEND_FEATURED'], 1),
+            max(config['RECOMMEND_RELATED'], 1),
+            config['RECOMMEND_PER_CATEGORY'],
+            version,
+        )
+
+    def compute_featured(self):
+        config = current_app.config
+        rows = db.session.execute(
+            select(Topic.id, Topic.category_id)
+            .order_by(Topic.views.desc(), Topic.id)
+            .execution_options(yield_per=100)
+        )
+        try:
+            return pick_featured(rows, max(config['RECOMMEND_FEATURED'], 1), config['RECOMMEND_PER_CATEGORY'])
+        finally:
+            rows.close()
+
+    def refresh(self):
+        """Rebuild the snapshot now, in this thread."""
+        state = self._state()
+        # Cleared first so a write committed while computing marks it stale again.
+        state.stale = False
+        snapshot = self.compute()
+        with state.lock:
+            state.snapshot = snapshot
+            state.built_at = state.checked_at = time.monotonic()
+        return snapshot
+
+    def refresh_featured(self):
+        """Recompute only the featured list, for new view counts."""
+        state = self._state()
+        featured = self.compute_featured()
+        with state.lock:
+            state.snapshot = state.snapshot._replace(featured=featured)
+            state.built_at = time.monotonic()
+        return state.snapshot
+
+    def _run_in_background(self, app, job):
+        try:
+            with app.app_context():
+                job()
+        except Exception:
+            app.logger.exception('Refreshing recommendations failed')
+        finally:
+            app.extensions['recommend'].refreshing = False
+
+    def start_refresh(self, job=None):
+        """Run ``job`` (default :meth:`refresh`) on a background thread unless one is running."""
+        state = self._state()
+        with state.lock:
+            if state.refreshing:
+                return
+            state.refreshing = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._run_in_background, args=(app, job or self.refresh), daemon=True).start()
+
+    def _due(self, state):
+        """The rebuild the snapshot needs, if any."""
+        now = time.monotonic()
+        if state.stale:
+            return self.refresh
+        if now - state.checked_at >= current_app.config['RECOMMEND_CHECK_INTERVAL']:
+            state.checked_at = now
+            if queries.content_version() != state.snapshot.version:
+                return self.refresh
+        if now - state.built_at >= current_app.config['RECOMMEND_REFRESH_INTERVAL']:
+            return self.refresh_featured
+        return None
+
+    def snapshot(self):
+        """Return the current snapshot, or :data:`PENDING`, scheduling a rebuild if it is out of date."""
+        state = self._state()
+        background = current_app.config['RECOMMEND_BACKGROUND']
+        if state.snapshot is None:
+            if not background:
+                return self.refresh()
+            self.start_refresh()
+            return PENDING
+        if not state.refreshing:
+            job = self._due(state)
+            if job is not None:
+                if not background:
+                    return job()
+                self.start_refresh(job)
+        return state.snapshot
+
+    def _load(self, ids):
+        topics = {topic.id: topic for topic in queries.topics_by_ids(list(ids))}
+        return [topics[tid] for tid in ids if tid in topics]
+
+    def featured_topics(self, limit=None):
+        limit = limit or current_app.config['RECOMMEND_FEATURED']
+        snapshot = self.snapshot()
+        if snapshot is PENDING:
+            response_cache.skip()
+        if snapshot is PENDING or limit > current_app.config['RECOMMEND_FEATURED']:
+            return queries.featured_topics(limit)
+        return self._load(snapshot.featured[:limit])
+
+    def related_topics(self, topic, limit=None):
+        limit = limit or current_app.config['RECOMMEND_RELATED']
+        snapshot = self.snapshot()
+        if snapshot is PENDING:
+            response_cache.skip()
+            return []
+        related = snapshot.related.get(topic.id)
+        if related is None or limit > current_app.config['RECOMMEND_RELATED']:
+            # Written since the last rebuild, or more than was precomputed.
+            return queries.related_topics(topic, limit)
+        return self._load(related[:limit])
+
+
+recommendations = Recommendations()
+
+recommend_cli = AppGroup('recommend', help='Manage featured and related-topic lists.')
+
+
+@recommend_cli.command('refresh')
+def refresh_command():
+    """Recompute featured and related topics."""
+    snapshot = recommendations.refresh()
+    click.echo(f'Recommendations rebuilt for {len(snapshot.related)} topics.')
+
+
+def _note_changes(session):
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, (Category, Topic, Formula)):
+            return True
+    return None
+
+
+def _mark_stale(noticed):
+    state = current_app.extensions.get('recommend')
+    if state is not None:
+        state.stale = True
+
+
+on_commit('recommend', _note_changes, _mark_stale)
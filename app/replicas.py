@@ -0,0 +1,273 @@
+"""Read-replica routing.
+
+``DATABASE_REPLICA_URLS`` (comma-separated) lists read replicas of the
+primary database. GET and HEAD requests to the public and admin blueprints
+read from one of them; everything else, and any statement that writes
+(flushes, ``INSERT``/``UPDATE``/``DELETE``, the view counter), goes to the
+primary, as does every read after a write within the same request.
+
+A replica is only used while its lag, measured every
+``REPLICA_CHECK_INTERVAL`` seconds on a background thread, is within
+``REPLICA_MAX_LAG``; otherwise reads fall back to the primary, as they do
+until the first measurement and whenever the last one is more than
+``STALE_CHECKS`` intervals old (a check stuck on an unreachable replica
+never holds up a request). ``REPLICA_BACKGROUND=0`` measures on the request
+instead, at most once per interval. After a commit that changes catalog rows,
+reads stay on the primary for ``REPLICA_MAX_LAG`` plus the check interval,
+both for this worker and, through the session cookie, for the user who made
+the change, so nobody who could have seen the write reads a replica that
+might not have it yet.
+
+The ``api`` blueprint is left on the primary: ``/api/suggest`` answers from
+the in-memory suggestion index and only reads the content version, which
+has to be compared with the primary's, where the index is built from; a
+lagging replica's older version would look like a change and rebuild it.
+
+Postgres replicas report their replay lag. For local development and tests
+a SQLite file can stand in for a replica: ``flask replica sync`` copies the
+primary into it with SQLite's backup API and records when, and that time is
+its lag.
+"""
+import os
+import random
+import threading
+import time
+
+import click
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask.cli import AppGroup
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+from app.commits import on_commit
+
+# Lag readings older than this many check intervals are not trusted.
+STALE_CHECKS = 3
+
+# Session cookie key holding the time until which this user reads the primary.
+STICKY_KEY = '_db_primary_until'
+
+POSTGRES_LAG = (
+    'SELECT CASE'
+    ' WHEN NOT pg_is_in_recovery() THEN 0'
+    ' WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0'
+    ' ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END'
+)
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica chosen for the current request."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            if self._flushing or getattr(clause, 'is_dml', False):
+                g.db_primary = True
+            elif g.get('db_replica') is not None and not g.get('db_primary'):
+                return g.db_replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_lag(connection):
+    """Seconds the database behind ``connection`` trails the primary."""
+    if connection.dialect.name == 'sqlite':
+        synced = connection.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'replica_sync'").scalar()
+        synced_at = synced and connection.exec_driver_sql('SELECT max(synced_at) FROM replica_sync').scalar()
+        return float('inf') if synced_at is None else max(time.time() - synced_at, 0.0)
+    if connection.dialect.name == 'postgresql':
+        return float(connection.exec_driver_sql(POSTGRES_LAG).scalar())
+    return 0.0
+
+
+def sync_sqlite(primary, replica):
+    """Copy the ``primary`` SQLite database into ``replica`` and stamp the copy."""
+    started = time.time()
+    with primary.connect() as source, replica.connect() as target:
+        source.connection.driver_connection.backup(target.connection.driver_connection)
+        target.exec_driver_sql('CREATE TABLE IF NOT EXISTS replica_sync (synced_at REAL NOT NULL)')
+        target.exec_driver_sql('DELETE FROM replica_sync')
+        target.exec_driver_sql('INSERT INTO replica_sync (synced_at) VALUES (?)', (started,))
+        target.commit()
+
+
+class _Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.lag = float('inf')
+        self.checked_at = None
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                self.lag = replica_lag(connection)
+        except Exception:
+            current_app.logger.warning('Replica %s is unavailable', self.name, exc_info=True)
+            self.lag = float('inf')
+        self.checked_at = time.monotonic()
+
+    @property
+    def name(self):
+        return self.engine.url.render_as_string(hide_password=True)
+
+
+class _ReplicaState:
+    def __init__(self, replicas):
+        self.lock = threading.Lock()
+        self.replicas = replicas
+        self.primary_until = 0.0
+        self.checking = False
+
+
+class ReplicaRouter:
+    """Flask extension choosing a replica, or the primary, for each request."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app.config import apply_sqlite_pragmas
+
+        urls = os.getenv('DATABASE_REPLICA_URLS', '')
+        app.config.setdefault('REPLICA_URLS', [url.strip() for url in urls.split(',') if url.strip()])
+        app.config.setdefault('REPLICA_MAX_LAG', float(os.getenv('REPLICA_MAX_LAG', 5)))
+        app.config.setdefault('REPLICA_CHECK_INTERVAL', 2.0)
+        app.config.setdefault('REPLICA_BACKGROUND', os.getenv('REPLICA_BACKGROUND', '1') != '0')
+        app.config.setdefault('REPLICA_BLUEPRINTS', ('main', 'topics', 'admin'))
+
+        replicas = []
+        for url in app.config['REPLICA_URLS']:
+            url = make_url(url)
+            if url.get_backend_name() == 'sqlite':
+                if url.database and url.database != ':memory:' and not os.path.isabs(url.database):
+                    url = url.set(database=os.path.join(app.instance_path, url.database))
+                engine = create_engine(url)
+                apply_sqlite_pragmas(engine, app.config['SQLITE_PRAGMAS'])
+            else:
+                engine = create_engine(url, **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+            replicas.append(_Replica(engine))
+        app.extensions['replicas'] = _ReplicaState(replicas)
+        if replicas:
+            app.before_request(self._route)
+            app.logger.info('Reading from %d replica(s): %s', len(replicas),
+                            ', '.join(replica.name for replica in replicas))
+        app.cli.add_command(replica_cli)
+
+    def _state(self):
+        return current_app.extensions['replicas']
+
+    @property
+    def sticky_seconds(self):
+        config = current_app.config
+        return config['REPLICA_MAX_LAG'] + config['REPLICA_CHECK_INTERVAL']
+
+    def _route(self):
+        g.db_primary = False
+        g.db_replica = None
+        if request.method not in ('GET', 'HEAD') or request.blueprint not in current_app.config['REPLICA_BLUEPRINTS']:
+            return
+        if time.monotonic() < self._state().primary_until or session.get(STICKY_KEY, 0) > time.time():
+            return
+        g.db_replica = self.read_engine()
+
+    def read_engine(self):
+        """An engine for a replica within the allowed lag, or None for the primary."""
+        state = self._state()
+        config = current_app.config
+        interval = config['REPLICA_CHECK_INTERVAL']
+        background = config['REPLICA_BACKGROUND']
+        if background and not state.checking:
+            self.start_checks()
+        candidates = list(state.replicas)
+        random.shuffle(candidates)
+        now = time.monotonic()
+        for replica in candidates:
+            if background:
+                if replica.checked_at is None or now - replica.checked_at > STALE_CHECKS * interval:
+                    continue
+            elif replica.checked_at is None or now - replica.checked_at >= interval:
+                replica.check()
+            if replica.lag <= config['REPLICA_MAX_LAG']:
+                return replica.engine
+        return None
+
+    def _check_in_background(self, app):
+        state = app.extensions['replicas']
+        with app.app_context():
+            while state.checking:
+                for replica in state.replicas:
+                    replica.check()
+                time.sleep(app.config['REPLICA_CHECK_INTERVAL'])
+
+    def start_checks(self):
+        """Measure every replica's lag on a background thread unless one is running.
+
+        The thread runs until ``checking`` is cleared on the replica state.
+        """
+        state = self._state()
+        with state.lock:
+            if state.checking or not state.replicas:
+                return
+            state.checking = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._check_in_background, args=(app,), daemon=True).start()
+
+    def stick_to_primary(self):
+        """Read from the primary for a while, in this worker and for this user."""
+        seconds = self.sticky_seconds
+        state = self._state()
+        with state.lock:
+            state.primary_until = max(state.primary_until, time.monotonic() + seconds)
+        if has_request_context():
+            session[STICKY_KEY] = time.time() + seconds
+
+
+replicas = ReplicaRouter()
+
+replica_cli = AppGroup('replica', help='Inspect and sync read replicas.')
+
+
+@replica_cli.command('status')
+def status_command():
+    """Show each replica's lag."""
+    state = current_app.extensions['replicas']
+    if not state.replicas:
+        click.echo('No replicas configured.')
+    for replica in state.replicas:
+        replica.check()
+        lag = 'unavailable' if replica.lag == float('inf') else f'{replica.lag:.2f}s behind'
+        click.echo(f'{replica.name}: {lag}')
+
+
+@replica_cli.command('sync')
+@click.option('--watch', type=float, default=None, metavar='SECONDS', help='Keep syncing at this interval.')
+def sync_command(watch):
+    """Copy the primary into SQLite stand-in replicas."""
+    from app import db
+
+    targets = [replica for replica in current_app.extensions['replicas'].replicas
+               if replica.engine.dialect.name == 'sqlite']
+    if db.engine.dialect.name != 'sqlite' or not targets:
+        raise click.ClickException('Only SQLite replicas of a SQLite primary can be synced locally.')
+    while True:
+        for replica in targets:
+            sync_sqlite(db.engine, replica.engine)
+        click.echo(f'Synced {len(targets)} replica(s).')
+        if watch is None:
+            break
+        time.sleep(watch)
+
+
+def _note_changes(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        return True
+    return None
+
+
+def _stick(noticed):
+    state = current_app.extensions.get('replicas')
+    if state is not None and state.replicas:
+        replicas.stick_to_primary()
+
+
+on_commit('replicas', _note_changes, _stick)
@@ -1,13 +1,26 @@
 from flask import Blueprint, render_template, request
 from app.models import Category, Topic
-from app import db
+from app import db, queries
+from app.search import search_index
+from app.recommend import recommendations
+from app.cache import response_cache
+from app.http_cache import Validators, http_cache, make_etag
+from app.streaming import Deferred, streaming
 
 bp = Blueprint('main', __name__)
 
+def index_validators():
+    state = queries.catalog_state()
+    featured = recommendations.snapshot().featured
+    return Validators(make_etag('index', featured, *state), None, {})
+
 @bp.route('/')
+@http_cache.conditional(index_validators)
+@response_cache.cached()
 def index():
-    categories = Category.query.all()
-    featured_topics = Topic.query.order_by(Topic.views.desc()).limit(6).all()
+    response_cache.tag('categories', 'topics')
+    categories = queries.all_categories()
+    featured_topics = recommendations.featured_topics(limit=6)
     return render_template('index.html', categories=categories, featured_topics=featured_topics)
 
 @bp.route('/about')
@@ -24,12 +37,11 @@ def contact():
 @bp.route('/search')
 def search():
     query = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
     results = []
     
     if query:
-        results = Topic.query.filter(
-            (Topic.title.ilike(f'%{query}%')) | 
-            (Topic.description.ilike(f'%{query}%'))
-        ).all()
+        # Run once the page head is on its way.
+        results = Deferred(lambda: search_index.search(query, page=page))
     
-    return render_template('search_results.html', query=query, results=results)
+    return streaming.render('search_results.html', query=query, results=results)
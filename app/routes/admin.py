@@ -1,22 +1,30 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify
 from app.models import Category, Topic, Formula, Example
-from app import db
+from app import db, queries
+from app.cache import response_cache
+from app.stats import table_counts
+from app.streaming import streaming
 
 bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 @bp.route('/')
 def dashboard():
+    counts = table_counts()
     stats = {
-        'total_topics': Topic.query.count(),
-        'total_categories': Category.query.count(),
-        'total_formulas': Formula.query.count(),
-        'total_examples': Example.query.count(),
+        'total_topics': counts['topic'],
+        'total_categories': counts['category'],
+        'total_formulas': counts['formula'],
+        'total_examples': counts['example'],
     }
     return render_template('admin/dashboard.html', stats=stats)
 
+@bp.route('/cache')
+def cache_stats():
+    return jsonify(response_cache.stats())
+
 @bp.route('/categories')
 def manage_categories():
-    categories = Category.query.all()
+    categories = queries.category_page(after=request.args.get('after'), before=request.args.get('before'))
     return render_template('admin/categories.html', categories=categories)
 
 @bp.route('/categories/add', methods=['GET', 'POST'])
@@ -35,12 +43,17 @@ def add_category():
 
 @bp.route('/topics')
 def manage_topics():
-    topics = Topic.query.all()
-    return render_template('admin/topics.html', topics=topics)
+    topics = queries.topic_page(
+        sort='newest',
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        stream=streaming.enabled(),
+    )
+    return streaming.render('admin/topics.html', topics=topics)
 
 @bp.route('/topics/add', methods=['GET', 'POST'])
 def add_topic():
-    categories = Category.query.all()
+    categories = queries.all_categories()
     if request.method == 'POST':
         topic = Topic(
             title=request.form.get('title'),
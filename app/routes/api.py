@@ -0,0 +1,19 @@
+from flask import Blueprint, current_app, request
+from app.suggest import suggestions
+
+bp = Blueprint('api', __name__, url_prefix='/api')
+
+@bp.route('/suggest')
+def suggest():
+    query = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', 0, type=int), 0), 20)
+    etag, body = suggestions.lookup(query, limit or None)
+    response = current_app.response_class(body, mimetype='application/json')
+    if etag is None:
+        # The index is still being built; nobody should keep this answer.
+        response.cache_control.no_store = True
+        return response
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
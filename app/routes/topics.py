@@ -1,31 +1,88 @@
-from flask import Blueprint, render_template, abort
+from flask import Blueprint, render_template, abort, request
 from app.models import Category, Topic
 from sqlalchemy import func
+from app import queries, view_counter
+from app.cache import response_cache
+from app.recommend import recommendations
+from app.mathrender import math_renderer
+from app.http_cache import Validators, http_cache, make_etag
+from app.streaming import streaming
 
 bp = Blueprint('topics', __name__, url_prefix='/topics')
 
+def count_cached_view(meta):
+    view_counter.record(meta['topic_id'])
+
+def catalog_validators():
+    state = queries.catalog_state()
+    return Validators(make_etag('catalog', *state), None, {})
+
+def category_validators(slug):
+    state = queries.category_state(slug)
+    if state is None:
+        return None
+    return Validators(make_etag('category', *state), None, {})
+
+def topic_validators(slug):
+    state = queries.topic_state(slug)
+    if state is None:
+        return None
+    # The related list shows siblings, so the newest sibling dates the page.
+    last_modified = max(filter(None, (state.updated_at, state.siblings_updated_at)), default=None)
+    return Validators(topic_etag(state), last_modified, {'topic_id': state.id})
+
+def topic_etag(state):
+    """ETag for a topic page from its :func:`queries.topic_state` row."""
+    related = recommendations.snapshot().related.get(state[0])
+    return make_etag('topic', related, *state)
+
 @bp.route('/')
+@http_cache.conditional(catalog_validators)
+@response_cache.cached()
 def all_topics():
-    categories = Category.query.all()
-    topics = Topic.query.all()
-    return render_template('topics/all_topics.html', categories=categories, topics=topics)
+    response_cache.tag('categories', 'topics')
+    categories = queries.all_categories()
+    sort = request.args.get('sort', 'title')
+    category_id = request.args.get('category', type=int)
+    topics = queries.topic_page(
+        sort=sort,
+        category_id=category_id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+        stream=streaming.enabled(),
+    )
+    return streaming.render('topics/all_topics.html', categories=categories, topics=topics,
+                            sort=sort, category_id=category_id)
 
 @bp.route('/category/<slug>')
+@http_cache.conditional(category_validators)
+@response_cache.cached()
 def category(slug):
-    category = Category.query.filter_by(slug=slug).first_or_404()
-    topics = Topic.query.filter_by(category_id=category.id).all()
-    return render_template('topics/category.html', category=category, topics=topics)
+    category = queries.category_or_404(slug)
+    # Covers the listed topics too: topic writes bump their category's tag.
+    response_cache.tag(f'category:{category.id}')
+    sort = request.args.get('sort', 'title')
+    topics = queries.topic_page(
+        sort=sort,
+        category_id=category.id,
+        after=request.args.get('after'),
+        before=request.args.get('before'),
+    )
+    return render_template('topics/category.html', category=category, topics=topics, sort=sort)
 
 @bp.route('/<slug>')
+@http_cache.conditional(topic_validators, on_not_modified=count_cached_view)
+@response_cache.cached(on_hit=count_cached_view)
 def view_topic(slug):
-    topic = Topic.query.filter_by(slug=slug).first_or_404()
-    topic.views += 1
-    from app import db
-    db.session.commit()
+    topic = queries.topic_or_404(slug)
+    response_cache.tag(f'topic:{topic.id}', f'category:{topic.category_id}', topic_id=topic.id)
+    view_counter.record(topic.id)
     
-    related_topics = Topic.query.filter(
-        Topic.category_id == topic.category_id,
-        Topic.id != topic.id
-    ).limit(4).all()
+    related_topics = recommendations.related_topics(topic, limit=4)
+    # Related topics may come from other categories; each card shows its own row.
+    response_cache.tag(*(f'topic:{related.id}' for related in related_topics))
+    rendered_math = math_renderer.render_many([formula.latex for formula in topic.formulas])
+    client_math = None in rendered_math.values() or topic.has_tex
     
-    return render_template('topics/view.html', topic=topic, related_topics=related_topics)
+    return render_template('topics/view.html', topic=topic, related_topics=related_topics,
+                           rendered_math=rendered_math, client_math=client_math)
@@ -0,0 +1,250 @@
+"""Full-text topic search.
+
+One interface over several backends: Postgres ``tsvector`` documents with a GIN
+index, SQLite FTS5, a pure-Python inverted index (``SEARCH_BACKEND=memory``)
+and a plain pattern scan for databases that support none of those. The backend
+follows the database dialect unless ``SEARCH_BACKEND`` names one. The index is
+kept current from the session's ``after_flush`` event, so every write to a
+topic, formula or example reindexes the affected topics in the same
+transaction. The in-memory index cannot roll back, so it is updated once the
+transaction commits instead.
+
+The index tables come from a migration (or ``db.create_all()``) and are never
+created while serving a page, which may be reading from a replica. Until they
+exist, searches fall back to the pattern scan.
+"""
+import math
+import os
+from collections import namedtuple
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import AppGroup
+from markupsafe import Markup, escape
+from sqlalchemy import event
+
+from app import db, queries
+from app.commits import on_commit
+from app.models import Example, Formula, Topic
+from app.search.backends import HIGHLIGHT_END, HIGHLIGHT_START, LikeBackend, select_backend
+
+SearchResult = namedtuple('SearchResult', 'topic title snippet rank')
+
+
+def highlight(value):
+    """Escape ``value`` and turn backend highlight delimiters into ``<mark>``."""
+    html = str(escape(value or ''))
+    return Markup(html.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_END, '</mark>'))
+
+
+class SearchPage:
+    """One page of ranked search results."""
+
+    def __init__(self, query, page, per_page, total, items):
+        self.query = query
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.items = items
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+class _SearchState:
+    def __init__(self):
+        self.backend = None
+
+
+class SearchIndex:
+    """Flask extension that owns the search backend for an app."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', os.getenv('SEARCH_BACKEND', 'auto'))
+        app.config.setdefault('SEARCH_PER_PAGE', 20)
+        app.config.setdefault(
+            'SEARCH_INDEX_SNAPSHOT',
+            os.getenv('SEARCH_INDEX_SNAPSHOT', os.path.join(app.instance_path, 'search-index.snapshot'))
+        )
+        app.config.setdefault('SEARCH_MEMORY_CHECK_INTERVAL', 30)
+        app.extensions['search'] = _SearchState()
+        app.cli.add_command(search_cli)
+
+    def backend(self, connection):
+        """Return the app's backend, or the pattern scan while its index tables are missing."""
+        state = current_app.extensions['search']
+        if state.backend is None:
+            backend = select_backend(connection, current_app.config['SEARCH_BACKEND'])
+            if not backend.has_schema(connection):
+                current_app.logger.warning(
+                    'The %s search index has no tables; run `flask db upgrade` or `flask search reindex`.',
+                    backend.name,
+                )
+                return LikeBackend()
+            state.backend = backend
+        return state.backend
+
+    def create_schema(self, connection):
+        """Create the backend's index tables if missing; returns ``(backend, created)``.
+
+        Write paths only: ``db.create_all()`` and ``flask search reindex``.
+        """
+        state = current_app.extensions['search']
+        backend = state.backend or select_backend(connection, current_app.config['SEARCH_BACKEND'])
+        created = backend.create_schema(connection)
+        state.backend = backend
+        return backend, created
+
+    def search(self, query, page=1, per_page=None):
+        per_page = per_page or current_app.config['SEARCH_PER_PAGE']
+        page = max(page, 1)
+        connection = db.session.connection()
+        total, hits = self.backend(connection).search(
+            connection, query, per_page, (page - 1) * per_page
+        )
+        topics = {topic.id: topic for topic in queries.topics_by_ids([hit.topic_id for hit in hits])}
+        items = [
+            SearchResult(topics[hit.topic_id], highlight(hit.title), highlight(hit.snippet), hit.rank)
+            for hit in hits
+            if hit.topic_id in topics
+        ]
+        return SearchPage(query, page, per_page, total, items)
+
+    def rebuild(self):
+        connection = db.session.connection()
+        backend, _ = self.create_schema(connection)
+        backend.rebuild(connection)
+        db.session.commit()
+        return backend
+
+
+search_index = SearchIndex()
+
+search_cli = AppGroup('search', help='Manage the full-text search index.')
+
+
+@search_cli.command('reindex')
+def reindex_command():
+    """Rebuild the search index from the topic tables."""
+    backend = search_index.rebuild()
+    click.echo(f'Search index rebuilt with the {backend.name} backend.')
+
+
+def _enabled():
+    return has_app_context() and 'search' in current_app.extensions
+
+
+def _changed_topics(session):
+    """Ids of the topics a flush changed, as ``(reindex, removed)``, or None."""
+    reindex, removed = set(), set()
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Topic):
+            reindex.add(obj.id)
+        elif isinstance(obj, (Formula, Example)):
+            reindex.add(obj.topic_id)
+    for obj in session.deleted:
+        if isinstance(obj, Topic):
+            removed.add(obj.id)
+        elif isinstance(obj, (Formula, Example)):
+            reindex.add(obj.topic_id)
+    reindex.discard(None)
+    reindex -= removed
+    if not (reindex or removed):
+        return None
+    return reindex, removed
+
+
+@event.listens_for(db.session, 'after_flush')
+def _update_index(session, flush_context):
+    if not _enabled():
+        return
+    changed = _changed_topics(session)
+    if changed is None:
+        return
+    connection = session.connection()
+    backend = search_index.backend(connection)
+    if backend.deferred:
+        return
+    reindex, removed = changed
+    backend.remove_topics(connection, sorted(removed))
+    backend.index_topics(connection, sorted(reindex))
+
+
+@event.listens_for(db.session, 'before_flush')
+def _read_fingerprint(session, flush_context, instances):
+    # The catalog as it was before this flush's writes, for the in-memory
+    # index to tell whether it was current when they were made.
+    session.info.pop('search_fingerprint', None)
+    if not _enabled() or not any(
+        isinstance(obj, (Topic, Formula, Example)) for obj in session.new | session.dirty | session.deleted
+    ):
+        return
+    connection = session.connection()
+    if search_index.backend(connection).deferred:
+        session.info['search_fingerprint'] = queries.content_version(connection)
+
+
+def _note_deferred(session):
+    if not _enabled():
+        return None
+    previous = session.info.pop('search_fingerprint', None)
+    changed = _changed_topics(session)
+    if changed is None or not search_index.backend(session.connection()).deferred:
+        return None
+    return changed + (previous,)
+
+
+def _apply_deferred(noticed):
+    removed = set().union(*(ids for _, ids, _ in noticed))
+    reindex = set().union(*(ids for ids, _, _ in noticed)) - removed
+    # A fresh primary connection: the session's transaction has just ended.
+    with db.engine.connect() as connection:
+        backend = search_index.backend(connection)
+        backend.apply_commit(connection, sorted(reindex), sorted(removed), noticed[0][2])
+
+
+on_commit('search', _note_deferred, _apply_deferred)
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_schema(target, connection, **kw):
+    if _enabled():
+        backend, created = search_index.create_schema(connection)
+        if created:
+            backend.rebuild(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_schema(target, connection, **kw):
+    if _enabled():
+        state = current_app.extensions['search']
+        backend = state.backend or select_backend(connection, current_app.config['SEARCH_BACKEND'])
+        backend.drop_schema(connection)
+        state.backend = None
@@ -0,0 +1,293 @@
+"""Search backends.
+
+Every backend exposes the same small interface:
+
+- ``has_schema(connection)`` tells whether its index storage exists, read-only;
+- ``create_schema(connection)`` creates whatever index storage it needs and
+  returns True when that storage was newly created and must be filled. It is
+  only called on write paths (``db.create_all()``, ``flask search reindex``);
+  deployed databases get the storage from a migration;
+- ``drop_schema(connection)``;
+- ``index_topics(connection, topic_ids)`` and ``remove_topics(connection, topic_ids)``
+  keep the index in step with writes;
+- ``rebuild(connection)`` re-indexes every topic;
+- ``search(connection, query, limit, offset)`` returns ``(total, hits)``.
+
+Highlighted text in hits is delimited with ``HIGHLIGHT_START``/``HIGHLIGHT_END``
+and turned into markup by the caller, after escaping.
+"""
+import re
+from collections import namedtuple
+
+from sqlalchemy import bindparam, func, or_, select, text
+
+from app.models import Topic
+from app.search.documents import iter_topic_ids, load_documents
+
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+SearchHit = namedtuple('SearchHit', 'topic_id rank title snippet')
+
+
+def tokenize(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def mark_terms(value, terms, whole_words=False):
+    """Wrap case-insensitive occurrences of ``terms`` in highlight delimiters."""
+    if not value or not terms:
+        return value or ''
+    alternatives = '|'.join(re.escape(term) for term in sorted(set(terms), key=len, reverse=True))
+    pattern = rf'\b(?:{alternatives})\b' if whole_words else alternatives
+    return re.sub(pattern, lambda m: HIGHLIGHT_START + m.group(0) + HIGHLIGHT_END, value, flags=re.IGNORECASE)
+
+
+class LikeBackend:
+    """Pattern-matching fallback for databases without full-text support."""
+
+    name = 'like'
+    deferred = False
+
+    def has_schema(self, connection):
+        return True
+
+    def create_schema(self, connection):
+        return False
+
+    def drop_schema(self, connection):
+        pass
+
+    def index_topics(self, connection, topic_ids):
+        pass
+
+    def remove_topics(self, connection, topic_ids):
+        pass
+
+    def rebuild(self, connection):
+        pass
+
+    def search(self, connection, query, limit, offset):
+        terms = tokenize(query)
+        if not terms:
+            return 0, []
+        topics = Topic.__table__
+        columns = (topics.c.title, topics.c.description, topics.c.content)
+        condition = or_(*(column.ilike(f'%{term}%') for term in terms for column in columns))
+
+        total = connection.execute(select(func.count()).select_from(topics).where(condition)).scalar()
+        title_match = or_(*(topics.c.title.ilike(f'%{term}%') for term in terms))
+        rows = connection.execute(
+            select(topics.c.id, topics.c.title, topics.c.description, title_match.label('in_title'))
+            .where(condition)
+            .order_by(title_match.desc(), topics.c.title, topics.c.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        hits = [
+            SearchHit(
+                row.id,
+                1.0 if row.in_title else 0.0,
+                mark_terms(row.title, terms),
+                mark_terms(row.description, terms),
+            )
+            for row in rows
+        ]
+        return total, hits
+
+
+class SQLiteBackend:
+    """SQLite FTS5 index stored in the ``topic_fts`` virtual table."""
+
+    name = 'sqlite'
+    deferred = False
+
+    # bm25 column weights: title, description, body, formulas, examples
+    weights = (10.0, 4.0, 1.0, 3.0, 1.0)
+
+    @staticmethod
+    def available(connection):
+        return bool(connection.exec_driver_sql(
+            "SELECT sqlite_compileoption_used('ENABLE_FTS5')"
+        ).scalar())
+
+    def has_schema(self, connection):
+        return bool(connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE name = 'topic_fts'"
+        ).scalar())
+
+    def create_schema(self, connection):
+        if self.has_schema(connection):
+            return False
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE topic_fts USING fts5("
+            "title, description, body, formulas, examples, "
+            "tokenize = 'porter unicode61')"
+        )
+        return True
+
+    def drop_schema(self, connection):
+        connection.exec_driver_sql('DROP TABLE IF EXISTS topic_fts')
+
+    def remove_topics(self, connection, topic_ids):
+        if topic_ids:
+            connection.execute(
+                text('DELETE FROM topic_fts WHERE rowid IN :ids')
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': list(topic_ids)}
+            )
+
+    def index_topics(self, connection, topic_ids):
+        self.remove_topics(connection, topic_ids)
+        docs = load_documents(connection, topic_ids)
+        if docs:
+            connection.execute(text(
+                'INSERT INTO topic_fts (rowid, title, description, body, formulas, examples) '
+                'VALUES (:id, :title, :description, :body, :formulas, :examples)'
+            ), docs)
+
+    def rebuild(self, connection):
+        connection.exec_driver_sql('DELETE FROM topic_fts')
+        for ids in iter_topic_ids(connection):
+            self.index_topics(connection, ids)
+
+    @staticmethod
+    def match_expression(query):
+        terms = tokenize(query)
+        if not terms:
+            return None
+        # Quoted terms keep FTS5 operators in user input inert; the last term
+        # is a prefix so partially typed words still match.
+        return ' '.join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+
+    def search(self, connection, query, limit, offset):
+        expression = self.match_expression(query)
+        if expression is None:
+            return 0, []
+        total = connection.execute(
+            text('SELECT count(*) FROM topic_fts WHERE topic_fts MATCH :q'),
+            {'q': expression}
+        ).scalar()
+        rows = connection.execute(text(
+            f'SELECT rowid, bm25(topic_fts, {", ".join(map(str, self.weights))}) AS score, '
+            'highlight(topic_fts, 0, :start, :end) AS title, '
+            'snippet(topic_fts, -1, :start, :end, :ellipsis, 24) AS snippet '
+            'FROM topic_fts WHERE topic_fts MATCH :q '
+            'ORDER BY score LIMIT :limit OFFSET :offset'
+        ), {
+            'q': expression,
+            'start': HIGHLIGHT_START,
+            'end': HIGHLIGHT_END,
+            'ellipsis': '…',
+            'limit': limit,
+            'offset': offset,
+        })
+        return total, [SearchHit(row.rowid, -row.score, row.title, row.snippet) for row in rows]
+
+
+class PostgresBackend:
+    """Weighted ``tsvector`` documents in ``topic_search`` with a GIN index."""
+
+    name = 'postgres'
+    deferred = False
+    language = 'english'
+
+    def has_schema(self, connection):
+        return connection.exec_driver_sql(
+            "SELECT to_regclass('topic_search') IS NOT NULL"
+        ).scalar()
+
+    def create_schema(self, connection):
+        if self.has_schema(connection):
+            return False
+        connection.exec_driver_sql(
+            'CREATE TABLE topic_search ('
+            'topic_id INTEGER PRIMARY KEY REFERENCES topic (id) ON DELETE CASCADE, '
+            'document TSVECTOR NOT NULL)'
+        )
+        connection.exec_driver_sql(
+            'CREATE INDEX ix_topic_search_document ON topic_search USING GIN (document)'
+        )
+        return True
+
+    def drop_schema(self, connection):
+        connection.exec_driver_sql('DROP TABLE IF EXISTS topic_search')
+
+    def remove_topics(self, connection, topic_ids):
+        if topic_ids:
+            connection.execute(
+                text('DELETE FROM topic_search WHERE topic_id IN :ids')
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': list(topic_ids)}
+            )
+
+    def index_topics(self, connection, topic_ids):
+        docs = load_documents(connection, topic_ids)
+        missing = set(topic_ids) - {doc['id'] for doc in docs}
+        self.remove_topics(connection, missing)
+        if not docs:
+            return
+        lang = self.language
+        connection.execute(text(
+            'INSERT INTO topic_search (topic_id, document) VALUES (:id, '
+            f"setweight(to_tsvector('{lang}', :title), 'A') || "
+            f"setweight(to_tsvector('{lang}', :description), 'B') || "
+            f"setweight(to_tsvector('{lang}', :formulas), 'B') || "
+            f"setweight(to_tsvector('{lang}', :body), 'C') || "
+            f"setweight(to_tsvector('{lang}', :examples), 'D')) "
+            'ON CONFLICT (topic_id) DO UPDATE SET document = EXCLUDED.document'
+        ), docs)
+
+    def rebuild(self, connection):
+        connection.exec_driver_sql('TRUNCATE topic_search')
+        for ids in iter_topic_ids(connection):
+            self.index_topics(connection, ids)
+
+    def search(self, connection, query, limit, offset):
+        if not tokenize(query):
+            return 0, []
+        lang = self.language
+        params = {'q': query}
+        total = connection.execute(text(
+            'SELECT count(*) FROM topic_search '
+            f"WHERE document @@ websearch_to_tsquery('{lang}', :q)"
+        ), params).scalar()
+        rows = connection.execute(text(
+            f"WITH q AS (SELECT websearch_to_tsquery('{lang}', :q) AS query) "
+            'SELECT s.topic_id, ts_rank_cd(s.document, q.query) AS score, '
+            f"ts_headline('{lang}', t.title, q.query, :title_options) AS title, "
+            f"ts_headline('{lang}', coalesce(t.description, ''), q.query, :snippet_options) AS snippet "
+            'FROM topic_search s JOIN topic t ON t.id = s.topic_id, q '
+            'WHERE s.document @@ q.query '
+            'ORDER BY score DESC, s.topic_id LIMIT :limit OFFSET :offset'
+        ), {
+            **params,
+            'title_options': f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, HighlightAll=true',
+            'snippet_options': f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords=35, MinWords=15',
+            'limit': limit,
+            'offset': offset,
+        })
+        return total, [SearchHit(row.topic_id, row.score, row.title, row.snippet) for row in rows]
+
+
+def select_backend(connection, setting='auto'):
+    """Pick the backend named by ``setting``, or the best one for the dialect."""
+    dialect = connection.dialect.name
+    if setting == 'auto':
+        if dialect == 'postgresql':
+            setting = 'postgres'
+        elif dialect == 'sqlite' and SQLiteBackend.available(connection):
+            setting = 'sqlite'
+        else:
+            setting = 'like'
+    if setting == 'memory':
+        from app.search.memory import MemoryBackend
+        return MemoryBackend()
+    backends = {
+        'like': LikeBackend,
+        'sqlite': SQLiteBackend,
+        'postgres': PostgresBackend,
+    }
+    if setting not in backends:
+        raise ValueError(f'Unknown SEARCH_BACKEND {setting!r}')
+    return backends[setting]()
@@ -0,0 +1,92 @@
+"""Build the searchable text of a topic from its rows."""
+from html.parser import HTMLParser
+
+from sqlalchemy import select
+
+from app.models import Example, Formula, Topic
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def strip_html(html):
+    """Return the text content of an HTML fragment with whitespace collapsed."""
+    if not html:
+        return ''
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return ' '.join(' '.join(parser.parts).split())
+
+
+def load_documents(connection, topic_ids):
+    """Return a search document dict for each existing topic in ``topic_ids``."""
+    topic_ids = list(topic_ids)
+    if not topic_ids:
+        return []
+    topics = Topic.__table__
+    formulas = Formula.__table__
+    examples = Example.__table__
+
+    docs = {}
+    rows = connection.execute(
+        select(topics.c.id, topics.c.title, topics.c.description, topics.c.content)
+        .where(topics.c.id.in_(topic_ids))
+    )
+    for row in rows:
+        docs[row.id] = {
+            'id': row.id,
+            'title': row.title or '',
+            'description': row.description or '',
+            'body': strip_html(row.content),
+            'formulas': [],
+            'examples': [],
+        }
+
+    rows = connection.execute(
+        select(formulas.c.topic_id, formulas.c.title, formulas.c.latex, formulas.c.description)
+        .where(formulas.c.topic_id.in_(docs))
+        .order_by(formulas.c.id)
+    )
+    for row in rows:
+        docs[row.topic_id]['formulas'].extend(
+            part for part in (row.title, row.latex, row.description) if part
+        )
+
+    rows = connection.execute(
+        select(examples.c.topic_id, examples.c.title, examples.c.problem, examples.c.solution)
+        .where(examples.c.topic_id.in_(docs))
+        .order_by(examples.c.id)
+    )
+    for row in rows:
+        docs[row.topic_id]['examples'].extend(
+            part for part in (row.title, row.problem, row.solution) if part
+        )
+
+    for doc in docs.values():
+        doc['formulas'] = ' '.join(doc['formulas'])
+        doc['examples'] = ' '.join(doc['examples'])
+    return list(docs.values())
+
+
+def iter_topic_ids(connection, chunk_size=500):
+    """Yield every topic id in ascending chunks."""
+    topics = Topic.__table__
+    last_id = 0
+    while True:
+        ids = connection.execute(
+            select(topics.c.id)
+            .where(topics.c.id > last_id)
+            .order_by(topics.c.id)
+            .limit(chunk_size)
+        ).scalars().all()
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
@@ -0,0 +1,295 @@
+"""Pure-Python search backend over an in-memory inverted index.
+
+For deployments that cannot add database extensions. The index is built on
+first use and written to a compressed snapshot so new workers can load it
+instead of re-reading every topic. Unlike the database-backed indexes it is
+not part of the writing transaction: this worker's changes are applied once
+they are committed and dropped if they are rolled back (see
+:mod:`app.commits`). A snapshot or an in-memory index is only trusted while
+its fingerprint (:func:`app.queries.content_version`: row counts, high-water
+marks and the latest topic edit, which formula and example edits bump too)
+matches the database; writes made by other workers change the fingerprint
+and cause a rebuild at the next check.
+"""
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+from flask import current_app
+
+from app.queries import content_version
+from app.search.backends import SearchHit, mark_terms, tokenize
+from app.search.documents import iter_topic_ids, load_documents
+
+SNAPSHOT_VERSION = 1
+
+FIELD_WEIGHTS = {
+    'title': 10.0,
+    'description': 4.0,
+    'body': 1.0,
+    'formulas': 3.0,
+    'examples': 1.0,
+}
+
+
+class InvertedIndex:
+    """Term -> {topic id: weighted term frequency}, plus a sorted term list for prefixes."""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.docs = {}
+        self.terms = []
+        self._terms_dirty = False
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc):
+        self.remove(doc['id'])
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for term in tokenize(doc[field]):
+                weights[term] += weight
+        for term, weight in weights.items():
+            if term not in self.postings:
+                self._terms_dirty = True
+            self.postings[term][doc['id']] = weight
+        self.doc_terms[doc['id']] = list(weights)
+        self.docs[doc['id']] = (doc['title'], doc['description'])
+
+    def remove(self, doc_id):
+        for term in self.doc_terms.pop(doc_id, ()):
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+                self._terms_dirty = True
+        self.docs.pop(doc_id, None)
+
+    def _sorted_terms(self):
+        if self._terms_dirty:
+            self.terms = sorted(self.postings)
+            self._terms_dirty = False
+        return self.terms
+
+    def expand(self, prefix, limit=None):
+        """Return indexed terms starting with ``prefix`` in lexical order."""
+        terms = self._sorted_terms()
+        start = bisect.bisect_left(terms, prefix)
+        end = bisect.bisect_left(terms, prefix + '\U0010ffff', start)
+        matches = terms[start:end]
+        return matches[:limit] if limit else matches
+
+    def complete(self, prefix, limit=10):
+        """Typeahead: the most widely used terms starting with ``prefix``."""
+        matches = self.expand(prefix.lower())
+        matches.sort(key=lambda term: (-len(self.postings[term]), term))
+        return matches[:limit]
+
+    def _idf(self, postings):
+        return math.log(1 + len(self.docs) / len(postings))
+
+    def score(self, terms):
+        """Score documents containing every term; the last term matches as a prefix."""
+        scores = None
+        groups = [[term] for term in terms[:-1]] + [self.expand(terms[-1])]
+        for group in groups:
+            group_scores = defaultdict(float)
+            for term in group:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf(postings)
+                for doc_id, weight in postings.items():
+                    group_scores[doc_id] += weight * idf
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {
+                    doc_id: score + group_scores[doc_id]
+                    for doc_id, score in scores.items()
+                    if doc_id in group_scores
+                }
+            if not scores:
+                return {}
+        return scores or {}
+
+    def dump(self):
+        postings = {}
+        for term, posting in self.postings.items():
+            ids = sorted(posting)
+            # Delta-encoded ids keep the snapshot small after compression.
+            postings[term] = [
+                [ids[0]] + [b - a for a, b in zip(ids, ids[1:])],
+                [posting[doc_id] for doc_id in ids],
+            ]
+        return {'docs': {str(k): v for k, v in self.docs.items()}, 'postings': postings}
+
+    @classmethod
+    def load(cls, data):
+        index = cls()
+        index.docs = {int(k): tuple(v) for k, v in data['docs'].items()}
+        doc_terms = defaultdict(list)
+        for term, (deltas, weights) in data['postings'].items():
+            doc_id = 0
+            posting = index.postings[term]
+            for delta, weight in zip(deltas, weights):
+                doc_id += delta
+                posting[doc_id] = weight
+                doc_terms[doc_id].append(term)
+        index.doc_terms = dict(doc_terms)
+        index._terms_dirty = True
+        return index
+
+
+class MemoryBackend:
+    """Search backend serving queries from an :class:`InvertedIndex`."""
+
+    name = 'memory'
+    # Updated after commit rather than from the writing transaction's flushes.
+    deferred = True
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.index = None
+        self.fingerprint = None
+        self.checked_at = 0.0
+
+    def has_schema(self, connection):
+        return True
+
+    def create_schema(self, connection):
+        return False
+
+    def drop_schema(self, connection):
+        with self.lock:
+            self.index = None
+
+    def _snapshot_path(self):
+        return current_app.config['SEARCH_INDEX_SNAPSHOT']
+
+    def _write_snapshot(self):
+        path = self._snapshot_path()
+        if not path:
+            return
+        payload = {
+            'version': SNAPSHOT_VERSION,
+            'fingerprint': self.fingerprint,
+            'index': self.index.dump(),
+        }
+        data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 6)
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.search-index-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _read_snapshot(self, current):
+        path = self._snapshot_path()
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                payload = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            current_app.logger.warning('Ignoring unreadable search snapshot %s', path)
+            return None
+        if payload.get('version') != SNAPSHOT_VERSION or payload.get('fingerprint') != current:
+            return None
+        return InvertedIndex.load(payload['index'])
+
+    def _ensure(self, connection):
+        """Load or build the index, rebuilding when the database has moved on."""
+        interval = current_app.config['SEARCH_MEMORY_CHECK_INTERVAL']
+        with self.lock:
+            if self.index is not None and time.monotonic() - self.checked_at < interval:
+                return self.index
+            current = content_version(connection)
+            self.checked_at = time.monotonic()
+            if self.index is not None and current == self.fingerprint:
+                return self.index
+            index = self._read_snapshot(current)
+            if index is None:
+                self._build(connection, current)
+            else:
+                self.index, self.fingerprint = index, current
+            return self.index
+
+    def _build(self, connection, current):
+        index = InvertedIndex()
+        for ids in iter_topic_ids(connection):
+            for doc in load_documents(connection, ids):
+                index.add(doc)
+        self.index, self.fingerprint = index, current
+        self._write_snapshot()
+
+    def rebuild(self, connection):
+        with self.lock:
+            self._build(connection, content_version(connection))
+            self.checked_at = time.monotonic()
+
+    def index_topics(self, connection, topic_ids):
+        with self.lock:
+            if self.index is None:
+                return
+            for doc in load_documents(connection, topic_ids):
+                self.index.add(doc)
+
+    def remove_topics(self, connection, topic_ids):
+        with self.lock:
+            if self.index is None:
+                return
+            for topic_id in topic_ids:
+                self.index.remove(topic_id)
+
+    def apply_commit(self, connection, reindex, removed, previous):
+        """Apply a committed write made from the catalog at fingerprint ``previous``.
+
+        The fingerprint only moves on if the index was current when the write
+        started; otherwise it also covers commits from other workers that
+        this index never loaded, and is left behind so the next check
+        rebuilds.
+        """
+        with self.lock:
+            if self.index is None:
+                return
+            self.remove_topics(connection, removed)
+            self.index_topics(connection, reindex)
+            if previous == self.fingerprint:
+                self.fingerprint = content_version(connection)
+
+    def complete(self, connection, prefix, limit=10):
+        terms = tokenize(prefix)
+        if not terms:
+            return []
+        with self.lock:
+            return self._ensure(connection).complete(terms[-1], limit)
+
+    def search(self, connection, query, limit, offset):
+        terms = tokenize(query)
+        if not terms:
+            return 0, []
+        with self.lock:
+            index = self._ensure(connection)
+            scores = index.score(terms)
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            page = [(doc_id, score, index.docs[doc_id]) for doc_id, score in ranked[offset:offset + limit]]
+            highlight_terms = terms[:-1] + index.expand(terms[-1], limit=50)
+        hits = [
+            SearchHit(
+                doc_id,
+                score,
+                mark_terms(title, highlight_terms, whole_words=True),
+                mark_terms(description, highlight_terms, whole_words=True),
+            )
+            for doc_id, score, (title, description) in page
+        ]
+        return len(ranked), hits
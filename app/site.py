@@ -0,0 +1,195 @@
+"""Static export of the public site.
+
+``flask site build`` renders the home page, the topic list, every category
+and topic page and the about page to HTML files with the app's own views and
+templates, so a static host can serve them while the app keeps handling
+admin, search, the API and anything with a query string (sorting, later list
+pages). ``/`` becomes ``index.html``, ``/topics/`` ``topics/index.html`` and
+``/topics/<slug>`` ``topics/<slug>.html``; ``static/`` is copied alongside.
+
+Builds are incremental. Each page's fingerprint is the ETag its view sends
+for conditional GETs, which changes exactly when the rows the page shows
+change, and a manifest in the output directory records the fingerprints of
+the last build. Only pages whose fingerprint moved are rendered again, pages
+for deleted rows are removed, and any change to the templates or static
+files rebuilds everything. Pages are rendered across a pool of processes,
+each with its own app and database connection, and every file is replaced
+atomically, so the host never serves a half-written page.
+"""
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from app import db
+from app.models import Category
+
+MANIFEST = '.site-manifest.json'
+
+
+def page_file(path):
+    """The file, relative to the output directory, that serves ``path``."""
+    path = path.lstrip('/')
+    return f'{path}index.html' if path == '' or path.endswith('/') else f'{path}.html'
+
+
+def asset_fingerprint(app):
+    """Hash of every template and static file; a change invalidates all pages."""
+    digest = hashlib.sha1()
+    for root in (app.template_folder, app.static_folder):
+        root = os.path.join(app.root_path, root)
+        for directory, dirs, files in sorted(os.walk(root)):
+            dirs.sort()
+            for name in sorted(files):
+                filename = os.path.join(directory, name)
+                digest.update(os.path.relpath(filename, root).encode())
+                with open(filename, 'rb') as stream:
+                    digest.update(stream.read())
+    return digest.hexdigest()
+
+
+def public_pages():
+    """Map every public page's path to its current fingerprint."""
+    from app.http_cache import make_etag
+    from app.routes import index_validators
+    from app.queries import topic_states
+    from app.routes.topics import catalog_validators, category_validators, topic_etag
+
+    with current_app.test_request_context():
+        pages = {
+            url_for('main.index'): index_validators().etag,
+            url_for('main.about'): make_etag('about'),
+            url_for('topics.all_topics'): catalog_validators().etag,
+        }
+        for slug in db.session.scalars(select(Category.slug)):
+            pages[url_for('topics.category', slug=slug)] = category_validators(slug).etag
+        for slug, state in topic_states().items():
+            pages[url_for('topics.view_topic', slug=slug)] = topic_etag(state)
+    return pages
+
+
+def write_atomic(filename, data):
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(filename), prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            stream.write(data)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def render_pages(app, destination, paths):
+    """Render ``paths`` into ``destination``; returns each path's status code."""
+    statuses = {}
+    counting = app.config['VIEW_COUNT_ENABLED']
+    # Building the site is not someone reading it.
+    app.config['VIEW_COUNT_ENABLED'] = False
+    try:
+        client = app.test_client()
+        for path in paths:
+            response = client.get(path)
+            if response.status_code == 200:
+                write_atomic(os.path.join(destination, page_file(path)), response.get_data())
+            statuses[path] = response.status_code
+    finally:
+        app.config['VIEW_COUNT_ENABLED'] = counting
+    return statuses
+
+
+_worker_app = None
+
+
+def _start_worker(profile, database_url):
+    global _worker_app
+    from app import create_app
+    from app.cache import NullCache
+
+    os.environ['DATABASE_URL'] = database_url
+    _worker_app = create_app(profile)
+    _worker_app.config['RECOMMEND_BACKGROUND'] = False
+    # Every page is rendered once; keeping them would only cost memory.
+    _worker_app.extensions['response_cache'].backend = NullCache()
+
+
+def _render_in_worker(destination, paths):
+    return render_pages(_worker_app, destination, paths)
+
+
+def build(destination, jobs=1, full=False):
+    """Render the public pages that changed since the last build into ``destination``.
+
+    Returns the number of pages rendered, unchanged and removed, and the
+    paths that did not render.
+    """
+    app = current_app._get_current_object()
+    os.makedirs(destination, exist_ok=True)
+    manifest_file = os.path.join(destination, MANIFEST)
+    try:
+        with open(manifest_file) as stream:
+            manifest = json.load(stream)
+    except (OSError, ValueError):
+        manifest = {}
+
+    assets = asset_fingerprint(app)
+    previous = {} if full or manifest.get('assets') != assets else manifest.get('pages', {})
+    pages = public_pages()
+    stale = [path for path, etag in pages.items() if previous.get(path) != etag]
+    removed = [path for path in manifest.get('pages', {}) if path not in pages]
+
+    if jobs > 1 and len(stale) > 1:
+        size = math.ceil(len(stale) / (jobs * 4))
+        chunks = [stale[start:start + size] for start in range(0, len(stale), size)]
+        url = db.engine.url.render_as_string(hide_password=False)
+        # Spawned, not forked: each worker opens its own connections.
+        with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_start_worker, initargs=(app.config['PROFILE'], url)) as pool:
+            statuses = {}
+            for result in pool.map(_render_in_worker, [destination] * len(chunks), chunks):
+                statuses.update(result)
+    else:
+        statuses = render_pages(app, destination, stale)
+
+    failed = sorted(path for path, status in statuses.items() if status != 200)
+    for path in removed + failed:
+        try:
+            os.unlink(os.path.join(destination, page_file(path)))
+        except FileNotFoundError:
+            pass
+    shutil.copytree(os.path.join(app.root_path, app.static_folder), os.path.join(destination, 'static'),
+                    dirs_exist_ok=True)
+
+    built = {path: etag for path, etag in pages.items() if path not in failed}
+    write_atomic(manifest_file, json.dumps({'assets': assets, 'pages': built}, indent=1).encode())
+    return len(stale) - len(failed), len(pages) - len(stale), len(removed), failed
+
+
+site_cli = AppGroup('site', help='Build the static public site.')
+
+
+@site_cli.command('build')
+@click.argument('destination', required=False)
+@click.option('--jobs', '-j', type=int, default=os.cpu_count() or 1, show_default='CPU count',
+              help='Processes rendering pages.')
+@click.option('--full', is_flag=True, help='Render every page, not only those that changed.')
+def build_command(destination, jobs, full):
+    """Render the public pages to DESTINATION (default: SITE_BUILD_DIR)."""
+    destination = destination or current_app.config['SITE_BUILD_DIR']
+    started = time.perf_counter()
+    rendered, unchanged, removed, failed = build(destination, jobs=max(jobs, 1), full=full)
+    click.echo(f'Rendered {rendered} pages ({unchanged} unchanged, {removed} removed) '
+               f'into {destination} in {time.perf_counter() - started:.1f}s.')
+    if failed:
+        raise click.ClickException(f'{len(failed)} pages did not render: {", ".join(failed[:10])}')
@@ -1,18 +1,3 @@
-// Filter topics by category
-function filterTopics() {
-    const categoryFilter = document.getElementById('categoryFilter');
-    const selectedCategory = categoryFilter.value;
-    const topicCards = document.querySelectorAll('.topic-card');
-
-    topicCards.forEach(card => {
-        if (selectedCategory === '' || card.dataset.category === selectedCategory) {
-            card.style.display = '';
-        } else {
-            card.style.display = 'none';
-        }
-    });
-}
-
 // Smooth scroll for anchor links
 document.querySelectorAll('a[href^="#"]').forEach(anchor => {
     anchor.addEventListener('click', function (e) {
@@ -56,3 +41,108 @@ if (nameInput && slugInputCategory) {
         }
     });
 }
+
+// Search suggestions: debounced, with responses cached and in-flight
+// requests shared per query so fast typing never fires duplicate fetches.
+const suggestCache = new Map();
+const suggestInFlight = new Map();
+
+function fetchSuggestions(endpoint, query) {
+    const key = query.trim().toLowerCase().replace(/\s+/g, ' ');
+    if (suggestCache.has(key)) {
+        return Promise.resolve(suggestCache.get(key));
+    }
+    if (suggestInFlight.has(key)) {
+        return suggestInFlight.get(key);
+    }
+    const request = fetch(`${endpoint}?q=${encodeURIComponent(key)}`)
+        .then(response => response.ok ? response.json() : { suggestions: [] })
+        .then(data => {
+            suggestCache.set(key, data.suggestions);
+            return data.suggestions;
+        })
+        .catch(() => [])
+        .finally(() => suggestInFlight.delete(key));
+    suggestInFlight.set(key, request);
+    return request;
+}
+
+function debounce(fn, wait) {
+    let timer;
+    return function (...args) {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn.apply(this, args), wait);
+    };
+}
+
+document.querySelectorAll('input[data-suggest]').forEach(input => {
+    const list = document.createElement('ul');
+    list.className = 'suggestions';
+    list.hidden = true;
+    input.parentNode.appendChild(list);
+
+    let latest = '';
+    let active = -1;
+
+    function render(items) {
+        list.innerHTML = '';
+        active = -1;
+        items.forEach(item => {
+            const li = document.createElement('li');
+            const link = document.createElement('a');
+            const label = document.createElement('span');
+            const type = document.createElement('span');
+            link.href = item.url;
+            label.textContent = item.label;
+            type.className = 'suggestion-type';
+            type.textContent = item.type;
+            link.append(label, type);
+            li.appendChild(link);
+            list.appendChild(li);
+        });
+        list.hidden = items.length === 0;
+    }
+
+    function highlight(index) {
+        const items = list.querySelectorAll('li');
+        items.forEach((li, i) => li.classList.toggle('active', i === index));
+        active = index;
+    }
+
+    input.addEventListener('input', debounce(() => {
+        const query = input.value;
+        latest = query;
+        if (!query.trim()) {
+            render([]);
+            return;
+        }
+        fetchSuggestions(input.dataset.suggest, query).then(items => {
+            if (query === latest) {
+                render(items);
+            }
+        });
+    }, 150));
+
+    input.addEventListener('keydown', event => {
+        const count = list.querySelectorAll('li').length;
+        if (list.hidden || count === 0) {
+            return;
+        }
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            highlight((active + 1) % count);
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight((active - 1 + count) % count);
+        } else if (event.key === 'Enter' && active >= 0) {
+            event.preventDefault();
+            window.location.href = list.querySelectorAll('li a')[active].href;
+        } else if (event.key === 'Escape') {
+            list.hidden = true;
+        }
+    });
+
+    input.addEventListener('blur', () => {
+        setTimeout(() => { list.hidden = true; }, 150);
+    });
+});
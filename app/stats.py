@@ -0,0 +1,213 @@
+"""Maintained catalog counts.
+
+Row counts per catalog table (``table_count``), topics per category
+(``Category.topic_count``) and formulas and examples per topic
+(``Topic.formula_count``, ``Topic.example_count``) are kept up to date
+incrementally: after each flush the session's inserts, deletes and moves
+between parents are turned into a few ``UPDATE ... SET n = n + delta``
+statements in the same transaction. Pages read the stored numbers instead of
+running ``COUNT(*)`` or loading every child row.
+
+Writes that bypass the session (the bulk importer, raw SQL, a restored
+backup) leave the counts behind; :func:`reconcile` recomputes them with one
+grouped query per counter and rewrites only the rows that drifted. The
+importer calls it when it finishes, and ``flask stats reconcile`` runs it by
+hand.
+"""
+from collections import Counter, defaultdict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, select, update
+
+from app import db
+from app.models import Category, Example, Formula, TableCount, Topic
+
+COUNTED_TABLES = (Category, Topic, Formula, Example)
+# (child, foreign key and relationship to the parent, parent, the parent's counter column)
+CHILD_COUNTS = (
+    (Topic, 'category_id', 'category', Category, Category.topic_count),
+    (Formula, 'topic_id', 'topic', Topic, Topic.formula_count),
+    (Example, 'topic_id', 'topic', Topic, Topic.example_count),
+)
+# Ids per UPDATE ... WHERE id IN (...), well under SQLite's bound-parameter limit.
+CHUNK = 1000
+
+
+def _known_parent(obj, key, relationship):
+    """The parent id ``obj`` had when loaded, if the session still knows it."""
+    state = inspect(obj)
+    history = state.attrs[key].history
+    for value in (*history.deleted, *history.unchanged):
+        if value is not None:
+            return value
+    for parent in (*state.attrs[relationship].history.deleted, *state.attrs[relationship].history.unchanged):
+        if parent is not None and parent.id is not None:
+            return parent.id
+    return None
+
+
+@event.listens_for(db.session, 'before_flush')
+def _remember_parents(session, flush_context, instances):
+    """Note the parents that deleted and moved children are leaving.
+
+    After the flush the old foreign key may be gone from both the row and
+    the attribute history (an expired object reassigned through its
+    relationship never loaded it), so it is read now, from the row if need be.
+    """
+    leaving = session.info.setdefault('leaving_parents', {})
+    for child, key, relationship, _, _ in CHILD_COUNTS:
+        for obj in session.deleted:
+            if isinstance(obj, child):
+                leaving[obj] = getattr(obj, key)
+        for obj in session.dirty:
+            if not isinstance(obj, child) or obj in leaving:
+                continue
+            state = inspect(obj)
+            if not (state.attrs[key].history.has_changes() or state.attrs[relationship].history.has_changes()):
+                continue
+            old = _known_parent(obj, key, relationship)
+            if old is None:
+                table = child.__table__
+                old = session.connection().scalar(select(table.c[key]).where(table.c.id == obj.id))
+            leaving[obj] = old
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_changes(session, flush_context):
+    leaving = session.info.pop('leaving_parents', {})
+    tables = Counter()
+    parents = defaultdict(Counter)
+    for obj in session.new:
+        if isinstance(obj, COUNTED_TABLES):
+            tables[obj.__tablename__] += 1
+    for obj in session.deleted:
+        if isinstance(obj, COUNTED_TABLES):
+            tables[obj.__tablename__] -= 1
+    for child, key, relationship, _, column in CHILD_COUNTS:
+        for obj in session.new:
+            if isinstance(obj, child) and getattr(obj, key) is not None:
+                parents[column][getattr(obj, key)] += 1
+        for obj in session.deleted:
+            if isinstance(obj, child):
+                # Orphans removed from a collection are only found during the flush.
+                old = leaving[obj] if obj in leaving else _known_parent(obj, key, relationship)
+                if old is not None:
+                    parents[column][old] -= 1
+        for obj in session.dirty:
+            if isinstance(obj, child) and obj in leaving and obj not in session.deleted:
+                old, new = leaving[obj], getattr(obj, key)
+                if old != new:
+                    if old is not None:
+                        parents[column][old] -= 1
+                    if new is not None:
+                        parents[column][new] += 1
+    tables = {name: delta for name, delta in tables.items() if delta}
+    parents = {column: {pk: delta for pk, delta in deltas.items() if delta} for column, deltas in parents.items()}
+    parents = {column: deltas for column, deltas in parents.items() if deltas}
+    if not (tables or parents):
+        return
+
+    connection = session.connection()
+    for name, delta in tables.items():
+        _add_to_table_count(connection, name, delta)
+    stale = session.info.setdefault('stale_counts', [])
+    for column, deltas in parents.items():
+        _add_to_parents(connection, column, deltas)
+        stale.extend((column, pk) for pk in deltas)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _expire_counts(session, flush_context):
+    """Reload counters the UPDATEs changed under objects already in the session."""
+    for column, pk in session.info.pop('stale_counts', ()):
+        obj = session.identity_map.get(inspect(column.class_).identity_key_from_primary_key((pk,)))
+        if obj is not None:
+            session.expire(obj, [column.key])
+
+
+def _add_to_table_count(connection, name, delta):
+    table = TableCount.__table__
+    result = connection.execute(update(table).where(table.c.name == name).values(rows=table.c.rows + delta))
+    if result.rowcount == 0:
+        # First write since the table was created: start from the real count.
+        model = next(model for model in COUNTED_TABLES if model.__tablename__ == name)
+        total = connection.scalar(select(func.count()).select_from(model.__table__))
+        connection.execute(table.insert().values(name=name, rows=total))
+
+
+def _add_to_parents(connection, column, deltas):
+    """Apply ``{parent_id: delta}`` with one UPDATE per distinct delta."""
+    table = column.class_.__table__
+    by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        by_delta[delta].append(pk)
+    for delta, ids in by_delta.items():
+        values = {column.key: table.c[column.key] + delta}
+        if 'updated_at' in table.c:
+            # Not a content edit; keep the column's onupdate hook from firing.
+            values['updated_at'] = table.c.updated_at
+        for start in range(0, len(ids), CHUNK):
+            connection.execute(update(table).where(table.c.id.in_(ids[start:start + CHUNK])).values(**values))
+
+
+def reconcile(connection):
+    """Recompute every maintained count; returns how many stored values were wrong."""
+    fixed = 0
+    totals = connection.execute(select(*(
+        select(func.count()).select_from(model.__table__).scalar_subquery() for model in COUNTED_TABLES
+    ))).one()
+    table = TableCount.__table__
+    stored = dict(connection.execute(select(table.c.name, table.c.rows)).all())
+    for model, total in zip(COUNTED_TABLES, totals):
+        name = model.__tablename__
+        if name not in stored:
+            connection.execute(table.insert().values(name=name, rows=total))
+            fixed += 1
+        elif stored[name] != total:
+            connection.execute(update(table).where(table.c.name == name).values(rows=total))
+            fixed += 1
+
+    for child, key, _, parent, column in CHILD_COUNTS:
+        children, parents = child.__table__, parent.__table__
+        counts = (
+            select(children.c[key].label('parent_id'), func.count().label('n'))
+            .group_by(children.c[key])
+            .subquery()
+        )
+        actual = func.coalesce(counts.c.n, 0)
+        drifted = connection.execute(
+            select(parents.c.id, actual)
+            .outerjoin(counts, counts.c.parent_id == parents.c.id)
+            .where(parents.c[column.key] != actual)
+        ).all()
+        by_value = defaultdict(list)
+        for pk, value in drifted:
+            by_value[value].append(pk)
+        for value, ids in by_value.items():
+            values = {column.key: value}
+            if 'updated_at' in parents.c:
+                values['updated_at'] = parents.c.updated_at
+            for start in range(0, len(ids), CHUNK):
+                connection.execute(update(parents).where(parents.c.id.in_(ids[start:start + CHUNK])).values(**values))
+        fixed += len(drifted)
+    return fixed
+
+
+def table_counts():
+    """``{table name: rows}`` for the catalog tables, from the maintained counts."""
+    names = [model.__tablename__ for model in COUNTED_TABLES]
+    rows = db.session.execute(select(TableCount.name, TableCount.rows).where(TableCount.name.in_(names)))
+    counts = dict(rows.all())
+    return {name: counts.get(name, 0) for name in names}
+
+
+stats_cli = AppGroup('stats', help='Maintain the precomputed catalog counts.')
+
+
+@stats_cli.command('reconcile')
+def reconcile_command():
+    """Recompute table, per-category and per-topic counts from the rows."""
+    with db.engine.begin() as connection:
+        fixed = reconcile(connection)
+    click.echo(f'Reconciled catalog counts; {fixed} stored values were out of date.')
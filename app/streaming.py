@@ -0,0 +1,106 @@
+"""Streamed rendering for the list pages.
+
+:meth:`Streaming.render` sends a page as it is rendered instead of building
+it in memory first. The topic list, the admin topic table and the search
+results hand their templates rows that are only fetched when the template
+iterates them (:func:`app.pagination.paginate` with ``stream=True``) or a
+:class:`Deferred` search, so the opening of ``base.html`` reaches the client
+before the page's main query has even run, and the rows flow out as they are
+fetched ``yield_per`` at a time.
+
+Template output is joined into chunks of about ``STREAM_CHUNK_SIZE``
+characters, except the first, which is sent once it holds the document head
+and its stylesheet link. The response cache keeps a copy of a streamed body
+as it goes out (see :mod:`app.cache`). Pages with pending flash messages are
+rendered whole, because reading the messages rewrites the session cookie,
+which has been sent by the time a streamed template runs.
+
+``STREAM_PAGES=0`` renders every page with ``render_template``.
+"""
+import os
+
+from flask import current_app, render_template, session, stream_template
+
+# Enough for the doctype, <head> and the stylesheet link in base.html.
+HEAD_SIZE = 512
+
+_MISSING = object()
+
+
+class Streaming:
+    """Flask extension rendering the list pages as streamed responses."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('STREAM_PAGES', os.getenv('STREAM_PAGES', '1') != '0')
+        app.config.setdefault('STREAM_CHUNK_SIZE', int(os.getenv('STREAM_CHUNK_SIZE', 8192)))
+
+    def enabled(self):
+        """Whether the page being handled will be streamed."""
+        return current_app.config['STREAM_PAGES'] and '_flashes' not in session
+
+    def render(self, template_name, **context):
+        """``render_template``, streamed when :meth:`enabled`."""
+        if not self.enabled():
+            return render_template(template_name, **context)
+        pieces = stream_template(template_name, **context)
+        return current_app.response_class(chunked(pieces, current_app.config['STREAM_CHUNK_SIZE']),
+                                          mimetype='text/html')
+
+
+def chunked(pieces, size):
+    """Join template output into chunks of at least ``size`` characters.
+
+    The first chunk is cut at ``HEAD_SIZE`` so the browser can start on the
+    stylesheet while the rows load.
+    """
+    buffer, length, limit = [], 0, HEAD_SIZE
+    try:
+        for piece in pieces:
+            buffer.append(piece)
+            length += len(piece)
+            if length >= limit:
+                yield ''.join(buffer)
+                buffer, length, limit = [], 0, size
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Ends the request context the template kept open.
+        if hasattr(pieces, 'close'):
+            pieces.close()
+
+
+class Deferred:
+    """A value computed the first time a template uses it.
+
+    Lets a view hand a streamed template its results without running the
+    query before the page head has been sent.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._value = _MISSING
+
+    @property
+    def value(self):
+        if self._value is _MISSING:
+            self._value = self._load()
+        return self._value
+
+    def __getattr__(self, name):
+        return getattr(self.value, name)
+
+    def __iter__(self):
+        return iter(self.value)
+
+    def __len__(self):
+        return len(self.value)
+
+    def __bool__(self):
+        return bool(self.value)
+
+
+streaming = Streaming()
@@ -0,0 +1,256 @@
+"""Typeahead suggestions for the search boxes.
+
+Topic titles, formula titles and category names are flattened into one sorted
+array of lowercase keys (one key per word start, so "equ" finds "Quadratic
+Equations") and looked up with ``bisect``. Ranked lists for every prefix that
+matches many keys are computed while building, so a lookup either reads a
+precomputed list or ranks at most ``HEAVY_PREFIX`` keys, and rendered JSON
+bodies are cached per prefix. The structure is rebuilt after local writes, or when the
+catalog fingerprint changes (writes from other workers), checked at most every
+``SUGGEST_CHECK_INTERVAL`` seconds. Rebuilds run on a background thread while
+lookups keep reading the previous structure; until the first one is ready,
+suggestions are empty.
+"""
+import bisect
+import hashlib
+import heapq
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, url_for
+from sqlalchemy import select
+
+from app import db
+from app.commits import on_commit
+from app.models import Category, Formula, Topic
+from app.queries import content_version
+
+# Prefixes matching more keys than this get their ranked list precomputed.
+HEAVY_PREFIX = 256
+
+# Entry kinds, in display priority order.
+CATEGORY, TOPIC, FORMULA = 'category', 'topic', 'formula'
+PRIORITY = {CATEGORY: 2, TOPIC: 1, FORMULA: 0}
+
+
+def normalize(text):
+    return ' '.join(text.lower().split())
+
+
+def word_starts(label):
+    words = normalize(label).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """Sorted key array over suggestion entries."""
+
+    def __init__(self, entries, limit):
+        # entries: (label, kind, url, target, popularity)
+        self.entries = entries
+        self.limit = limit
+        self.scores = [
+            (PRIORITY[kind], popularity, -len(label))
+            for label, kind, _url, _target, popularity in entries
+        ]
+        pairs = sorted(
+            (key, i) for i, entry in enumerate(entries) for key in word_starts(entry[0]) if key
+        )
+        self.keys = [key for key, _ in pairs]
+        self.positions = [i for _, i in pairs]
+        self.top = {}
+        if len(self.keys) > HEAVY_PREFIX:
+            self._precompute('', 0, len(self.keys))
+
+    def _rank(self, positions, limit):
+        seen = set()
+        ranked = []
+        for i in heapq.nlargest(limit * 4, set(positions), key=self.scores.__getitem__):
+            target = self.entries[i][3]
+            if target not in seen:
+                seen.add(target)
+                ranked.append(i)
+                if len(ranked) == limit:
+                    break
+        return ranked
+
+    def _precompute(self, prefix, lo, hi):
+        """Rank every prefix matching more than ``HEAVY_PREFIX`` keys.
+
+        A heavy prefix's list is merged from its children's lists, so each key
+        is ranked directly only once, inside the first light range holding it.
+        """
+        depth = len(prefix)
+        candidates = []
+        while lo < hi:
+            key = self.keys[lo]
+            if len(key) == depth:
+                child_hi = bisect.bisect_right(self.keys, key, lo, hi)
+                candidates.extend(self.positions[lo:child_hi])
+            else:
+                child = key[:depth + 1]
+                child_hi = bisect.bisect_left(self.keys, child + '\uffff', lo, hi)
+                if child_hi - lo > HEAVY_PREFIX:
+                    candidates.extend(self._precompute(child, lo, child_hi))
+                else:
+                    candidates.extend(self._rank(self.positions[lo:child_hi], self.limit * 2))
+            lo = child_hi
+        ranked = self._rank(candidates, self.limit * 2)
+        self.top[prefix] = ranked
+        return ranked
+
+    def lookup(self, prefix, limit):
+        if prefix in self.top and limit <= self.limit:
+            return [self.entries[i] for i in self.top[prefix][:limit]]
+        lo = bisect.bisect_left(self.keys, prefix)
+        hi = bisect.bisect_left(self.keys, prefix + '\uffff', lo)
+        if prefix in self.top:
+            # Larger limits than precomputed on a heavy prefix: bounded scan.
+            hi = min(hi, lo + HEAVY_PREFIX * 8)
+        return [self.entries[i] for i in self._rank(self.positions[lo:hi], limit)]
+
+
+class _SuggestState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.index = None
+        self.version = None
+        self.checked_at = 0.0
+        self.stale = False
+        self.building = False
+        self.cache = OrderedDict()
+
+
+class Suggestions:
+    """Flask extension serving prefix lookups for ``/api/suggest``."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SUGGEST_LIMIT', 8)
+        app.config.setdefault('SUGGEST_CACHE_SIZE', 4096)
+        app.config.setdefault('SUGGEST_CHECK_INTERVAL', 30)
+        app.config.setdefault('SUGGEST_BACKGROUND', True)
+        app.extensions['suggest'] = _SuggestState()
+
+    def _build(self):
+        entries = []
+        for name, slug in db.session.execute(select(Category.name, Category.slug)):
+            entries.append((name, CATEGORY, url_for('topics.category', slug=slug), (CATEGORY, slug), 0))
+        for title, slug, views in db.session.execute(select(Topic.title, Topic.slug, Topic.views)):
+            entries.append((title, TOPIC, url_for('topics.view_topic', slug=slug), (TOPIC, slug), views or 0))
+        rows = db.session.execute(
+            select(Formula.title, Topic.slug, Topic.views).join(Topic, Formula.topic_id == Topic.id)
+        )
+        for title, slug, views in rows:
+            entries.append((title, FORMULA, url_for('topics.view_topic', slug=slug), (FORMULA, title, slug), views or 0))
+        return PrefixIndex(entries, current_app.config['SUGGEST_LIMIT'])
+
+    def rebuild(self):
+        """Build the index now, in this thread, and swap it in."""
+        state = current_app.extensions['suggest']
+        # Cleared first so a write committed while building marks it stale again.
+        state.stale = False
+        version = content_version()
+        index = self._build()
+        with state.lock:
+            state.index, state.version, state.cache = index, version, OrderedDict()
+            state.checked_at = time.monotonic()
+        return index
+
+    def _rebuild_in_background(self, app):
+        try:
+            # url_for needs a request; the suggestion URLs are paths, so any will do.
+            with app.test_request_context():
+                self.rebuild()
+        except Exception:
+            app.logger.exception('Building the suggestion index failed')
+        finally:
+            app.extensions['suggest'].building = False
+
+    def start_rebuild(self):
+        """Rebuild on a background thread unless one is already running."""
+        state = current_app.extensions['suggest']
+        with state.lock:
+            if state.building:
+                return
+            state.building = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._rebuild_in_background, args=(app,), daemon=True).start()
+
+    def _current(self, state):
+        """The index to serve, or None before the first one is built.
+
+        The fingerprint check and any rebuild happen without holding the
+        lock; lookups keep using the old index until the new one is swapped in.
+        """
+        now = time.monotonic()
+        interval = current_app.config['SUGGEST_CHECK_INTERVAL']
+        index = state.index
+        if state.building or (index is not None and not state.stale and now - state.checked_at < interval):
+            return index
+        state.checked_at = now
+        if index is None or state.stale or content_version() != state.version:
+            if not current_app.config['SUGGEST_BACKGROUND']:
+                return self.rebuild()
+            self.start_rebuild()
+        return index
+
+    def lookup(self, query, limit=None):
+        """Return ``(etag, json_body)`` of suggestions for ``query``.
+
+        The etag is None while the first index is still being built and the
+        (empty) answer must not be cached.
+        """
+        state = current_app.extensions['suggest']
+        limit = limit or current_app.config['SUGGEST_LIMIT']
+        prefix = normalize(query)
+        index = self._current(state)
+        key = (prefix, limit)
+        with state.lock:
+            cache = state.cache if state.index is index else None
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                cache.move_to_end(key)
+                return cached
+        entries = index.lookup(prefix, limit) if prefix and index is not None else []
+        body = json.dumps({
+            'query': prefix,
+            'suggestions': [
+                {'label': label, 'type': kind, 'url': url}
+                for label, kind, url, _target, _popularity in entries
+            ],
+        }, separators=(',', ':'))
+        if index is None:
+            return None, body
+        etag = hashlib.sha1(body.encode()).hexdigest()[:20]
+        with state.lock:
+            # Only kept while the index it came from is still the current one.
+            if state.index is index:
+                state.cache[key] = (etag, body)
+                if len(state.cache) > current_app.config['SUGGEST_CACHE_SIZE']:
+                    state.cache.popitem(last=False)
+        return etag, body
+
+
+suggestions = Suggestions()
+
+
+def _note_changes(session):
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, (Category, Topic, Formula)):
+            return True
+    return None
+
+
+def _mark_stale(noticed):
+    state = current_app.extensions.get('suggest')
+    if state is not None:
+        state.stale = True
+
+
+on_commit('suggest', _note_changes, _mark_stale)
@@ -0,0 +1,376 @@
+"""Bulk import and export of the catalog.
+
+Two formats are supported. JSON Lines holds one record per line with a
+``type`` of ``category``, ``topic``, ``formula`` or ``example``; a directory
+of CSV files holds one file per type (``categories.csv``, ``topics.csv``,
+``formulas.csv``, ``examples.csv``). Topics refer to their category and
+formulas and examples to their topic by slug, so a dump can be loaded into
+another database.
+
+Imports stream records and write them in batches, each in its own
+transaction: categories and topics are upserted by slug, and the formulas
+and examples of every topic in the file replace the ones it had. Rows go in
+with ``executemany`` (``COPY`` on PostgreSQL) rather than through the ORM,
+so the write-time work the session hooks would do (content processing,
+formula rendering, touching ``updated_at``) is done here per batch; the
+search index is rebuilt once at the end by the caller. Rendering formulas is
+most of an import's time; skipped, each worker renders them as pages show
+them until ``flask math render`` stores them.
+"""
+import csv
+import io
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.dialects import sqlite
+
+from app.content import process
+from app.mathrender import math_renderer
+from app.models import Category, Example, Formula, Topic
+from app.stats import reconcile
+
+KINDS = ('category', 'topic', 'formula', 'example')
+FILES = {'category': 'categories.csv', 'topic': 'topics.csv', 'formula': 'formulas.csv', 'example': 'examples.csv'}
+FIELDS = {
+    'category': ('slug', 'name', 'description', 'icon'),
+    'topic': ('slug', 'title', 'category', 'description', 'content', 'difficulty', 'views', 'created_at'),
+    'formula': ('topic', 'title', 'latex', 'description'),
+    'example': ('topic', 'title', 'problem', 'solution'),
+}
+REQUIRED = {
+    'category': ('slug', 'name'),
+    'topic': ('slug', 'title', 'category', 'content'),
+    'formula': ('topic', 'title', 'latex'),
+    'example': ('topic', 'title', 'problem', 'solution'),
+}
+# Kind whose slugs a record refers to, and the table holding them.
+PARENTS = {'topic': ('category', Category), 'formula': ('topic', Topic), 'example': ('topic', Topic)}
+# Slug lookups per query; keeps well under SQLite's bound-parameter limit.
+LOOKUP_CHUNK = 500
+# Written unquoted for None in COPY input, and declared as its NULL string.
+COPY_NULL = '\\N'
+
+
+def _clean(kind, record, where):
+    record = {field: record.get(field) for field in FIELDS[kind]}
+    for field, value in record.items():
+        if value == '':
+            record[field] = None
+    missing = [field for field in REQUIRED[kind] if record[field] is None]
+    if missing:
+        raise ValueError(f'{where}: {kind} is missing {", ".join(missing)}')
+    return record
+
+
+def read_jsonl(stream):
+    """Yield ``(kind, record)`` from a JSON Lines stream."""
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ValueError(f'line {number}: {exc}') from None
+        kind = record.get('type')
+        if kind not in KINDS:
+            raise ValueError(f'line {number}: unknown type {kind!r}')
+        yield kind, _clean(kind, record, f'line {number}')
+
+
+def read_csv(directory):
+    """Yield ``(kind, record)`` from the CSV files present in ``directory``."""
+    for kind in KINDS:
+        path = os.path.join(directory, FILES[kind])
+        if not os.path.exists(path):
+            continue
+        with open(path, newline='', encoding='utf-8') as handle:
+            for number, record in enumerate(csv.DictReader(handle), 2):
+                yield kind, _clean(kind, record, f'{FILES[kind]} line {number}')
+
+
+def _export_queries():
+    categories = Category.__table__
+    topics = Topic.__table__
+    return {
+        'category': select(categories.c.slug, categories.c.name, categories.c.description, categories.c.icon)
+        .order_by(categories.c.id),
+        'topic': select(
+            topics.c.slug, topics.c.title, categories.c.slug.label('category'), topics.c.description,
+            topics.c.content, topics.c.difficulty, topics.c.views, topics.c.created_at,
+        ).join(categories, topics.c.category_id == categories.c.id).order_by(topics.c.id),
+        'formula': select(topics.c.slug.label('topic'), Formula.__table__.c.title, Formula.__table__.c.latex,
+                          Formula.__table__.c.description)
+        .join(topics, Formula.__table__.c.topic_id == topics.c.id).order_by(Formula.__table__.c.id),
+        'example': select(topics.c.slug.label('topic'), Example.__table__.c.title, Example.__table__.c.problem,
+                          Example.__table__.c.solution)
+        .join(topics, Example.__table__.c.topic_id == topics.c.id).order_by(Example.__table__.c.id),
+    }
+
+
+def export_records(connection, batch_size=1000):
+    """Yield ``(kind, record)`` for the whole catalog, streamed from the database."""
+    connection = connection.execution_options(yield_per=batch_size)
+    for kind, stmt in _export_queries().items():
+        for row in connection.execute(stmt):
+            record = dict(row._mapping)
+            if isinstance(record.get('created_at'), datetime):
+                record['created_at'] = record['created_at'].isoformat()
+            yield kind, record
+
+
+def write_jsonl(records, stream):
+    count = 0
+    for kind, record in records:
+        stream.write(json.dumps({'type': kind, **record}, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def write_csv(records, directory):
+    os.makedirs(directory, exist_ok=True)
+    handles, writers, count = {}, {}, 0
+    try:
+        for kind, record in records:
+            if kind not in writers:
+                handles[kind] = open(os.path.join(directory, FILES[kind]), 'w', newline='', encoding='utf-8')
+                writers[kind] = csv.DictWriter(handles[kind], FIELDS[kind])
+                writers[kind].writeheader()
+            writers[kind].writerow(record)
+            count += 1
+    finally:
+        for handle in handles.values():
+            handle.close()
+    return count
+
+
+def _copy_value(value):
+    """One field of a COPY CSV row: NULL as a bare ``\\N``, text always quoted.
+
+    A quoted field is never read as NULL, so ``''`` and ``'\\N'`` strings
+    survive, and None does not turn into an empty string.
+    """
+    if value is None:
+        return COPY_NULL
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+    return '"{}"'.format(str(value).replace('"', '""'))
+
+
+def _copy(connection, table_name, columns, rows):
+    """Stream ``rows`` into ``table_name`` with PostgreSQL's COPY."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write(','.join(_copy_value(row[column]) for column in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer
+        )
+    finally:
+        cursor.close()
+
+
+def insert_rows(connection, table, rows):
+    if connection.dialect.name == 'postgresql':
+        _copy(connection, table.name, list(rows[0]), rows)
+    else:
+        connection.execute(table.insert(), rows)
+
+
+def upsert_rows(connection, table, rows, insert_only=()):
+    """Insert ``rows``, updating those whose slug already exists.
+
+    Columns in ``insert_only`` are only written for new rows.
+    """
+    columns = list(rows[0])
+    updated = [column for column in columns if column != 'slug' and column not in insert_only]
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        staging = f'import_{table.name}'
+        connection.exec_driver_sql(
+            f'CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {", ".join(columns)} FROM {table.name} WITH NO DATA'
+        )
+        _copy(connection, staging, columns, rows)
+        assignments = ', '.join(f'{column} = EXCLUDED.{column}' for column in updated)
+        connection.exec_driver_sql(
+            f'INSERT INTO {table.name} ({", ".join(columns)}) SELECT {", ".join(columns)} FROM {staging} '
+            f'ON CONFLICT (slug) DO UPDATE SET {assignments}'
+        )
+    elif dialect == 'sqlite':
+        stmt = sqlite.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['slug'], set_={column: stmt.excluded[column] for column in updated}
+        )
+        connection.execute(stmt, rows)
+    else:
+        existing = set(_lookup(connection, table, [row['slug'] for row in rows]))
+        new = [row for row in rows if row['slug'] not in existing]
+        if new:
+            connection.execute(table.insert(), new)
+        changed = [{**row, 'key': row['slug']} for row in rows if row['slug'] in existing]
+        if changed:
+            connection.execute(
+                table.update().where(table.c.slug == bindparam('key')),
+                [{column: row[column] for column in updated + ['key']} for row in changed],
+            )
+
+
+def _lookup(connection, table, slugs):
+    """Map the given slugs to ids for the rows that exist."""
+    slugs = list(slugs)
+    found = {}
+    for start in range(0, len(slugs), LOOKUP_CHUNK):
+        chunk = slugs[start:start + LOOKUP_CHUNK]
+        found.update(connection.execute(select(table.c.slug, table.c.id).where(table.c.slug.in_(chunk))).all())
+    return found
+
+
+def _last_per_slug(rows):
+    # An upsert may not touch the same row twice in one statement.
+    return list({row['slug']: row for row in rows}.values())
+
+
+def _parse_datetime(value, where):
+    if value is None or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{where}: invalid created_at {value!r}') from None
+
+
+class Importer:
+    """Buffers records per kind and writes them in batches.
+
+    Slugs written or looked up so far are kept in memory so children can be
+    resolved to ids without a query per row.
+    """
+
+    def __init__(self, engine, batch_size=5000, render=True, progress=None):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.render = render
+        self.progress = progress
+        self.pending = {kind: [] for kind in KINDS}
+        self.ids = {'category': {}, 'topic': {}}
+        # Topics whose formulas/examples were already replaced by this import.
+        self.replaced = {'formula': set(), 'example': set()}
+        self.counts = Counter()
+        self.started = time.perf_counter()
+
+    def add(self, kind, record):
+        self.pending[kind].append(record)
+        if len(self.pending[kind]) >= self.batch_size:
+            self.flush(kind)
+
+    def finish(self):
+        for kind in KINDS:
+            self.flush(kind)
+        # Rows were written outside the session, so the maintained counts missed them.
+        with self.engine.begin() as connection:
+            reconcile(connection)
+        return self.counts
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return sum(self.counts.values()) / elapsed if elapsed else 0.0
+
+    def flush(self, kind):
+        parent = PARENTS.get(kind)
+        if parent and self.pending[parent[0]]:
+            # Children may refer to parents still waiting in their buffer.
+            self.flush(parent[0])
+        rows, self.pending[kind] = self.pending[kind], []
+        if not rows:
+            return
+        with self.engine.begin() as connection:
+            getattr(self, f'_write_{kind}')(connection, rows)
+        self.counts[kind] += len(rows)
+        if self.progress:
+            self.progress(self)
+
+    def _resolve(self, connection, kind, rows):
+        parent, table = PARENTS[kind]
+        ids = self.ids[parent]
+        unknown = {row[parent] for row in rows} - ids.keys()
+        if unknown:
+            ids.update(_lookup(connection, table.__table__, unknown))
+            missing = unknown - ids.keys()
+            if missing:
+                raise ValueError(f'{kind} refers to unknown {parent} {sorted(missing)[0]!r}')
+        return [ids[row[parent]] for row in rows]
+
+    def _remember(self, connection, kind, table, rows):
+        self.ids[kind].update(_lookup(connection, table.__table__, [row['slug'] for row in rows]))
+
+    def _write_category(self, connection, rows):
+        now = datetime.utcnow()
+        rows = [{**row, 'updated_at': now} for row in _last_per_slug(rows)]
+        upsert_rows(connection, Category.__table__, rows)
+        self._remember(connection, 'category', Category, rows)
+
+    def _write_topic(self, connection, rows):
+        rows = _last_per_slug(rows)
+        now = datetime.utcnow()
+        values = []
+        for row, category_id in zip(rows, self._resolve(connection, 'topic', rows)):
+            values.append({
+                'slug': row['slug'],
+                'title': row['title'],
+                'category_id': category_id,
+                'description': row['description'],
+                'content': row['content'],
+                'difficulty': row['difficulty'] or 'beginner',
+                'views': int(row['views'] or 0),
+                'created_at': _parse_datetime(row['created_at'], f'topic {row["slug"]}') or now,
+                'updated_at': now,
+                **process(row['content'], row['description']),
+            })
+        # Live view counts and creation dates win over the file's on re-import.
+        upsert_rows(connection, Topic.__table__, values, insert_only=('views', 'created_at'))
+        self._remember(connection, 'topic', Topic, rows)
+
+    def _replace_children(self, connection, kind, model, topic_ids):
+        fresh = set(topic_ids) - self.replaced[kind]
+        if fresh:
+            fresh = sorted(fresh)
+            for start in range(0, len(fresh), LOOKUP_CHUNK):
+                connection.execute(delete(model).where(model.topic_id.in_(fresh[start:start + LOOKUP_CHUNK])))
+            self.replaced[kind].update(fresh)
+        touched = sorted(set(topic_ids))
+        for start in range(0, len(touched), LOOKUP_CHUNK):
+            connection.execute(
+                update(Topic).where(Topic.id.in_(touched[start:start + LOOKUP_CHUNK]))
+                .values(updated_at=datetime.utcnow())
+            )
+
+    def _write_formula(self, connection, rows):
+        topic_ids = self._resolve(connection, 'formula', rows)
+        self._replace_children(connection, 'formula', Formula, topic_ids)
+        now = datetime.utcnow()
+        insert_rows(connection, Formula.__table__, [
+            {'topic_id': topic_id, 'title': row['title'], 'latex': row['latex'],
+             'description': row['description'], 'created_at': now}
+            for row, topic_id in zip(rows, topic_ids)
+        ])
+        if self.render:
+            math_renderer.render_formulas(connection, [row['latex'] for row in rows])
+
+    def _write_example(self, connection, rows):
+        topic_ids = self._resolve(connection, 'example', rows)
+        self._replace_children(connection, 'example', Example, topic_ids)
+        now = datetime.utcnow()
+        insert_rows(connection, Example.__table__, [
+            {'topic_id': topic_id, 'title': row['title'], 'problem': row['problem'],
+             'solution': row['solution'], 'created_at': now}
+            for row, topic_id in zip(rows, topic_ids)
+        ])
@@ -0,0 +1,187 @@
+"""Load-test the read pages under gunicorn (WSGI) and uvicorn (ASGI).
+
+Usage:
+    python benchmarks/asgi_load.py [--topics 2000] [--workers 4] [--concurrency 64]
+                                   [--duration 10] [--latency-ms 20]
+
+Builds a throwaway SQLite catalog, then serves it with ``gunicorn -c
+gunicorn.conf.py`` (sync workers) and with ``uvicorn`` (the same number of
+worker processes running :class:`app.asgi.AsyncApp`), and drives each with
+``--concurrency`` keep-alive clients requesting the home, listing, category
+and topic pages for ``--duration`` seconds. The response cache is off so
+every request reaches the database.
+
+A local SQLite query returns in microseconds, which hides what the async mode
+is for, so every statement is delayed by ``--latency-ms`` in the thread that
+runs it, standing in for the round trip to Cloud SQL: a sync worker sleeps
+through it, while aiosqlite sleeps in its own thread and the event loop
+serves other requests meanwhile. ``--latency-ms 0`` measures the pure
+overhead of each mode.
+"""
+import argparse
+import http.client
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+
+from catalog import WORDS, percentile, populate
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SERVER_MODULE = textwrap.dedent('''
+    import os
+    import time
+
+    from sqlalchemy import event
+    from sqlalchemy.util import await_only
+
+    from app import create_app, db
+    from app.asgi import AsyncApp
+
+    LATENCY = float(os.environ['BENCH_DB_LATENCY_MS']) / 1000
+
+
+    def delay(statement):
+        time.sleep(LATENCY)
+
+
+    app = create_app('production')
+    app.config['RECOMMEND_BACKGROUND'] = False
+    with app.app_context():
+        @event.listens_for(db.engine, 'connect')
+        def _delay_sync(dbapi_connection, connection_record):
+            dbapi_connection.set_trace_callback(delay)
+
+    asgi = AsyncApp(app)
+
+
+    @event.listens_for(asgi.engine.sync_engine, 'connect')
+    def _delay_async(dbapi_connection, connection_record):
+        await_only(dbapi_connection.driver_connection.set_trace_callback(delay))
+''')
+
+
+def wait_until_up(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def load(port, paths, concurrency, duration):
+    """Requests per second, latency samples in ms and the number of failed requests."""
+    samples, errors = [], []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        mine, failed = [], 0
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                connection.request('GET', rng.choice(paths))
+                response = connection.getresponse()
+                response.read()
+                if response.status != 200:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                continue
+            mine.append((time.perf_counter() - started) * 1000)
+        connection.close()
+        with lock:
+            samples.extend(mine)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(samples) / (time.perf_counter() - started), samples, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=2000)
+    parser.add_argument('--content-kb', type=int, default=2)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='asgi-bench-')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{os.path.join(workdir, "bench.db")}',
+        RESPONSE_CACHE='null',
+        VIEW_COUNT_FLUSH_INTERVAL='10',
+        WEB_CONCURRENCY=str(args.workers),
+        PORT=str(args.port),
+        BENCH_DB_LATENCY_MS=str(args.latency_ms),
+        PYTHONPATH=os.pathsep.join([workdir, ROOT]),
+    )
+    env.pop('DATABASE_REPLICA_URLS', None)
+    os.environ.update(DATABASE_URL=env['DATABASE_URL'])
+    sys.path.insert(0, ROOT)
+    from app import create_app, db
+    from app.search import search_index
+
+    app = create_app('development')
+    with app.app_context():
+        populate(db, args.topics, args.content_kb, random.Random(42))
+        search_index.rebuild()
+    with open(os.path.join(workdir, 'bench_server.py'), 'w') as module:
+        module.write(SERVER_MODULE)
+
+    paths = ['/', '/topics/', '/topics/?sort=popular'] + [
+        f'/topics/category/{word}-studies' for word in WORDS[:20]
+    ] + [f'/topics/topic-{n}' for n in range(1, args.topics + 1, max(args.topics // 50, 1))]
+    servers = {
+        'gunicorn': ['gunicorn', '-c', 'gunicorn.conf.py', 'bench_server:app'],
+        'uvicorn': ['uvicorn', 'bench_server:asgi', '--port', str(args.port), '--workers', str(args.workers),
+                    '--no-access-log', '--log-level', 'warning'],
+    }
+    print(f'{args.topics} topics, {args.workers} workers, {args.concurrency} clients, '
+          f'{args.latency_ms:g}ms per statement, {args.duration:g}s per run')
+    print(f'{"server":<10} {"req/s":>8} {"p50":>9} {"p95":>9} {"p99":>9} {"errors":>7}')
+    try:
+        for name, command in servers.items():
+            process = subprocess.Popen(command, cwd=ROOT, env=env,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_until_up(args.port, process)
+                load(args.port, paths, args.concurrency, 1)
+                throughput, samples, errors = load(args.port, paths, args.concurrency, args.duration)
+            finally:
+                process.terminate()
+                process.wait()
+            print(f'{name:<10} {throughput:8.1f} {percentile(samples, 50):7.1f}ms '
+                  f'{percentile(samples, 95):7.1f}ms {percentile(samples, 99):7.1f}ms {errors:7d}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
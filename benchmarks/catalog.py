@@ -0,0 +1,158 @@
+"""Measure list-page latency and memory against a catalog with large topic bodies.
+
+Usage:
+    python benchmarks/catalog.py [--topics 50000] [--content-kb 20] [--requests 200]
+
+Builds a throwaway SQLite database (the defaults need about 2 GB of disk,
+since each topic stores its content and its sanitized HTML), then requests
+the listing pages with the response cache disabled and reports latency
+percentiles and the peak Python memory allocated per request. Each page is
+measured twice: with the card projections the app uses, and with every
+column undeferred, which is what loading whole ``Topic`` rows used to cost.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+WORDS = (
+    'linear quadratic cubic polynomial rational exponential logarithmic trigonometric '
+    'limit derivative integral series sequence matrix vector eigenvalue determinant '
+    'probability distribution variance regression hypothesis prime modular congruence '
+    'triangle circle ellipse parabola hyperbola angle area volume theorem proof lemma '
+    'function equation inequality graph transformation identity complex number'
+).split()
+
+
+def body(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return f'<p>{" ".join(words)}</p>'
+
+
+def populate(db, topics, content_kb, rng):
+    from app.models import Category, Example, Formula, Topic
+    categories = [
+        {'id': i + 1, 'name': f'{WORDS[i].title()} Studies', 'slug': f'{WORDS[i]}-studies'}
+        for i in range(20)
+    ]
+    db.session.execute(Category.__table__.insert(), categories)
+    # A handful of distinct bodies keeps generation fast; SQLite stores each copy.
+    bodies = [body(rng, content_kb * 1024) for _ in range(16)]
+    batch, formulas, examples = [], [], []
+    for i in range(1, topics + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+        content = bodies[i % len(bodies)]
+        batch.append({
+            'id': i, 'title': f'{title} {i}', 'slug': f'topic-{i}',
+            'description': f'All about {title.lower()}', 'excerpt': f'All about {title.lower()}',
+            'content': content, 'content_html': content, 'toc': [], 'reading_time': 5,
+            'category_id': rng.randint(1, 20), 'views': rng.randint(0, 10000),
+            'difficulty': rng.choice(('beginner', 'intermediate', 'advanced')),
+        })
+        formulas.append({'topic_id': i, 'title': 'Formula', 'latex': 'x^2 + ' * 50 + '1'})
+        examples.append({'topic_id': i, 'title': 'Example', 'problem': 'p ' * 500, 'solution': 's ' * 1000})
+        if len(batch) == 1000:
+            db.session.execute(Topic.__table__.insert(), batch)
+            db.session.execute(Formula.__table__.insert(), formulas)
+            db.session.execute(Example.__table__.insert(), examples)
+            db.session.commit()
+            batch, formulas, examples = [], [], []
+    if batch:
+        db.session.execute(Topic.__table__.insert(), batch)
+        db.session.execute(Formula.__table__.insert(), formulas)
+        db.session.execute(Example.__table__.insert(), examples)
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def measure(client, url, requests):
+    client.get(url)
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(url)
+        samples.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    client.get(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return samples, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=50000)
+    parser.add_argument('--content-kb', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    workdir = tempfile.mkdtemp(prefix='catalog-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload, undefer_group
+
+    from app import create_app, db, queries
+    from app.cache import NullCache
+    from app.models import Topic
+    from app.search import search_index
+
+    app = create_app()
+    app.config['RECOMMEND_BACKGROUND'] = False
+    app.extensions['response_cache'].backend = NullCache()
+    started = time.perf_counter()
+    with app.app_context():
+        populate(db, args.topics, args.content_kb, rng)
+        search_index.rebuild()
+    print(f'catalog: {args.topics} topics with {args.content_kb} KB bodies; '
+          f'built in {time.perf_counter() - started:.1f}s')
+
+    urls = ('/', '/topics/', '/topics/?sort=popular', '/topics/category/linear-studies',
+            '/search?q=quadratic', '/admin/topics')
+    cards = queries.topic_cards
+
+    def whole_rows():
+        return undefer_group('body'), joinedload(Topic.category)
+
+    print(f'{"page":<34} {"loading":<12} {"p50":>9} {"p95":>9} {"peak mem":>10}')
+    for url in urls:
+        for label, options in (('cards', cards), ('whole rows', whole_rows)):
+            queries.topic_cards = options
+            try:
+                samples, peak = measure(app.test_client(), url, args.requests)
+            finally:
+                queries.topic_cards = cards
+            print(f'{url:<34} {label:<12} {percentile(samples, 50):>7.2f}ms '
+                  f'{percentile(samples, 95):>7.2f}ms {peak / 1024:>8.0f}KB')
+
+    # What an unpaged Topic.query.all() listing costs with and without the bodies.
+    with app.app_context():
+        for label, options in (('cards', cards()), ('whole rows', whole_rows())):
+            db.session.expunge_all()
+            tracemalloc.start()
+            started = time.perf_counter()
+            count = len(db.session.scalars(select(Topic).options(*options)).unique().all())
+            elapsed = time.perf_counter() - started
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f'{"all " + str(count) + " topics":<34} {label:<12} {elapsed * 1000:>7.0f}ms '
+                  f'{"":>9} {peak / 1024 / 1024:>8.1f}MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Compare two ``suite.py`` result files.
+
+Usage:
+    python benchmarks/compare.py before.json after.json [--threshold 5]
+
+Prints each route's latency, throughput, query count and memory from both
+files with the relative change, marking changes larger than ``--threshold``
+percent. Latency, queries and memory should go down; throughput up. Numbers
+from different machines, catalogs or settings are not comparable, so a
+mismatch in those is reported first.
+"""
+import argparse
+import json
+
+METRICS = (
+    ('client', ('p50_ms', 'p99_ms', 'queries_per_request', 'rss_mb')),
+    ('gunicorn', ('rps', 'p50_ms', 'p99_ms', 'errors')),
+)
+HIGHER_IS_BETTER = {'rps'}
+
+
+def change(before, after):
+    if before is None or after is None:
+        return None
+    if before == 0:
+        return 0.0 if after == 0 else float('inf')
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=5, help='Percent change worth marking.')
+    args = parser.parse_args()
+    with open(args.before) as stream:
+        before = json.load(stream)
+    with open(args.after) as stream:
+        after = json.load(stream)
+
+    print(f'before: {before["meta"]["commit"]}{" (dirty)" if before["meta"]["dirty"] else ""}')
+    print(f'after:  {after["meta"]["commit"]}{" (dirty)" if after["meta"]["dirty"] else ""}')
+    for key in ('platform', 'cpus', 'dialect', 'settings'):
+        if before['meta'].get(key) != after['meta'].get(key):
+            print(f'warning: {key} differs: {before["meta"].get(key)} -> {after["meta"].get(key)}')
+    if before['catalog']['generator'] != after['catalog']['generator']:
+        print('warning: the catalogs differ')
+
+    for phase, metrics in METRICS:
+        if phase not in before or phase not in after:
+            continue
+        print(f'\n{phase:<15} {"metric":<20} {"before":>10} {"after":>10} {"change":>9}')
+        for route in sorted(before[phase].keys() | after[phase].keys()):
+            for metric in metrics:
+                old = before[phase].get(route, {}).get(metric)
+                new = after[phase].get(route, {}).get(metric)
+                delta = change(old, new)
+                mark = ''
+                if delta is not None and abs(delta) >= args.threshold:
+                    better = (delta > 0) == (metric in HIGHER_IS_BETTER)
+                    mark = '  better' if better else '  WORSE'
+                shown = '' if delta is None else f'{delta:+8.1f}%'
+                print(f'{route:<15} {metric:<20} {old if old is not None else "-":>10} '
+                      f'{new if new is not None else "-":>10} {shown:>9}{mark}')
+
+
+if __name__ == '__main__':
+    main()
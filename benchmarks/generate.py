@@ -0,0 +1,135 @@
+"""Generate a synthetic catalog as JSON Lines.
+
+Usage:
+    python benchmarks/generate.py [--categories 20] [--topics 2000] [--formulas 3]
+                                  [--examples 2] [--content-kb 4] [--seed 42] [--output FILE]
+    python benchmarks/generate.py --topics 50000 | flask --app run content import -
+
+The output is the format ``flask content import`` reads, so the catalog can be
+loaded into SQLite or PostgreSQL with the normal bulk import. Sizes follow a
+real catalog rather than a uniform one: topic bodies are HTML with ``h2``/``h3``
+sections, paragraphs, lists and some inline TeX, with lengths drawn from a
+log-normal distribution around ``--content-kb``; formula and example counts
+vary around their means; views are long-tailed. The same seed always produces
+the same catalog.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+
+WORDS = (
+    'linear quadratic cubic polynomial rational exponential logarithmic trigonometric '
+    'limit derivative integral series sequence matrix vector eigenvalue determinant '
+    'probability distribution variance regression hypothesis prime modular congruence '
+    'triangle circle ellipse parabola hyperbola angle area volume theorem proof lemma '
+    'function equation inequality graph transformation identity complex number'
+).split()
+FILLER = (
+    'the of a to is and we that by for this with as it an be can are if on from so then where '
+    'each which when let show find given every any there'
+).split()
+TEX = (r'\(x^2 + y^2 = r^2\)', r'\(\frac{a}{b}\)', r'\(\sum_{k=1}^{n} k\)', r'\(\sqrt{2}\)',
+       r'\(e^{i\pi} + 1 = 0\)', r'\(\int_0^1 x\,dx\)')
+LATEX = (r'\frac{-b \pm \sqrt{b^2 - 4ac}}{2a}', r'a^2 + b^2 = c^2', r'\sum_{k=0}^{n} \binom{n}{k} x^k',
+         r'\int_a^b f(x)\,dx = F(b) - F(a)', r'\lim_{h \to 0} \frac{f(x+h) - f(x)}{h}',
+         r'\det(A - \lambda I) = 0', r'P(A \mid B) = \frac{P(B \mid A) P(A)}{P(B)}')
+DIFFICULTIES = ('beginner', 'intermediate', 'advanced')
+
+
+def sentence(rng, words=None):
+    words = words or rng.randint(8, 20)
+    text = ' '.join(rng.choice(FILLER) if rng.random() < 0.6 else rng.choice(WORDS) for _ in range(words))
+    if rng.random() < 0.15:
+        text += ' ' + rng.choice(TEX)
+    return text[0].upper() + text[1:] + '.'
+
+
+def body(rng, size):
+    """HTML of roughly ``size`` characters, in sections."""
+    parts, length = [], 0
+    while length < size:
+        heading = rng.choice(WORDS).title() + ' ' + rng.choice(WORDS)
+        section = [f'<h2>{heading}</h2>']
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.2:
+                items = ''.join(f'<li>{sentence(rng, 6)}</li>' for _ in range(rng.randint(2, 5)))
+                section.append(f'<ul>{items}</ul>')
+            elif rng.random() < 0.2:
+                section.append(f'<h3>{rng.choice(WORDS).title()}</h3>')
+            section.append('<p>' + ' '.join(sentence(rng) for _ in range(rng.randint(2, 6))) + '</p>')
+        chunk = ''.join(section)
+        parts.append(chunk)
+        length += len(chunk)
+    return ''.join(parts)
+
+
+def around(rng, mean):
+    """A non-negative count that averages ``mean``."""
+    return max(0, round(rng.gauss(mean, max(mean / 2, 0.5)))) if mean else 0
+
+
+def records(categories=20, topics=2000, formulas=3, examples=2, content_kb=4, seed=42):
+    """Yield catalog records in ``flask content import`` JSON Lines form."""
+    rng = random.Random(seed)
+    category_slugs = []
+    for n in range(categories):
+        word = WORDS[n % len(WORDS)]
+        slug = f'{word}-{n}'
+        category_slugs.append(slug)
+        yield {'type': 'category', 'slug': slug, 'name': f'{word.title()} {n}',
+               'description': sentence(rng), 'icon': '∑'}
+    # Log-normal with its median at content_kb, capped to keep outliers sane.
+    sigma = 0.6
+    for n in range(1, topics + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+        slug = f'topic-{n}'
+        size = min(int(content_kb * 1024 * math.exp(rng.gauss(0, sigma))), content_kb * 1024 * 8)
+        yield {
+            'type': 'topic', 'slug': slug, 'title': f'{title} {n}',
+            'category': rng.choice(category_slugs), 'description': sentence(rng),
+            'content': body(rng, size), 'difficulty': rng.choice(DIFFICULTIES),
+            'views': int(rng.paretovariate(1.2) * 10),
+        }
+        for k in range(around(rng, formulas)):
+            yield {'type': 'formula', 'topic': slug, 'title': f'{rng.choice(WORDS).title()} formula {k + 1}',
+                   'latex': rng.choice(LATEX), 'description': sentence(rng)}
+        for k in range(around(rng, examples)):
+            yield {'type': 'example', 'topic': slug, 'title': f'Example {k + 1}',
+                   'problem': ' '.join(sentence(rng) for _ in range(rng.randint(1, 3))),
+                   'solution': ' '.join(sentence(rng) for _ in range(rng.randint(2, 8)))}
+
+
+def lines(**sizes):
+    """:func:`records` as JSON Lines, for :func:`app.transfer.read_jsonl`."""
+    for record in records(**sizes):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def add_arguments(parser):
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--topics', type=int, default=2000)
+    parser.add_argument('--formulas', type=float, default=3, help='Mean formulas per topic.')
+    parser.add_argument('--examples', type=float, default=2, help='Mean examples per topic.')
+    parser.add_argument('--content-kb', type=float, default=4, help='Median topic body size.')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def sizes(args):
+    return {'categories': args.categories, 'topics': args.topics, 'formulas': args.formulas,
+            'examples': args.examples, 'content_kb': args.content_kb, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', default='-', help="JSON Lines file, or '-' for stdout.")
+    args = parser.parse_args()
+    stream = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    with stream:
+        stream.writelines(lines(**sizes(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Measure cold-start cost: import time, app creation and first requests.
+
+Usage:
+    python benchmarks/startup.py [--profile production] [--runs 5] [--path /topics/]
+
+Each run starts a fresh interpreter against a throwaway SQLite database
+(migrated once up front, as a deploy would) and reports how long it took to
+import the ``app`` package, to run ``create_app()``, and to serve the first
+and second request for ``--path``. The gap between the two requests is the
+work deferred to first use. Pass ``--profile`` more than once to compare.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(sys.argv[1])
+created = time.perf_counter()
+client = application.test_client()
+timings = []
+for _ in range(2):
+    before = time.perf_counter()
+    status = client.get(sys.argv[2]).status_code
+    timings.append(time.perf_counter() - before)
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'first_request': timings[0],
+    'second_request': timings[1],
+    'status': status,
+    'modules': len(sys.modules),
+}))
+'''
+
+
+def run(profile, path, env):
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD, profile, path],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profile', action='append', choices=('development', 'production', 'testing'))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/topics/')
+    args = parser.parse_args()
+    profiles = args.profile or ['development', 'production']
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.join(directory, "startup.db")}',
+                   RESPONSE_CACHE='null')
+        env.pop('DATABASE_REPLICA_URLS', None)
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'db', 'upgrade'],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+
+        print(f'{"profile":<12} {"import":>9} {"create_app":>11} {"1st req":>9} {"2nd req":>9} {"modules":>8}')
+        for profile in profiles:
+            results = [run(profile, args.path, env) for _ in range(args.runs)]
+            if any(result['status'] != 200 for result in results):
+                print(f'{profile}: {args.path} returned {results[-1]["status"]}', file=sys.stderr)
+            median = {key: statistics.median(result[key] for result in results)
+                      for key in ('import', 'create_app', 'first_request', 'second_request', 'modules')}
+            print(f'{profile:<12} {median["import"] * 1000:8.1f}ms {median["create_app"] * 1000:10.1f}ms '
+                  f'{median["first_request"] * 1000:8.1f}ms {median["second_request"] * 1000:8.1f}ms '
+                  f'{median["modules"]:8.0f}')
+
+
+if __name__ == '__main__':
+    main()
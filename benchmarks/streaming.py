@@ -0,0 +1,154 @@
+"""Time-to-first-byte and memory of the list pages, rendered whole and streamed.
+
+Usage:
+    python benchmarks/streaming.py [--topics 5000] [--per-page 1000] [--requests 20]
+                                   [--categories 20] [--content-kb 4] [--output streaming.json]
+
+Loads a synthetic catalog (``generate.py``) into a throwaway SQLite database,
+then serves ``/topics/``, ``/admin/topics`` and a search from two fresh
+processes, one with ``STREAM_PAGES=0`` and one with ``STREAM_PAGES=1``. Each
+calls the WSGI app directly and reads the body as a server would, recording
+when the first non-empty chunk arrived (TTFB), when the last did, the
+largest chunk, the peak Python allocation during one request (tracemalloc,
+measured in a separate pass so it does not slow the timed one) and the
+process's peak resident memory. ``--per-page`` sets ``PER_PAGE`` and
+``SEARCH_PER_PAGE``: the larger the page, the more a whole-page render makes
+the client wait and the more it holds in memory at once.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from catalog import percentile
+from generate import WORDS, add_arguments
+from suite import ROOT, build_catalog, rounded
+
+MODES = {'whole': '0', 'streamed': '1'}
+
+
+def routes():
+    return {
+        'topics': '/topics/',
+        'admin_topics': '/admin/topics',
+        'search': f'/search?q={WORDS[0]}',
+    }
+
+
+def fetch(app, path):
+    """Serve ``path``; returns the TTFB and total in ms, the body size and the largest chunk."""
+    from werkzeug.test import EnvironBuilder
+
+    environ = EnvironBuilder(path=path).get_environ()
+    started = time.perf_counter()
+    first, size, largest = None, 0, 0
+    chunks = app(environ, lambda status, headers, exc_info=None: None)
+    try:
+        for chunk in chunks:
+            if chunk and first is None:
+                first = time.perf_counter()
+            size += len(chunk)
+            largest = max(largest, len(chunk))
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    finished = time.perf_counter()
+    return (first - started) * 1000, (finished - started) * 1000, size, largest
+
+
+def child(args):
+    """Measure every route in this process, in the mode set by the environment."""
+    from app import create_app
+
+    app = create_app('production')
+    app.config['RECOMMEND_BACKGROUND'] = False
+    app.config['VIEW_COUNT_ENABLED'] = False
+    app.config['SEARCH_PER_PAGE'] = args.per_page
+    results = {}
+    for name, path in routes().items():
+        for _ in range(3):
+            fetch(app, path)
+        ttfb, total = [], []
+        for _ in range(args.requests):
+            first, last, size, largest = fetch(app, path)
+            ttfb.append(first)
+            total.append(last)
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        fetch(app, path)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results[name] = {
+            'ttfb_p50_ms': percentile(ttfb, 50),
+            'ttfb_p90_ms': percentile(ttfb, 90),
+            'total_p50_ms': percentile(total, 50),
+            'total_p90_ms': percentile(total, 90),
+            'body_kb': size / 1024,
+            'largest_chunk_kb': largest / 1024,
+            'peak_alloc_mb': peak / 1024 / 1024,
+        }
+    results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--per-page', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=20, help='Timed requests per route and mode.')
+    parser.add_argument('--output', help='Also write the results here as JSON.')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory(prefix='bench-streaming-') as workdir:
+        database_url = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+        env = dict(os.environ, DATABASE_URL=database_url, RESPONSE_CACHE='null', PER_PAGE=str(args.per_page))
+        env.pop('DATABASE_REPLICA_URLS', None)
+        os.environ.update(env)
+        from app import create_app
+
+        app = create_app('production')
+        app.config['RECOMMEND_BACKGROUND'] = False
+        args.reuse, args.database = False, None
+        counts, _ = build_catalog(app, args)
+        print(f'catalog: {counts}, {args.per_page} rows per page', file=sys.stderr)
+
+        def measure(flag, requests):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', '--per-page', str(args.per_page),
+                 '--requests', str(requests)],
+                cwd=ROOT, env=dict(env, STREAM_PAGES=flag), check=True, capture_output=True, text=True,
+            ).stdout
+            return json.loads(output.splitlines()[-1])
+
+        # Untimed: reads the fresh import into the page cache so the first
+        # mode measured does not pay for it.
+        measure('1', 1)
+        results = {'catalog': counts, 'per_page': args.per_page}
+        for mode, flag in MODES.items():
+            results[mode] = measure(flag, args.requests)
+
+    print(f'{"route":<14} {"mode":<9} {"TTFB p50":>10} {"total p50":>10} {"chunk max":>10} {"peak alloc":>11}')
+    for name in routes():
+        for mode in MODES:
+            row = results[mode][name]
+            print(f'{name:<14} {mode:<9} {row["ttfb_p50_ms"]:8.1f}ms {row["total_p50_ms"]:8.1f}ms '
+                  f'{row["largest_chunk_kb"]:8.1f}KB {row["peak_alloc_mb"]:9.2f}MB')
+    for mode in MODES:
+        print(f'peak RSS, {mode}: {results[mode]["peak_rss_mb"]:.1f}MB')
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(rounded(results), stream, indent=1, sort_keys=True)
+            stream.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure /api/suggest latency against a synthetic catalog.
+
+Usage:
+    python benchmarks/suggest_latency.py [--topics 100000] [--requests 5000]
+
+Builds a throwaway SQLite database, warms the prefix index, then reports
+server-side latency percentiles for random 1-8 character prefixes, both with
+the per-prefix response cache cleared before every request and with it warm.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+WORDS = (
+    'linear quadratic cubic polynomial rational exponential logarithmic trigonometric '
+    'limit derivative integral series sequence matrix vector eigenvalue determinant '
+    'probability distribution variance regression hypothesis prime modular congruence '
+    'triangle circle ellipse parabola hyperbola angle area volume theorem proof lemma '
+    'function equation inequality graph transformation identity complex number'
+).split()
+
+
+def populate(db, topics, rng):
+    from app.models import Category, Formula, Topic
+    categories = [
+        {'id': i + 1, 'name': f'{WORDS[i].title()} Studies', 'slug': f'{WORDS[i]}-studies'}
+        for i in range(20)
+    ]
+    db.session.execute(Category.__table__.insert(), categories)
+    batch = []
+    for i in range(1, topics + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+        batch.append({
+            'id': i, 'title': f'{title} {i}', 'slug': f'topic-{i}', 'content': '',
+            'category_id': rng.randint(1, 20), 'views': rng.randint(0, 10000),
+        })
+        if len(batch) == 10000:
+            db.session.execute(Topic.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(Topic.__table__.insert(), batch)
+    formulas = [
+        {'topic_id': rng.randint(1, topics), 'title': f'{rng.choice(WORDS).title()} Formula', 'latex': 'x'}
+        for _ in range(topics // 2)
+    ]
+    db.session.execute(Formula.__table__.insert(), formulas)
+    db.session.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(f'{label:<28} p50={percentile(ms, 50):.3f}ms p95={percentile(ms, 95):.3f}ms '
+          f'p99={percentile(ms, 99):.3f}ms max={max(ms):.3f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--topics', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    workdir = tempfile.mkdtemp(prefix='suggest-bench-')
+    os.environ['DATABASE_URL'] = f'sqlite:///{os.path.join(workdir, "bench.db")}'
+
+    from app import create_app, db
+    from app.suggest import suggestions
+
+    app = create_app()
+    with app.app_context():
+        populate(db, args.topics, rng)
+
+    client = app.test_client()
+    started = time.perf_counter()
+    client.get('/api/suggest?q=a')
+    print(f'catalog: {args.topics} topics; index build {time.perf_counter() - started:.2f}s')
+
+    prefixes = []
+    for _ in range(args.requests):
+        word = rng.choice(WORDS)
+        prefixes.append(word[:rng.randint(1, min(8, len(word)))])
+
+    state = app.extensions['suggest']
+    for label, clear in (('uncached lookup', True), ('cached lookup', False)):
+        samples = []
+        with app.test_request_context('/api/suggest'):
+            for prefix in prefixes:
+                if clear:
+                    state.cache.clear()
+                started = time.perf_counter()
+                suggestions.lookup(prefix)
+                samples.append(time.perf_counter() - started)
+        report(label, samples)
+
+    samples = []
+    for prefix in prefixes:
+        state.cache.clear()
+        started = time.perf_counter()
+        client.get(f'/api/suggest?q={prefix}')
+        samples.append(time.perf_counter() - started)
+    report('full request (uncached)', samples)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""Benchmark every read route and record the results as JSON.
+
+Usage:
+    python benchmarks/suite.py [--database URL] [--categories 20] [--topics 2000]
+                               [--formulas 3] [--examples 2] [--content-kb 4]
+                               [--requests 200] [--workers 2] [--concurrency 16]
+                               [--duration 5] [--skip-gunicorn] [--reuse]
+                               [--output results.json]
+    python benchmarks/compare.py before.json after.json
+
+Generates a synthetic catalog with ``generate.py`` and loads it through the
+bulk importer into a throwaway SQLite database, or into ``--database`` (a
+local Postgres, say; its tables are dropped and recreated unless ``--reuse``
+is given, which benchmarks whatever is already there). Each route is then
+measured twice:
+
+* through the Flask test client in this process: ``--requests`` sequential
+  requests, with latency percentiles, the number of SQL statements per
+  request and the process's resident memory afterwards;
+* through a real ``gunicorn -c gunicorn.conf.py run:app`` with ``--workers``
+  processes, driven by ``--concurrency`` keep-alive clients for
+  ``--duration`` seconds: throughput, latency percentiles, failed requests
+  and the resident memory of the master and its workers.
+
+The response cache is off (``--cache`` turns it on) so every request
+reaches the database. Requests for the category, topic, search and suggest
+routes are spread over the catalog with a fixed seed, so two runs request
+the same URLs. The output records the commit, the environment and the
+catalog next to the numbers, with keys sorted, so results from two commits
+can be compared with ``compare.py`` or a plain ``diff``.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy.engine import make_url
+
+from asgi_load import load, wait_until_up
+from catalog import percentile
+from generate import WORDS, add_arguments, lines, sizes
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+
+def route_paths(categories, topics, count, seed):
+    """``count`` request paths per route, the same for the same seed."""
+    rng = random.Random(seed)
+    category_slugs = [f'{WORDS[n % len(WORDS)]}-{n}' for n in range(categories)]
+
+    def spread(make):
+        return [make() for _ in range(count)]
+
+    return {
+        'home': ['/'],
+        'about': ['/about'],
+        'topics': ['/topics/'],
+        'topics_popular': ['/topics/?sort=popular'],
+        'category': spread(lambda: f'/topics/category/{rng.choice(category_slugs)}'),
+        'topic': spread(lambda: f'/topics/topic-{rng.randint(1, topics)}'),
+        'search': spread(lambda: f'/search?q={rng.choice(WORDS)}'),
+        'suggest': spread(lambda: f'/api/suggest?q={rng.choice(WORDS)[:rng.randint(1, 4)]}'),
+        'admin': ['/admin/'],
+        'admin_topics': ['/admin/topics'],
+    }
+
+
+def rss_mb(pid='self'):
+    """Resident memory of a process, from ``/proc``."""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as stream:
+            return [int(child) for child in stream.read().split()]
+    except OSError:
+        return []
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summary(samples, elapsed=None):
+    result = {
+        'requests': len(samples),
+        'p50_ms': percentile(samples, 50),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+        'mean_ms': sum(samples) / len(samples),
+    }
+    if elapsed:
+        result['rps'] = len(samples) / elapsed
+    return result
+
+
+def build_catalog(app, args):
+    from app import db
+    from app.search import search_index
+    from app.transfer import Importer, read_jsonl
+
+    started = time.perf_counter()
+    with app.app_context():
+        if not args.reuse:
+            if args.database:
+                db.drop_all()
+            db.create_all()
+            importer = Importer(db.engine, render=False)
+            for kind, record in read_jsonl(lines(**sizes(args))):
+                importer.add(kind, record)
+            counts = importer.finish()
+            search_index.rebuild()
+        else:
+            from sqlalchemy import func, select
+
+            from app.models import Category, Example, Formula, Topic
+            counts = {model.__tablename__: db.session.scalar(select(func.count()).select_from(model))
+                      for model in (Category, Topic, Formula, Example)}
+    return dict(counts), time.perf_counter() - started
+
+
+def run_client(app, routes, requests):
+    from app import db
+    from app.queries import count_queries
+
+    results = {}
+    client = app.test_client()
+    for name, paths in routes.items():
+        for path in paths[:5]:
+            client.get(path).get_data()
+        samples, statements, failed = [], 0, 0
+        with app.app_context():
+            engine = db.engine
+        started = time.perf_counter()
+        for n in range(requests):
+            path = paths[n % len(paths)]
+            with count_queries(engine) as executed:
+                begun = time.perf_counter()
+                response = client.get(path)
+                # Streamed pages do most of their work while the body is read.
+                response.get_data()
+                samples.append((time.perf_counter() - begun) * 1000)
+            statements += len(executed)
+            failed += response.status_code != 200
+        result = summary(samples, time.perf_counter() - started)
+        result.update(errors=failed, queries_per_request=statements / requests, rss_mb=rss_mb())
+        results[name] = result
+        print(f'client   {name:<15} {result["p50_ms"]:7.2f}ms p50 {result["p99_ms"]:7.2f}ms p99 '
+              f'{result["queries_per_request"]:5.1f} queries', file=sys.stderr)
+    return results
+
+
+def run_gunicorn(args, routes, database_url):
+    env = dict(
+        os.environ,
+        APP_PROFILE='production',
+        DATABASE_URL=database_url,
+        WEB_CONCURRENCY=str(args.workers),
+        PORT=str(args.port),
+        VIEW_COUNT_FLUSH_INTERVAL='10',
+    )
+    if not args.cache:
+        env['RESPONSE_CACHE'] = 'null'
+    env.pop('DATABASE_REPLICA_URLS', None)
+    process = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'run:app'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = {}
+    try:
+        wait_until_up(args.port, process)
+        for name, paths in routes.items():
+            load(args.port, paths, args.concurrency, min(1, args.duration))
+            started = time.perf_counter()
+            rps, samples, errors = load(args.port, paths, args.concurrency, args.duration)
+            result = summary(samples)
+            result.update(rps=rps, errors=errors, elapsed_s=time.perf_counter() - started)
+            results[name] = result
+            print(f'gunicorn {name:<15} {rps:8.1f} req/s {result["p50_ms"]:7.2f}ms p50 '
+                  f'{result["p99_ms"]:7.2f}ms p99', file=sys.stderr)
+        workers = children(process.pid)
+        memory = {'master_rss_mb': rss_mb(process.pid),
+                  'workers_rss_mb': [rss_mb(pid) for pid in workers]}
+        memory['total_rss_mb'] = sum(filter(None, [memory['master_rss_mb'], *memory['workers_rss_mb']]))
+    finally:
+        process.terminate()
+        process.wait()
+    return results, memory
+
+
+def rounded(value):
+    if isinstance(value, float):
+        return round(value, 3)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rounded(item) for item in value]
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--database', help='SQLAlchemy URL; default: a throwaway SQLite file.')
+    parser.add_argument('--reuse', action='store_true', help='Benchmark the data already in --database.')
+    parser.add_argument('--requests', type=int, default=200, help='Test-client requests per route.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5, help='Seconds of gunicorn load per route.')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--cache', action='store_true', help='Leave the response cache on.')
+    parser.add_argument('--skip-gunicorn', action='store_true')
+    parser.add_argument('--output', default='results.json')
+    args = parser.parse_args()
+    if args.reuse and not args.database:
+        parser.error('--reuse needs --database')
+
+    workdir = tempfile.mkdtemp(prefix='bench-suite-')
+    database_url = args.database or f'sqlite:///{os.path.join(workdir, "bench.db")}'
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.pop('DATABASE_REPLICA_URLS', None)
+    if not args.cache:
+        os.environ['RESPONSE_CACHE'] = 'null'
+    try:
+        from app import create_app
+
+        app = create_app('production')
+        app.config['RECOMMEND_BACKGROUND'] = False
+        counts, build_seconds = build_catalog(app, args)
+        print(f'catalog: {counts} in {build_seconds:.1f}s', file=sys.stderr)
+        routes = route_paths(args.categories, args.topics, 200, args.seed)
+
+        results = {
+            'meta': {
+                'commit': git('rev-parse', 'HEAD'),
+                'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'dialect': make_url(database_url).get_backend_name(),
+                'settings': {key: getattr(args, key) for key in
+                             ('requests', 'workers', 'concurrency', 'duration', 'cache')},
+            },
+            'catalog': {'generator': sizes(args), 'rows': counts, 'build_s': build_seconds},
+            'client': run_client(app, routes, args.requests),
+        }
+        results['client_peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        if not args.skip_gunicorn:
+            results['gunicorn'], results['gunicorn_memory'] = run_gunicorn(args, routes, database_url)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as stream:
+        json.dump(rounded(results), stream, indent=1, sort_keys=True)
+        stream.write('\n')
+    print(f'wrote {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
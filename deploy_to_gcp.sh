@@ -70,6 +70,18 @@ gcloud sql users set-password postgres --instance="$SQL_INSTANCE" --password="$D
 INSTANCE_CONNECTION_NAME=$(gcloud sql instances describe "$SQL_INSTANCE" --project="$PROJECT" --format="value(connectionName)")
 echo "Instance connection name: $INSTANCE_CONNECTION_NAME"
 
+# The service no longer creates tables at startup; apply migrations first.
+echo "Running database migrations"
+gcloud run jobs deploy "${SERVICE}-migrate" \
+  --image "$IMAGE" \
+  --region "$REGION" \
+  --set-cloudsql-instances "$INSTANCE_CONNECTION_NAME" \
+  --set-env-vars "DB_USER=postgres,DB_NAME=$DB_NAME,INSTANCE_CONNECTION_NAME=$INSTANCE_CONNECTION_NAME,APP_PROFILE=production" \
+  --set-secrets "DB_PASSWORD=$SECRET_NAME:latest" \
+  --command flask \
+  --args="--app,run,db,upgrade"
+gcloud run jobs execute "${SERVICE}-migrate" --region "$REGION" --wait
+
 echo "Deploying to Cloud Run service: $SERVICE"
 gcloud run deploy "$SERVICE" \
   --image "$IMAGE" \
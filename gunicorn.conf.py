@@ -0,0 +1,21 @@
+"""Gunicorn settings: ``gunicorn -c gunicorn.conf.py run:app``.
+
+With ``preload_app`` the master imports the app once and forks workers from
+it, so workers start without repeating imports or ``create_app()``. Anything
+the master opened is shared with every worker, so ``post_fork`` drops the
+inherited database connections before a worker serves its first request.
+Set ``GUNICORN_PRELOAD=0`` to load the app in each worker instead.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+threads = int(os.getenv('WEB_THREADS', 1))
+preload_app = os.getenv('GUNICORN_PRELOAD', '1') == '1'
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app import after_fork
+
+        after_fork(server.app.wsgi())
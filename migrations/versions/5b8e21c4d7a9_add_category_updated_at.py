@@ -0,0 +1,33 @@
+"""add category updated_at
+
+Revision ID: 5b8e21c4d7a9
+Revises: a3c91d7e5b20
+Create Date: 2026-10-18 16:40:12.402118
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e21c4d7a9'
+down_revision = 'a3c91d7e5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {column['name'] for column in sa.inspect(bind).get_columns('category')}
+    if 'updated_at' not in existing:
+        with op.batch_alter_table('category') as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+    category = sa.table('category', sa.column('updated_at', sa.DateTime()))
+    bind.execute(category.update().where(category.c.updated_at.is_(None)).values(updated_at=datetime.utcnow()))
+
+
+def downgrade():
+    with op.batch_alter_table('category') as batch_op:
+        batch_op.drop_column('updated_at')
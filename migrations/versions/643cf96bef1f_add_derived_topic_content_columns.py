@@ -0,0 +1,235 @@
+"""add derived topic content columns
+
+Revision ID: 643cf96bef1f
+Revises: fed1296a014e
+Create Date: 2026-10-18 12:14:05.118302
+
+"""
+import re
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '643cf96bef1f'
+down_revision = 'fed1296a014e'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ('content_html', sa.Text()),
+    ('toc', sa.JSON()),
+    ('excerpt', sa.String(length=300)),
+    ('reading_time', sa.Integer()),
+    ('has_tex', sa.Boolean()),
+)
+# Topics read and written per statement while filling the new columns.
+BATCH = 500
+
+# A copy of app.content as of this revision, so the migration keeps producing
+# the same columns however the app's processing changes later.
+ALLOWED_TAGS = frozenset(
+    'a abbr b blockquote br caption code dd div dl dt em figcaption figure h1 h2 h3 h4 h5 h6 '
+    'hr i img kbd li ol p pre s small span strong sub sup table tbody td tfoot th thead tr u ul'.split()
+)
+VOID_TAGS = frozenset(('br', 'hr', 'img'))
+# Elements removed together with everything inside them.
+DROP_CONTENT_TAGS = frozenset(('script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript'))
+ALLOWED_ATTRIBUTES = {
+    '*': frozenset(('class', 'id', 'title')),
+    'a': frozenset(('href',)),
+    'img': frozenset(('src', 'alt', 'width', 'height')),
+    'td': frozenset(('colspan', 'rowspan')),
+    'th': frozenset(('colspan', 'rowspan', 'scope')),
+    'ol': frozenset(('start',)),
+}
+URL_ATTRIBUTES = frozenset(('href', 'src'))
+ALLOWED_SCHEMES = frozenset(('', 'http', 'https', 'mailto'))
+TOC_LEVELS = ('h2', 'h3', 'h4')
+
+EXCERPT_LENGTH = 100
+WORDS_PER_MINUTE = 200
+
+
+def slugify(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-') or 'section'
+
+
+def has_tex(text):
+    """Whether ``text`` contains TeX delimiters only the browser can typeset."""
+    return bool(text) and any(mark in text for mark in ('\\(', '\\[', '$$'))
+
+
+class _Sanitizer(HTMLParser):
+    """Rebuilds an HTML fragment keeping only allowlisted tags and attributes."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out = []
+        self.open = []
+        self.dropping = 0
+        self.text = []
+        self.toc = []
+        self.ids = set()
+        self.heading = None
+
+    def _attributes(self, tag, attrs):
+        allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag, frozenset())
+        kept = {}
+        for name, value in attrs:
+            name = name.lower()
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRIBUTES and urlsplit(value.strip()).scheme.lower() not in ALLOWED_SCHEMES:
+                continue
+            kept[name] = value
+        if tag == 'a' and 'href' in kept:
+            kept['rel'] = 'noopener nofollow'
+        return kept
+
+    @staticmethod
+    def _start(tag, attributes):
+        rendered = ''.join(f' {name}="{escape(value)}"' for name, value in attributes.items())
+        return f'<{tag}{rendered}>'
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        attributes = self._attributes(tag, attrs)
+        if tag in TOC_LEVELS and self.heading is None:
+            # The id is assigned when the heading closes and its text is known.
+            self.heading = (tag, len(self.out), attributes, [])
+            self.out.append(None)
+            self.open.append(tag)
+            return
+        self.out.append(self._start(tag, attributes))
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            return
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping or tag not in self.open:
+            return
+        while self.open:
+            current = self.open.pop()
+            self.out.append(f'</{current}>')
+            if self.heading is not None and current == self.heading[0]:
+                self._finish_heading()
+            if current == tag:
+                break
+
+    def _finish_heading(self):
+        tag, position, attributes, words = self.heading
+        self.heading = None
+        title = ' '.join(' '.join(words).split())
+        anchor = attributes.get('id') or slugify(title)
+        base, n = anchor, 2
+        while anchor in self.ids:
+            anchor, n = f'{base}-{n}', n + 1
+        self.ids.add(anchor)
+        attributes['id'] = anchor
+        self.out[position] = self._start(tag, attributes)
+        if title:
+            self.toc.append({'level': int(tag[1]), 'id': anchor, 'title': title})
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.out.append(escape(data, quote=False))
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading[3].append(data)
+
+    def close(self):
+        super().close()
+        while self.open:
+            self.handle_endtag(self.open[-1])
+
+
+def sanitize(html):
+    """Return ``(safe_html, toc, text)`` for an HTML fragment."""
+    parser = _Sanitizer()
+    parser.feed(html or '')
+    parser.close()
+    return ''.join(parser.out), parser.toc, ' '.join(' '.join(parser.text).split())
+
+
+def excerpt(text, length=EXCERPT_LENGTH):
+    text = ' '.join((text or '').split())
+    if len(text) <= length:
+        return text
+    cut = text[:length].rsplit(' ', 1)[0].rstrip(' ,.;:')
+    return f'{cut}…'
+
+
+def reading_time(text):
+    """Whole minutes to read ``text``, at least one."""
+    return max(1, round(len(text.split()) / WORDS_PER_MINUTE))
+
+
+def process(content, description=None):
+    """Derived column values for a topic's content and description."""
+    html, toc, text = sanitize(content)
+    return {
+        'content_html': html,
+        'toc': toc,
+        'excerpt': excerpt(description or text),
+        'reading_time': reading_time(text),
+        'has_tex': has_tex(text),
+    }
+
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {column['name'] for column in sa.inspect(bind).get_columns('topic')}
+    missing = [(name, type_) for name, type_ in COLUMNS if name not in existing]
+    if missing:
+        with op.batch_alter_table('topic') as batch_op:
+            for name, type_ in missing:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+
+    topic = sa.table(
+        'topic',
+        sa.column('id', sa.Integer()),
+        sa.column('content', sa.Text()),
+        sa.column('description', sa.Text()),
+        *(sa.column(name, type_) for name, type_ in COLUMNS),
+    )
+    fill = topic.update().where(topic.c.id == sa.bindparam('topic_id'))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(topic.c.id, topic.c.content, topic.c.description)
+            .where(topic.c.content_html.is_(None), topic.c.id > last_id)
+            .order_by(topic.c.id)
+            .limit(BATCH)
+        ).all()
+        if not rows:
+            break
+        bind.execute(fill, [
+            {'topic_id': topic_id, **process(content, description)} for topic_id, content, description in rows
+        ])
+        last_id = rows[-1].id
+
+
+def downgrade():
+    with op.batch_alter_table('topic') as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)
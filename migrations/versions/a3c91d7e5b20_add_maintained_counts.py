@@ -0,0 +1,83 @@
+"""add maintained counts
+
+Revision ID: a3c91d7e5b20
+Revises: 643cf96bef1f
+Create Date: 2026-10-18 14:02:51.730214
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91d7e5b20'
+down_revision = '643cf96bef1f'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    ('category', 'topic_count'),
+    ('topic', 'formula_count'),
+    ('topic', 'example_count'),
+)
+# (parent table, its counter column, child table, the child's foreign key)
+CHILD_COUNTS = (
+    ('category', 'topic_count', 'topic', 'category_id'),
+    ('topic', 'formula_count', 'formula', 'topic_id'),
+    ('topic', 'example_count', 'example', 'topic_id'),
+)
+# Parent ids per UPDATE while filling the counters.
+BATCH = 1000
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    for table in ('category', 'topic'):
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        missing = [name for owner, name in COLUMNS if owner == table and name not in existing]
+        if missing:
+            with op.batch_alter_table(table) as batch_op:
+                for name in missing:
+                    batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+    # create_app() may have created it already (AUTO_CREATE_SCHEMA).
+    if not inspector.has_table('table_count'):
+        op.create_table('table_count',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('rows', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+        )
+    fill_counts(bind)
+
+
+def fill_counts(bind):
+    """Store every count from the rows, as ``flask stats reconcile`` would at this revision."""
+    table_count = sa.table('table_count', sa.column('name', sa.String()), sa.column('rows', sa.Integer()))
+    bind.execute(table_count.delete())
+    for name in ('category', 'topic', 'formula', 'example'):
+        rows = sa.select(sa.func.count()).select_from(sa.table(name)).scalar_subquery()
+        bind.execute(table_count.insert().values(name=name, rows=rows))
+
+    for parent_name, column, child_name, key in CHILD_COUNTS:
+        parent = sa.table(parent_name, sa.column('id', sa.Integer()), sa.column(column, sa.Integer()))
+        child = sa.table(child_name, sa.column(key, sa.Integer()))
+        count = (
+            sa.select(sa.func.count()).select_from(child).where(child.c[key] == parent.c.id).scalar_subquery()
+        )
+        last_id = bind.execute(sa.select(sa.func.max(parent.c.id))).scalar() or 0
+        # Id ranges rather than ids, so no parent rows are read into memory.
+        for start in range(0, last_id, BATCH):
+            bind.execute(
+                parent.update()
+                .where(parent.c.id > start, parent.c.id <= start + BATCH)
+                .values({column: count})
+            )
+
+
+def downgrade():
+    op.drop_table('table_count')
+    with op.batch_alter_table('topic') as batch_op:
+        batch_op.drop_column('example_count')
+        batch_op.drop_column('formula_count')
+    with op.batch_alter_table('category') as batch_op:
+        batch_op.drop_column('topic_count')
@@ -0,0 +1,167 @@
+"""add search index tables
+
+Revision ID: c41f7a92e6d3
+Revises: 5b8e21c4d7a9
+Create Date: 2026-10-18 17:25:48.910363
+
+"""
+from html.parser import HTMLParser
+
+from alembic import op
+from flask import current_app
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f7a92e6d3'
+down_revision = '5b8e21c4d7a9'
+branch_labels = None
+depends_on = None
+
+# Topics indexed per statement while filling the new tables.
+BATCH = 500
+
+topic = sa.table(
+    'topic',
+    sa.column('id', sa.Integer()),
+    sa.column('title', sa.String()),
+    sa.column('description', sa.Text()),
+    sa.column('content', sa.Text()),
+)
+formula = sa.table(
+    'formula',
+    sa.column('id', sa.Integer()),
+    sa.column('topic_id', sa.Integer()),
+    sa.column('title', sa.String()),
+    sa.column('latex', sa.Text()),
+    sa.column('description', sa.Text()),
+)
+example = sa.table(
+    'example',
+    sa.column('id', sa.Integer()),
+    sa.column('topic_id', sa.Integer()),
+    sa.column('title', sa.String()),
+    sa.column('problem', sa.Text()),
+    sa.column('solution', sa.Text()),
+)
+
+SQLITE_INSERT = (
+    'INSERT INTO topic_fts (rowid, title, description, body, formulas, examples) '
+    'VALUES (:id, :title, :description, :body, :formulas, :examples)'
+)
+POSTGRES_INSERT = (
+    'INSERT INTO topic_search (topic_id, document) VALUES (:id, '
+    "setweight(to_tsvector('english', :title), 'A') || "
+    "setweight(to_tsvector('english', :description), 'B') || "
+    "setweight(to_tsvector('english', :formulas), 'B') || "
+    "setweight(to_tsvector('english', :body), 'C') || "
+    "setweight(to_tsvector('english', :examples), 'D'))"
+)
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+
+    def handle_data(self, data):
+        self.parts.append(data)
+
+
+def strip_html(html):
+    if not html:
+        return ''
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return ' '.join(' '.join(parser.parts).split())
+
+
+def search_backend(bind):
+    """The backend app.search picks for this database, as of this revision."""
+    setting = current_app.config.get('SEARCH_BACKEND', 'auto')
+    if setting != 'auto':
+        return setting
+    if bind.dialect.name == 'postgresql':
+        return 'postgres'
+    if bind.dialect.name == 'sqlite' and bind.exec_driver_sql(
+        "SELECT sqlite_compileoption_used('ENABLE_FTS5')"
+    ).scalar():
+        return 'sqlite'
+    return None
+
+
+def documents(bind, ids):
+    """The search document of each topic in ``ids``."""
+    docs = {
+        row.id: {
+            'id': row.id,
+            'title': row.title or '',
+            'description': row.description or '',
+            'body': strip_html(row.content),
+            'formulas': [],
+            'examples': [],
+        }
+        for row in bind.execute(
+            sa.select(topic.c.id, topic.c.title, topic.c.description, topic.c.content).where(topic.c.id.in_(ids))
+        )
+    }
+    for row in bind.execute(
+        sa.select(formula.c.topic_id, formula.c.title, formula.c.latex, formula.c.description)
+        .where(formula.c.topic_id.in_(ids))
+        .order_by(formula.c.id)
+    ):
+        docs[row.topic_id]['formulas'].extend(part for part in row[1:] if part)
+    for row in bind.execute(
+        sa.select(example.c.topic_id, example.c.title, example.c.problem, example.c.solution)
+        .where(example.c.topic_id.in_(ids))
+        .order_by(example.c.id)
+    ):
+        docs[row.topic_id]['examples'].extend(part for part in row[1:] if part)
+    for doc in docs.values():
+        doc['formulas'] = ' '.join(doc['formulas'])
+        doc['examples'] = ' '.join(doc['examples'])
+    return list(docs.values())
+
+
+def fill(bind, insert):
+    last_id = 0
+    while True:
+        ids = bind.execute(
+            sa.select(topic.c.id).where(topic.c.id > last_id).order_by(topic.c.id).limit(BATCH)
+        ).scalars().all()
+        if not ids:
+            return
+        bind.execute(sa.text(insert), documents(bind, ids))
+        last_id = ids[-1]
+
+
+def upgrade():
+    # Created here rather than by the first search, which may run on a
+    # read-only replica. A database made by db.create_all() already has them.
+    bind = op.get_bind()
+    backend = search_backend(bind)
+    if backend == 'sqlite':
+        if bind.exec_driver_sql("SELECT 1 FROM sqlite_master WHERE name = 'topic_fts'").scalar():
+            return
+        op.execute(
+            "CREATE VIRTUAL TABLE topic_fts USING fts5("
+            "title, description, body, formulas, examples, "
+            "tokenize = 'porter unicode61')"
+        )
+        fill(bind, SQLITE_INSERT)
+    elif backend == 'postgres':
+        if bind.exec_driver_sql("SELECT to_regclass('topic_search') IS NOT NULL").scalar():
+            return
+        op.execute(
+            'CREATE TABLE topic_search ('
+            'topic_id INTEGER PRIMARY KEY REFERENCES topic (id) ON DELETE CASCADE, '
+            'document TSVECTOR NOT NULL)'
+        )
+        op.execute('CREATE INDEX ix_topic_search_document ON topic_search USING GIN (document)')
+        fill(bind, POSTGRES_INSERT)
+
+
+def downgrade():
+    op.execute('DROP TABLE IF EXISTS topic_search')
+    op.execute('DROP TABLE IF EXISTS topic_fts')
@@ -0,0 +1,63 @@
+"""add lookup and ordering indexes
+
+Revision ID: dfd0497705e5
+Revises: 02e7e8335999
+Create Date: 2026-10-18 10:20:41.503117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dfd0497705e5'
+down_revision = '02e7e8335999'
+branch_labels = None
+depends_on = None
+
+
+TOPIC_INDEXES = {
+    'ix_topic_views_id': ['views', 'id'],
+    'ix_topic_title_id': ['title', 'id'],
+    'ix_topic_created_at_id': ['created_at', 'id'],
+    'ix_topic_category_views_id': ['category_id', 'views', 'id'],
+    'ix_topic_category_title_id': ['category_id', 'title', 'id'],
+    'ix_topic_category_created_at_id': ['category_id', 'created_at', 'id'],
+    'ix_topic_updated_at': ['updated_at'],
+}
+
+
+def existing_indexes(table):
+    return {index['name'] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # A database made by db.create_all() (AUTO_CREATE_SCHEMA, or `flask db
+    # stamp` over one) may already have some of these indexes.
+    topic_indexes = existing_indexes('topic')
+
+    # Keyset pagination needs non-null sort keys.
+    op.execute('UPDATE topic SET views = 0 WHERE views IS NULL')
+    op.execute('UPDATE topic SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL')
+    with op.batch_alter_table('topic', schema=None) as batch_op:
+        batch_op.alter_column('views', existing_type=sa.Integer(), nullable=False, server_default='0')
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+        for name, columns in TOPIC_INDEXES.items():
+            if name not in topic_indexes:
+                batch_op.create_index(name, columns, unique=False)
+
+    for table in ('formula', 'example'):
+        name = f'ix_{table}_topic_id'
+        if name not in existing_indexes(table):
+            op.create_index(name, table, ['topic_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_example_topic_id', table_name='example')
+    op.drop_index('ix_formula_topic_id', table_name='formula')
+
+    with op.batch_alter_table('topic', schema=None) as batch_op:
+        for name in TOPIC_INDEXES:
+            batch_op.drop_index(name)
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+        batch_op.alter_column('views', existing_type=sa.Integer(), nullable=True, server_default=None)
@@ -0,0 +1,33 @@
+"""add rendered_math
+
+Revision ID: fed1296a014e
+Revises: dfd0497705e5
+Create Date: 2026-10-18 11:02:37.640215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fed1296a014e'
+down_revision = 'dfd0497705e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() still runs db.create_all(), which may have made it already.
+    if sa.inspect(op.get_bind()).has_table('rendered_math'):
+        return
+    op.create_table('rendered_math',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('renderer', sa.String(length=50), nullable=False),
+    sa.Column('html', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('rendered_math')
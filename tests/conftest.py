@@ -5,16 +5,48 @@ import os
 # Add parent directory to path
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+from flask.testing import FlaskClient
+
 from app import create_app, db
 from app.models import Category, Topic, Formula, Example
+from app.queries import count_queries
+
+# Maximum SQL statements a single GET may issue, keyed by endpoint. These are
+# independent of the number of rows rendered; exceeding one means a template
+# has started lazy-loading a relationship per row. Pages with conditional GET
+# support spend one of them on the validator query.
+QUERY_BUDGETS = {
+    'main.index': 3,
+    'main.search': 3,
+    'topics.all_topics': 3,
+    'topics.category': 3,
+    'topics.view_topic': 6,
+    'admin.manage_topics': 1,
+    'admin.manage_categories': 1,
+}
+
+
+class BufferedClient(FlaskClient):
+    """Test client that reads each response body before returning it.
+
+    A server always sends the whole body, and a streamed page only finishes
+    its queries and ends its request context once it has been.
+    """
+
+    def open(self, *args, buffered=True, **kwargs):
+        return super().open(*args, buffered=buffered, **kwargs)
 
 
 @pytest.fixture
 def app():
     """Create and configure a test Flask app."""
-    app = create_app()
+    app = create_app('testing')
+    app.test_client_class = BufferedClient
     app.config['TESTING'] = True
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['VIEW_COUNT_FLUSH_INTERVAL'] = 0
+    app.config['RECOMMEND_BACKGROUND'] = False
+    app.config['SUGGEST_BACKGROUND'] = False
     
     with app.app_context():
         db.create_all()
@@ -35,6 +67,23 @@ def runner(app):
     return app.test_cli_runner()
 
 
+@pytest.fixture
+def assert_max_queries(app, client):
+    """Return a helper that GETs a URL and fails if it exceeds its query budget."""
+    def check(url, budget=None):
+        if budget is None:
+            endpoint, _ = app.url_map.bind('localhost').match(url.split('?')[0])
+            budget = QUERY_BUDGETS[endpoint]
+        with count_queries() as statements:
+            response = client.get(url)
+        assert len(statements) <= budget, (
+            f'{url} issued {len(statements)} queries (budget {budget}):\n'
+            + '\n'.join(statements)
+        )
+        return response
+    return check
+
+
 @pytest.fixture
 def sample_data(app):
     """Create sample data for testing."""
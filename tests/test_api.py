@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+
+class TestSuggest:
+    """Test the typeahead suggestion endpoint."""
+
+    def test_suggest_matches_title_prefix(self, client, sample_data):
+        response = client.get('/api/suggest?q=test+qua')
+        assert response.status_code == 200
+        suggestions = response.get_json()['suggestions']
+        assert {'label': 'Test Quadratic Equations', 'type': 'topic',
+                'url': '/topics/test-quadratic-equations'} in suggestions
+
+    def test_suggest_matches_any_word_start(self, client, sample_data):
+        suggestions = client.get('/api/suggest?q=equ').get_json()['suggestions']
+        assert [s['label'] for s in suggestions] == ['Test Quadratic Equations']
+
+    def test_categories_rank_before_topics_and_formulas(self, client, sample_data):
+        suggestions = client.get('/api/suggest?q=test').get_json()['suggestions']
+        assert [s['type'] for s in suggestions] == ['category', 'topic', 'formula']
+        assert suggestions[2]['url'] == '/topics/test-quadratic-equations'
+
+    def test_empty_query(self, client, sample_data):
+        assert client.get('/api/suggest?q=').get_json()['suggestions'] == []
+
+    def test_etag_revalidation(self, client, sample_data):
+        response = client.get('/api/suggest?q=test')
+        assert response.headers['ETag']
+        assert 'max-age=60' in response.headers['Cache-Control']
+        again = client.get('/api/suggest?q=test', headers={'If-None-Match': response.headers['ETag']})
+        assert again.status_code == 304
+        assert again.data == b''
+
+    def test_new_topic_is_suggested(self, client, sample_data):
+        assert client.get('/api/suggest?q=deriv').get_json()['suggestions'] == []
+        client.post('/admin/topics/add', data={
+            'title': 'Derivatives',
+            'slug': 'derivatives',
+            'category_id': sample_data['category_id'],
+            'description': 'Rates of change',
+            'content': '<p>Limits of difference quotients</p>',
+        })
+        suggestions = client.get('/api/suggest?q=deriv').get_json()['suggestions']
+        assert [s['label'] for s in suggestions] == ['Derivatives']
+
+    def test_lookup_does_not_query_when_warm(self, app, client, sample_data):
+        from app.queries import count_queries
+        client.get('/api/suggest?q=t')
+        with count_queries() as statements:
+            client.get('/api/suggest?q=te')
+        assert statements == []
+
+    def test_background_build_serves_previous_index(self, app, client, sample_data):
+        app.config['SUGGEST_BACKGROUND'] = True
+        state = app.extensions['suggest']
+
+        def wait():
+            deadline = time.monotonic() + 5
+            while state.building and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+        first = client.get('/api/suggest?q=test+qua')
+        assert first.get_json()['suggestions'] == []
+        assert first.headers['Cache-Control'] == 'no-store'
+        wait()
+        assert len(client.get('/api/suggest?q=test+qua').get_json()['suggestions']) == 1
+
+        before = state.index
+        state.stale = True
+        assert len(client.get('/api/suggest?q=test+qua').get_json()['suggestions']) == 1
+        wait()
+        assert state.index is not before
@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+from sqlalchemy import event, select
+
+from app import create_app, db
+from app.asgi import AsyncApp, async_database_url, wsgi_environ
+from app.cache import FileSystemCache
+from app.models import Category, Topic
+from app.queries import count_queries
+
+
+@pytest.fixture
+def served(monkeypatch, tmp_path):
+    """The ASGI app over a SQLite file holding one topic."""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "asgi.db"}')
+    app = create_app('testing')
+    app.config['VIEW_COUNT_FLUSH_INTERVAL'] = 0
+    app.config['RECOMMEND_BACKGROUND'] = False
+    with app.app_context():
+        category = Category(name='Algebra', slug='algebra')
+        db.session.add(category)
+        db.session.add(Topic(title='Quadratics', slug='quadratics', content='<p>x</p>', category=category))
+        db.session.commit()
+    return AsyncApp(app)
+
+
+def call(asgi, method, path, body=b'', headers=(), sent=None):
+    """Send one request through ``asgi``; returns the status, headers and body.
+
+    The ASGI messages sent back are collected in ``sent`` if given.
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+        'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    messages = [{'type': 'http.request', 'body': body}]
+    sent = [] if sent is None else sent
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi(scope, receive, send))
+    start = sent[0]
+    return (
+        start['status'],
+        {name.decode(): value.decode() for name, value in start['headers']},
+        b''.join(message.get('body', b'') for message in sent[1:]).decode(),
+    )
+
+
+def statements_on(engine):
+    statements = []
+    event.listen(engine.sync_engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+class TestAsyncReads:
+    """Test read pages are served through the asyncio engine."""
+
+    def test_read_route_uses_async_engine(self, served):
+        async_statements = statements_on(served.engine)
+        with served.app.app_context(), count_queries() as sync_statements:
+            status, headers, body = call(served, 'GET', '/topics/')
+        assert status == 200
+        assert 'Quadratics' in body
+        assert headers['x-cache'] == 'MISS'
+        assert async_statements
+        assert sync_statements == []
+
+    def test_topic_page_counts_view(self, served):
+        status, _, body = call(served, 'GET', '/topics/quadratics')
+        assert status == 200
+        assert 'Quadratics' in body
+        with served.app.app_context():
+            assert db.session.scalar(select(Topic.views)) == 1
+
+    def test_not_found(self, served):
+        assert call(served, 'GET', '/topics/missing')[0] == 404
+
+    @pytest.mark.parametrize('path', ['/topics/', '/admin/topics'])
+    def test_streamed_page_sent_in_chunks(self, served, path):
+        served.app.config['STREAM_CHUNK_SIZE'] = 1024
+        messages = []
+        status, _, body = call(served, 'GET', path, sent=messages)
+        assert status == 200
+        assert 'Quadratics' in body
+        assert len([message for message in messages if message.get('body')]) > 2
+
+    def test_conditional_get(self, served):
+        _, headers, _ = call(served, 'GET', '/topics/')
+        status, _, body = call(served, 'GET', '/topics/', headers=[('If-None-Match', headers['etag'])])
+        assert status == 304
+        assert body == ''
+
+
+class TestWsgiFallback:
+    """Test everything else goes through the WSGI app."""
+
+    def test_post_writes_through_sync_engine(self, served):
+        async_statements = statements_on(served.engine)
+        status, headers, _ = call(
+            served, 'POST', '/admin/categories/add', body=b'name=Geometry&slug=geometry',
+            headers=[('Content-Type', 'application/x-www-form-urlencoded')],
+        )
+        assert status == 302
+        assert async_statements == []
+        with served.app.app_context():
+            assert db.session.scalar(select(Category.id).filter_by(slug='geometry')) is not None
+
+    def test_admin_pages_are_not_async(self, served):
+        async_statements = statements_on(served.engine)
+        assert call(served, 'GET', '/admin/')[0] == 200
+        assert async_statements == []
+
+    def test_filesystem_cache_is_not_async(self, served, tmp_path):
+        served.app.extensions['response_cache'].backend = FileSystemCache(str(tmp_path / 'cache'))
+        async_statements = statements_on(served.engine)
+        status, headers, body = call(served, 'GET', '/topics/')
+        assert status == 200
+        assert 'Quadratics' in body
+        assert async_statements == []
+        assert call(served, 'GET', '/topics/')[1]['x-cache'] == 'HIT'
+
+
+class TestAsyncDatabaseUrl:
+    """Test the async driver is derived from the primary URL."""
+
+    def test_drivers(self):
+        assert async_database_url('sqlite:////tmp/x.db').drivername == 'sqlite+aiosqlite'
+        postgres = async_database_url('postgresql+psycopg2://u:p@/db?host=/cloudsql/p:r:i')
+        assert postgres.drivername == 'postgresql+asyncpg'
+        assert postgres.query['host'] == '/cloudsql/p:r:i'
+
+    def test_unknown_backend(self):
+        with pytest.raises(ValueError):
+            async_database_url('mysql://u:p@localhost/db')
+
+
+class TestWsgiEnviron:
+    """Test ASGI scopes are translated to WSGI environs."""
+
+    def test_repeated_headers(self):
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'', 'http_version': '2',
+            'headers': [(b'cookie', b'a=1'), (b'cookie', b'b=2'), (b'accept', b'text/html'),
+                        (b'accept', b'*/*')],
+        }
+        environ = wsgi_environ(scope, b'')
+        assert environ['HTTP_COOKIE'] == 'a=1; b=2'
+        assert environ['HTTP_ACCEPT'] == 'text/html,*/*'
@@ -0,0 +1,116 @@
+import gzip
+import json
+import os
+import re
+import shutil
+
+import pytest
+
+from app.assets import IMMUTABLE, build, minify_css, minify_js
+
+
+@pytest.fixture
+def built(app, runner, tmp_path):
+    """The app serving a copy of its static files with assets built."""
+    static = tmp_path / 'static'
+    shutil.copytree(app.static_folder, static)
+    app.static_folder = str(static)
+    result = runner.invoke(args=['assets', 'build'])
+    assert result.exit_code == 0, result.output
+    return static
+
+
+class TestMinify:
+    """Test the CSS and JavaScript minifiers."""
+
+    def test_css(self):
+        css = '/* nav */\na  >  b {\n  color: red;\n  content: "a , b";\n}\n.x , .y { margin: 0 auto; }\n'
+        assert minify_css(css) == 'a>b{color:red;content:"a , b"}.x,.y{margin:0 auto}'
+
+    def test_js_keeps_strings_and_regexes(self):
+        js = (
+            '// comment\n'
+            'const url = "http://example.com"; /* block */\n'
+            '    const re = /[/]\\/+/g;  // trailing\n'
+            '\n'
+            'const half = total / 2;\n'
+        )
+        assert minify_js(js) == (
+            'const url = "http://example.com";\n'
+            'const re = /[/]\\/+/g;\n'
+            'const half = total / 2;\n'
+        )
+
+    def test_js_keeps_multiline_template_literals(self):
+        js = (
+            'function row(name) {\n'
+            '    return `<li>\n'
+            '        ${name}\n'
+            '\n'
+            '    </li>`;  // item\n'
+            '}\n'
+        )
+        assert minify_js(js) == (
+            'function row(name) {\n'
+            'return `<li>\n'
+            '        ${name}\n'
+            '\n'
+            '    </li>`;\n'
+            '}\n'
+        )
+
+
+class TestBuild:
+    """Test fingerprinting and compression."""
+
+    def test_writes_hashed_compressed_files(self, tmp_path):
+        (tmp_path / 'css').mkdir()
+        (tmp_path / 'css/site.css').write_text('body {\n  margin: 0;\n}\n' * 50)
+        manifest, _ = build(str(tmp_path))
+        path = manifest['css/site.css']
+        assert re.fullmatch(r'dist/css/site\.[0-9a-f]{12}\.css', path)
+        data = (tmp_path / path).read_bytes()
+        assert data.startswith(b'body{margin:0}')
+        assert gzip.decompress((tmp_path / f'{path}.gz').read_bytes()) == data
+        assert json.loads((tmp_path / 'dist/manifest.json').read_text()) == manifest
+
+    def test_keeps_one_previous_build(self, tmp_path):
+        style = tmp_path / 'style.css'
+        hashes = []
+        for color in ('red', 'green', 'blue'):
+            style.write_text(f'a {{ color: {color}; }}')
+            hashes.append(build(str(tmp_path))[0]['style.css'])
+        assert not os.path.exists(tmp_path / hashes[0])
+        assert os.path.exists(tmp_path / hashes[1])
+        assert os.path.exists(tmp_path / hashes[2])
+
+
+class TestServing:
+    """Test hashed URLs and precompressed responses."""
+
+    def test_templates_link_hashed_files(self, app, client, built):
+        manifest = json.loads((built / 'dist/manifest.json').read_text())
+        html = client.get('/about').data.decode()
+        assert f'/static/{manifest["css/style.css"]}' in html
+        assert f'/static/{manifest["js/main.js"]}' in html
+
+    def test_picks_encoding(self, app, client, built):
+        url = '/static/' + app.extensions['assets']['css/style.css']
+        response = client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert response.headers['Cache-Control'] == IMMUTABLE
+        assert response.headers['Content-Type'].startswith('text/css')
+        assert 'Accept-Encoding' in response.headers['Vary']
+        response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        minified = (built / app.extensions['assets']['css/style.css']).read_bytes()
+        assert gzip.decompress(response.data) == minified
+        response = client.get(url)
+        assert 'Content-Encoding' not in response.headers
+        assert response.data == minified
+
+    def test_unbuilt_files_served_as_before(self, client, built):
+        response = client.get('/static/css/style.css')
+        assert response.status_code == 200
+        assert response.headers.get('Cache-Control') != IMMUTABLE
+        response.close()
@@ -0,0 +1,154 @@
+import pytest
+from sqlalchemy import select
+
+from app import db
+from app.cache import FileSystemCache, MemoryCache
+from app.models import Category, Topic, Formula
+from app.recommend import recommendations
+
+
+class TestResponseCache:
+    """Test the rendered-page cache and its invalidation."""
+
+    def test_second_request_is_a_hit(self, client, sample_data):
+        assert client.get('/topics/').headers['X-Cache'] == 'MISS'
+        response = client.get('/topics/')
+        assert response.headers['X-Cache'] == 'HIT'
+        assert b'Test Quadratic Equations' in response.data
+
+    def test_cached_topic_still_counts_views(self, client, app, sample_data):
+        client.get('/topics/test-quadratic-equations')
+        response = client.get('/topics/test-quadratic-equations')
+        assert response.headers['X-Cache'] == 'HIT'
+        with app.app_context():
+            assert db.session.get(Topic, sample_data['topic_id']).views == 2
+
+    def test_new_topic_invalidates_listings(self, client, sample_data):
+        client.get('/')
+        client.get('/topics/')
+        client.get('/topics/category/test-algebra')
+        client.post('/admin/topics/add', data={
+            'title': 'Logarithms',
+            'slug': 'logarithms',
+            'category_id': sample_data['category_id'],
+            'description': 'Inverse of exponentiation',
+            'content': '<p>Logs</p>',
+        })
+        for url in ('/', '/topics/', '/topics/category/test-algebra'):
+            response = client.get(url)
+            assert response.headers['X-Cache'] == 'MISS'
+        assert b'Logarithms' in response.data
+
+    def test_formula_change_invalidates_only_its_topic(self, client, app, sample_data):
+        with app.app_context():
+            other = Category(name='Geometry', slug='geometry')
+            db.session.add(other)
+            db.session.commit()
+        client.get('/topics/test-quadratic-equations')
+        client.get('/topics/category/geometry')
+        with app.app_context():
+            formula = db.session.get(Formula, sample_data['formula_id'])
+            formula.title = 'Vertex Formula'
+            db.session.commit()
+        response = client.get('/topics/test-quadratic-equations')
+        assert response.headers['X-Cache'] == 'MISS'
+        assert b'Vertex Formula' in response.data
+        assert client.get('/topics/category/geometry').headers['X-Cache'] == 'HIT'
+
+    def test_rolled_back_changes_do_not_invalidate(self, client, app, sample_data):
+        client.get('/topics/')
+        with app.app_context():
+            topic = db.session.get(Topic, sample_data['topic_id'])
+            topic.title = 'Never saved'
+            db.session.flush()
+            db.session.rollback()
+        assert client.get('/topics/').headers['X-Cache'] == 'HIT'
+
+    def test_related_topic_edit_invalidates_page(self, client, app, sample_data):
+        with app.app_context():
+            conics = Topic(title='Conic Sections', slug='conics', content='<p>x</p>',
+                           category=Category(name='Geometry', slug='geometry'))
+            db.session.add(conics)
+            db.session.commit()
+            state = app.extensions['recommend']
+            state.snapshot = recommendations.refresh()._replace(related={sample_data['topic_id']: (conics.id,)})
+        assert b'Conic Sections' in client.get('/topics/test-quadratic-equations').data
+        with app.app_context():
+            db.session.scalar(select(Topic).filter_by(slug='conics')).title = 'Ellipses'
+            db.session.commit()
+        assert client.get('/topics/test-quadratic-equations').headers['X-Cache'] == 'MISS'
+
+    def test_commit_during_render_is_not_stored(self, client, app, sample_data, monkeypatch):
+        related_topics = recommendations.related_topics
+
+        def edit_while_rendering(topic, limit=None):
+            # Another request commits after this one has read the topic.
+            with app.app_context():
+                db.session.get(Topic, sample_data['topic_id']).title = 'Renamed'
+                db.session.commit()
+            return related_topics(topic, limit)
+
+        monkeypatch.setattr(recommendations, 'related_topics', edit_while_rendering)
+        assert client.get('/topics/test-quadratic-equations').headers['X-Cache'] == 'MISS'
+        monkeypatch.setattr(recommendations, 'related_topics', related_topics)
+        response = client.get('/topics/test-quadratic-equations')
+        assert response.headers['X-Cache'] == 'MISS'
+        assert b'Renamed' in response.data
+
+    def test_entries_expire(self, client, app, sample_data):
+        client.get('/topics/')
+        entry = app.extensions['response_cache'].backend.get('/topics/?')
+        entry['stored_at'] -= app.config['RESPONSE_CACHE_MAX_AGE'] + 1
+        assert client.get('/topics/').headers['X-Cache'] == 'MISS'
+        assert client.get('/topics/').headers['X-Cache'] == 'HIT'
+
+    def test_not_found_is_not_cached(self, client):
+        client.get('/topics/missing')
+        assert client.get('/topics/missing').status_code == 404
+        stats = client.get('/admin/cache').get_json()
+        assert stats['misses'] == 2
+        assert stats['stores'] == 0
+
+    def test_stats_endpoint(self, client, sample_data):
+        client.get('/topics/')
+        client.get('/topics/')
+        stats = client.get('/admin/cache').get_json()
+        assert stats['backend'] == 'memory'
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['stores'] == 1
+        assert stats['hit_ratio'] == 0.5
+
+
+class TestCacheBackends:
+    """Test cache storage backends."""
+
+    def entry(self, body=b'x', tags=None):
+        return {'body': body, 'mimetype': 'text/html', 'tags': tags or {}, 'meta': {}}
+
+    def test_memory_cache_bounds_entries(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set('a', self.entry())
+        cache.set('b', self.entry())
+        cache.get('a')
+        assert cache.set('c', self.entry()) == 1
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+
+    def test_memory_cache_bounds_bytes(self):
+        cache = MemoryCache(max_entries=10, max_bytes=10)
+        cache.set('a', self.entry(b'123456'))
+        cache.set('b', self.entry(b'123456'))
+        assert len(cache) == 1
+        assert cache.size == 6
+
+    def test_filesystem_cache_is_shared(self, tmp_path):
+        first = FileSystemCache(str(tmp_path))
+        second = FileSystemCache(str(tmp_path))
+        versions = first.tag_versions(['topic:1'])
+        first.set('/topics/x', self.entry(b'<html>', versions))
+        entry = second.get('/topics/x')
+        assert entry['body'] == b'<html>'
+        assert second.tag_versions(entry['tags']) == entry['tags']
+        second.invalidate(['topic:1'])
+        assert first.tag_versions(entry['tags']) != entry['tags']
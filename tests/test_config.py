@@ -0,0 +1,92 @@
+import pytest
+
+from sqlalchemy import inspect
+
+from app import after_fork, create_app, db
+from app.config import ProductionConfig, engine_options, profile_name
+
+POSTGRES = 'postgresql+psycopg2://user:pw@/mathmerise?host=/cloudsql/project:region:db'
+
+
+def production():
+    return {key: getattr(ProductionConfig, key) for key in dir(ProductionConfig) if key.isupper()}
+
+
+class TestProfiles:
+    """Test profile selection."""
+
+    def test_explicit_profile_wins(self, monkeypatch):
+        monkeypatch.setenv('APP_PROFILE', 'production')
+        assert profile_name('testing') == 'testing'
+        assert profile_name() == 'production'
+
+    def test_flask_env_fallback(self, monkeypatch):
+        monkeypatch.delenv('APP_PROFILE', raising=False)
+        monkeypatch.setenv('FLASK_ENV', 'development')
+        assert profile_name() == 'development'
+
+    def test_unknown_profile(self):
+        with pytest.raises(ValueError):
+            profile_name('staging')
+
+
+class TestEngineOptions:
+    """Test pool sizing and SQLite pragmas."""
+
+    def test_pool_divides_connection_budget(self, monkeypatch):
+        monkeypatch.setenv('WEB_CONCURRENCY', '4')
+        monkeypatch.setenv('WEB_THREADS', '2')
+        options = engine_options(POSTGRES, production())
+        assert options['pool_size'] == 2
+        assert options['pool_size'] + options['max_overflow'] == 20
+        assert options['pool_recycle'] == 540
+        assert options['pool_pre_ping'] is True
+
+    def test_environment_overrides(self, monkeypatch):
+        monkeypatch.setenv('DB_POOL_SIZE', '7')
+        monkeypatch.setenv('DB_MAX_OVERFLOW', '0')
+        options = engine_options(POSTGRES, production())
+        assert (options['pool_size'], options['max_overflow']) == (7, 0)
+
+    def test_sqlite_has_no_pool_options(self):
+        assert engine_options('sqlite:///mathmerise.db', production()) == {}
+
+    def test_sqlite_pragmas(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "pragmas.db"}')
+        app = create_app('testing')
+        with app.app_context(), db.engine.connect() as connection:
+            assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+            assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+            assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+
+    def test_startup_log_line(self, monkeypatch, tmp_path, caplog):
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "log.db"}')
+        with caplog.at_level('INFO'):
+            create_app('development')
+        assert 'journal_mode=wal' in caplog.text
+
+
+class TestStartup:
+    """Test the production startup path."""
+
+    def test_production_leaves_schema_to_migrations(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "empty.db"}')
+        app = create_app('production')
+        with app.app_context():
+            assert inspect(db.engine).get_table_names() == []
+        assert 'migrate' not in app.extensions
+
+    def test_development_creates_schema(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "dev.db"}')
+        app = create_app('development')
+        with app.app_context():
+            assert 'topic' in inspect(db.engine).get_table_names()
+        assert 'migrate' in app.extensions
+
+    def test_after_fork_drops_inherited_connections(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "fork.db"}')
+        app = create_app('testing')
+        with app.app_context():
+            pool = db.engine.pool
+            after_fork(app)
+            assert db.engine.pool is not pool
@@ -0,0 +1,104 @@
+from sqlalchemy import text
+
+from app import db
+from app.content import excerpt, process, reading_time, sanitize
+from app.models import Topic
+
+URL = '/topics/test-quadratic-equations'
+
+
+class TestSanitize:
+    """Test topic HTML is reduced to the allowlist."""
+
+    def test_drops_scripts_and_handlers(self):
+        html, _, text = sanitize('<p onclick="steal()">Hi<script>alert(1)</script></p><style>p{}</style>')
+        assert html == '<p>Hi</p>'
+        assert text == 'Hi'
+
+    def test_unsafe_links_lose_their_href(self):
+        html, _, _ = sanitize('<a href="javascript:alert(1)">x</a><a href="https://example.com">y</a>')
+        assert '<a>x</a>' in html
+        assert '<a href="https://example.com" rel="noopener nofollow">y</a>' in html
+
+    def test_unknown_tags_keep_their_text(self):
+        html, _, _ = sanitize('<p><font color="red">red</font> &amp; <b>bold</b></p>')
+        assert html == '<p>red &amp; <b>bold</b></p>'
+
+    def test_unclosed_tags_are_closed(self):
+        html, _, _ = sanitize('<ul><li>one<li>two')
+        assert html == '<ul><li>one<li>two</li></li></ul>'
+
+    def test_headings_get_unique_ids_and_toc(self):
+        html, toc, _ = sanitize('<h2>Roots</h2><h3 id="why">Why it <em>works</em></h3><h2>Roots</h2>')
+        assert '<h2 id="roots">' in html
+        assert '<h3 id="why">' in html
+        assert '<h2 id="roots-2">' in html
+        assert toc == [
+            {'level': 2, 'id': 'roots', 'title': 'Roots'},
+            {'level': 3, 'id': 'why', 'title': 'Why it works'},
+            {'level': 2, 'id': 'roots-2', 'title': 'Roots'},
+        ]
+
+
+class TestDerivedFields:
+    """Test excerpts, reading time and TeX detection."""
+
+    def test_excerpt_cuts_on_a_word(self):
+        assert excerpt('short text') == 'short text'
+        assert excerpt('alpha beta gamma', length=12) == 'alpha beta…'
+
+    def test_reading_time(self):
+        assert reading_time('') == 1
+        assert reading_time('word ' * 1000) == 5
+
+    def test_excerpt_falls_back_to_content(self):
+        fields = process('<p>Body \\(x^2\\) text</p>', '')
+        assert fields['excerpt'] == 'Body \\(x^2\\) text'
+        assert fields['has_tex'] is True
+
+
+class TestWriteTimeProcessing:
+    """Test derived columns are stored when topics are written."""
+
+    def test_admin_topic_is_processed(self, client, app, sample_data):
+        client.post('/admin/topics/add', data={
+            'title': 'Logarithms',
+            'slug': 'logarithms',
+            'category_id': sample_data['category_id'],
+            'description': 'Inverse of exponentiation',
+            'content': '<h2>Rules</h2><p>Logs</p><script>x()</script>',
+        })
+        with app.app_context():
+            topic = Topic.query.filter_by(slug='logarithms').one()
+            assert topic.content_html == '<h2 id="rules">Rules</h2><p>Logs</p>'
+            assert topic.toc == [{'level': 2, 'id': 'rules', 'title': 'Rules'}]
+            assert topic.excerpt == 'Inverse of exponentiation'
+            assert topic.reading_time == 1
+
+    def test_content_change_is_reprocessed(self, client, app, sample_data):
+        with app.app_context():
+            db.session.get(Topic, sample_data['topic_id']).content = '<h2>New</h2><h2>Second</h2>'
+            db.session.commit()
+        html = client.get(URL).data.decode()
+        assert '<a href="#new">New</a>' in html
+        assert '<h2 id="second">Second</h2>' in html
+
+    def test_page_serves_sanitized_html(self, client, app, sample_data):
+        with app.app_context():
+            db.session.get(Topic, sample_data['topic_id']).content = '<p>Safe</p><img src=x onerror="bad()">'
+            db.session.commit()
+        html = client.get(URL).data.decode()
+        assert '<p>Safe</p><img src="x">' in html
+        assert 'onerror' not in html
+
+    def test_process_command_backfills(self, runner, app, sample_data):
+        with app.app_context():
+            db.session.execute(text('UPDATE topic SET content_html = NULL, excerpt = NULL'))
+            db.session.commit()
+        result = runner.invoke(args=['content', 'process'])
+        assert result.exit_code == 0
+        assert 'Processed 1 topics' in result.output
+        with app.app_context():
+            topic = db.session.get(Topic, sample_data['topic_id'])
+            assert topic.content_html == '<h3 id="content">Content</h3><p>Test content</p>'
+            assert topic.excerpt == 'Testing quadratic equations'
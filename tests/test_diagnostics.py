@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from app import create_app, db
+from app.diagnostics import parameter_shape
+
+TOKEN = 'secret-token'
+AUTH = {'Authorization': f'Bearer {TOKEN}'}
+
+
+@pytest.fixture
+def diagnosed(monkeypatch, tmp_path):
+    """An app logging every statement as slow, with the diagnostics endpoints on."""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "diagnostics.db"}')
+    monkeypatch.setenv('SLOW_QUERY_MS', '0.000001')
+    monkeypatch.setenv('DIAGNOSTICS_TOKEN', TOKEN)
+    app = create_app('testing')
+    app.config['RECOMMEND_BACKGROUND'] = False
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def busy_marker(stop):
+    while not stop.is_set():
+        time.sleep(0.001)
+
+
+class TestSlowQueries:
+    """Test the slow-query log."""
+
+    def test_parameter_shape(self):
+        assert parameter_shape((1, 2, 3, 'a')) == '(int × 3, str)'
+        assert parameter_shape({'slug': 'x', 'limit': 5}) == '{slug: str, limit: int}'
+        assert parameter_shape([(1, 'a'), (2, 'b')], executemany=True) == '2 × (int, str)'
+
+    def test_logs_statement_and_route(self, diagnosed, caplog):
+        with caplog.at_level('WARNING', logger='app.diagnostics'):
+            diagnosed.test_client().get('/topics/no-such-topic')
+        assert any('Slow query' in message and 'topics.view_topic' in message for message in caplog.messages)
+        queries = diagnosed.test_client().get('/admin/diagnostics/slow-queries', headers=AUTH).json['queries']
+        topic = next(entry for entry in queries if entry.get('endpoint') == 'topics.view_topic')
+        assert topic['path'] == '/topics/no-such-topic'
+        assert topic['method'] == 'GET'
+        assert 'FROM topic' in topic['statement']
+        # Shapes, never values.
+        assert 'no-such-topic' not in topic['parameters']
+        assert 'str' in topic['parameters']
+
+    def test_off_by_default(self, app, client, sample_data):
+        assert app.config['SLOW_QUERY_MS'] == 0
+        client.get('/topics/test-quadratic-equations')
+        assert not app.extensions['diagnostics'].slow_queries
+
+
+class TestProfiler:
+    """Test the sampling profiler endpoint."""
+
+    def test_requires_token(self, diagnosed):
+        client = diagnosed.test_client()
+        assert client.get('/admin/diagnostics/profile?seconds=0.1').status_code == 401
+        headers = {'Authorization': 'Bearer wrong'}
+        assert client.get('/admin/diagnostics/profile?seconds=0.1', headers=headers).status_code == 401
+
+    def test_not_registered_without_token(self, client):
+        assert client.get('/admin/diagnostics/profile', headers=AUTH).status_code == 404
+
+    def test_collapsed_stacks(self, diagnosed):
+        stop = threading.Event()
+        thread = threading.Thread(target=busy_marker, args=(stop,), name='busy worker')
+        thread.start()
+        try:
+            response = diagnosed.test_client().get('/admin/diagnostics/profile?seconds=0.2&interval_ms=2',
+                                                   headers=AUTH, environ_overrides={'wsgi.multithread': True})
+        finally:
+            stop.set()
+            thread.join()
+        assert response.status_code == 200
+        assert int(response.headers['X-Profile-Samples']) > 10
+        lines = response.get_data(as_text=True).splitlines()
+        busy = [line for line in lines if line.startswith('busy_worker;')]
+        assert busy and all('busy_marker (' in line for line in busy)
+        assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+    def test_refuses_single_threaded_worker(self, diagnosed):
+        response = diagnosed.test_client().get('/admin/diagnostics/profile?seconds=0.1', headers=AUTH)
+        assert response.status_code == 409
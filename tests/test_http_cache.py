@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Category, Formula, Topic
+from app.queries import count_queries
+
+
+class TestConditionalRequests:
+    """Test ETag / Last-Modified validation of the public pages."""
+
+    def test_pages_carry_validators(self, client, sample_data):
+        for url in ('/', '/topics/', '/topics/category/test-algebra', '/topics/test-quadratic-equations'):
+            response = client.get(url)
+            assert response.status_code == 200
+            assert response.headers['ETag'].startswith('W/"')
+            assert ('Last-Modified' in response.headers) == (url == '/topics/test-quadratic-equations')
+            assert 'public' in response.headers['Cache-Control']
+            assert 'max-age=60' in response.headers['Cache-Control']
+
+    def test_matching_etag_is_not_modified_without_rendering(self, client, sample_data):
+        etag = client.get('/topics/test-quadratic-equations').headers['ETag']
+        with count_queries() as statements:
+            response = client.get('/topics/test-quadratic-equations', headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+        # The validator query plus the view counter's write-through update.
+        assert len([s for s in statements if s.lstrip().upper().startswith('SELECT')]) == 1
+
+    def test_not_modified_still_counts_the_view(self, client, app, sample_data):
+        etag = client.get('/topics/test-quadratic-equations').headers['ETag']
+        client.get('/topics/test-quadratic-equations', headers={'If-None-Match': etag})
+        with app.app_context():
+            assert db.session.get(Topic, sample_data['topic_id']).views == 2
+
+    def test_view_count_does_not_change_etag(self, client, sample_data):
+        first = client.get('/topics/test-quadratic-equations').headers['ETag']
+        second = client.get('/topics/test-quadratic-equations').headers['ETag']
+        assert first == second
+
+    def test_if_modified_since(self, client, sample_data):
+        url = '/topics/test-quadratic-equations'
+        last_modified = client.get(url).headers['Last-Modified']
+        response = client.get(url, headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+        earlier = (datetime.utcnow() - timedelta(days=1)).strftime('%a, %d %b %Y %H:%M:%S GMT')
+        assert client.get(url, headers={'If-Modified-Since': earlier}).status_code == 200
+
+    def test_topic_edit_changes_etag(self, client, app, sample_data):
+        etag = client.get('/topics/test-quadratic-equations').headers['ETag']
+        with app.app_context():
+            topic = db.session.get(Topic, sample_data['topic_id'])
+            topic.title = 'Quadratics'
+            db.session.commit()
+        response = client.get('/topics/test-quadratic-equations', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'Quadratics' in response.data
+
+    def test_formula_edit_touches_topic(self, client, app, sample_data):
+        etag = client.get('/topics/test-quadratic-equations').headers['ETag']
+        with app.app_context():
+            db.session.get(Formula, sample_data['formula_id']).title = 'Vertex Formula'
+            db.session.commit()
+        response = client.get('/topics/test-quadratic-equations', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert b'Vertex Formula' in response.data
+
+    def test_new_topic_changes_listing_etags(self, client, sample_data):
+        etags = {url: client.get(url).headers['ETag'] for url in ('/', '/topics/', '/topics/category/test-algebra')}
+        client.post('/admin/topics/add', data={
+            'title': 'Logarithms',
+            'slug': 'logarithms',
+            'category_id': sample_data['category_id'],
+            'description': 'Inverse of exponentiation',
+            'content': '<p>Logs</p>',
+        })
+        for url, etag in etags.items():
+            assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+    def test_category_edit_changes_listing_etags(self, client, app, sample_data):
+        etags = {url: client.get(url).headers['ETag'] for url in ('/', '/topics/')}
+        with app.app_context():
+            db.session.get(Category, sample_data['category_id']).icon = 'sigma'
+            db.session.commit()
+        for url, etag in etags.items():
+            assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+    def test_deleted_topic_is_not_masked_by_a_date(self, client, app, sample_data):
+        client.get('/topics/')
+        with app.app_context():
+            db.session.delete(db.session.get(Topic, sample_data['topic_id']))
+            db.session.commit()
+        later = (datetime.utcnow() + timedelta(days=1)).strftime('%a, %d %b %Y %H:%M:%S GMT')
+        for url in ('/', '/topics/', '/topics/category/test-algebra'):
+            response = client.get(url, headers={'If-Modified-Since': later})
+            assert response.status_code == 200
+            assert b'test-quadratic-equations' not in response.data
+
+    def test_unknown_slug_is_404_without_validators(self, client, sample_data):
+        response = client.get('/topics/missing', headers={'If-None-Match': '*'})
+        assert response.status_code == 404
+        assert 'ETag' not in response.headers
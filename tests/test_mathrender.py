@@ -0,0 +1,85 @@
+from sqlalchemy import func, select, text
+
+from app import db
+from app.mathrender import math_key
+from app.models import Formula, RenderedMath, Topic
+from app.queries import count_queries
+
+URL = '/topics/test-quadratic-equations'
+
+
+def stored_keys():
+    return set(db.session.scalars(select(RenderedMath.key)))
+
+
+class TestMathRendering:
+    """Test formulas are rendered to MathML on the server."""
+
+    def test_formula_is_rendered_inline(self, client, sample_data):
+        html = client.get(URL).data.decode()
+        assert '<math xmlns="http://www.w3.org/1998/Math/MathML" display="block">' in html
+        assert '<mfrac>' in html
+        assert 'MathJax' not in html
+        assert 'polyfill.io' not in html
+
+    def test_rendered_at_write_time(self, app, sample_data):
+        with app.app_context():
+            assert math_key('x = \\frac{-b}{2a}') in stored_keys()
+            db.session.add(Formula(topic_id=sample_data['topic_id'], title='Same', latex='x = \\frac{-b}{2a}'))
+            db.session.commit()
+            assert db.session.scalar(select(func.count()).select_from(RenderedMath)) == 1
+
+    def test_missing_source_rendered_without_writing(self, client, app, sample_data):
+        with app.app_context():
+            db.session.execute(text(
+                "INSERT INTO formula (topic_id, title, latex) VALUES (:topic, 'Raw', 'e^{i\\pi} + 1 = 0')"
+            ), {'topic': sample_data['topic_id']})
+            db.session.commit()
+        with count_queries() as statements:
+            html = client.get(URL).data.decode()
+        assert html.count('<math ') == 2
+        assert not [statement for statement in statements if 'rendered_math' in statement and 'INSERT' in statement]
+        with app.app_context():
+            assert math_key('e^{i\\pi} + 1 = 0') not in stored_keys()
+
+    def test_unrenderable_formula_falls_back_to_mathjax(self, client, app, sample_data):
+        with app.app_context():
+            db.session.get(Formula, sample_data['formula_id']).latex = '\\frac{1}{'
+            db.session.commit()
+        html = client.get(URL).data.decode()
+        assert '\\(\\frac{1}{\\)' in html
+        assert 'MathJax-script' in html
+
+    def test_markup_in_formula_is_not_rendered(self, client, app, sample_data):
+        with app.app_context():
+            formula = db.session.get(Formula, sample_data['formula_id'])
+            formula.latex = '\\text{<script>alert(1)</script>} + \\href{javascript:alert(2)}{x}'
+            db.session.commit()
+        html = client.get(URL).data.decode()
+        assert '<script>alert' not in html
+        assert 'href="javascript' not in html
+        assert '\\text{&lt;script&gt;alert(1)&lt;/script&gt;}' in html
+        assert 'MathJax-script' in html
+
+    def test_tex_in_content_loads_mathjax(self, client, app, sample_data):
+        with app.app_context():
+            db.session.get(Topic, sample_data['topic_id']).content = '<p>Here \\(x^2\\) grows.</p>'
+            db.session.commit()
+        assert 'MathJax-script' in client.get(URL).data.decode()
+
+    def test_client_rendering(self, client, app, sample_data):
+        app.config['MATH_RENDERER'] = 'client'
+        html = client.get(URL).data.decode()
+        assert '<math ' not in html
+        assert '\\(x = \\frac{-b}{2a}\\)' in html
+        assert 'MathJax-script' in html
+
+    def test_render_command(self, runner, app, sample_data):
+        with app.app_context():
+            db.session.execute(RenderedMath.__table__.delete())
+            db.session.commit()
+        result = runner.invoke(args=['math', 'render'])
+        assert result.exit_code == 0
+        assert 'Rendered 1 of 1 formulas' in result.output
+        with app.app_context():
+            assert len(stored_keys()) == 1
@@ -0,0 +1,71 @@
+import re
+
+from app import create_app
+from app.models import Topic
+from app.queries import count_queries
+
+TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries", render;dur=([\d.]+), app;dur=([\d.]+)')
+
+
+def timing(response):
+    match = TIMING.fullmatch(response.headers['Server-Timing'])
+    assert match, response.headers['Server-Timing']
+    db_ms, queries, render_ms, total_ms = match.groups()
+    return float(db_ms), int(queries), float(render_ms), float(total_ms)
+
+
+class TestServerTiming:
+    """Test the per-request Server-Timing header."""
+
+    def test_counts_queries_and_render(self, app, client, sample_data):
+        # The view count is written after the response is finished.
+        app.config['VIEW_COUNT_ENABLED'] = False
+        with count_queries() as statements:
+            response = client.get('/topics/test-quadratic-equations')
+        db_ms, queries, render_ms, total_ms = timing(response)
+        assert queries == len(statements) > 0
+        assert render_ms > 0
+        assert total_ms >= db_ms + render_ms
+
+    def test_page_without_queries(self, client):
+        _, queries, render_ms, _ = timing(client.get('/about'))
+        assert queries == 0
+        assert render_ms > 0
+
+    def test_queries_outside_requests_not_counted(self, app, client, sample_data):
+        client.get('/about')
+        Topic.query.all()
+        assert timing(client.get('/about'))[1] == 0
+
+    def test_streamed_page_recorded_once_sent(self, client, sample_data):
+        with count_queries() as statements:
+            response = client.get('/admin/topics')
+        # The header went out before the rows were fetched.
+        assert timing(response)[1] < len(statements)
+        body = client.get('/metrics').get_data(as_text=True)
+        assert f'mathmerise_db_queries_sum{{endpoint="admin.manage_topics"}} {len(statements)}' in body
+        assert 'mathmerise_requests_total{endpoint="admin.manage_topics",status="200"} 1' in body
+
+
+class TestMetricsEndpoint:
+    """Test the Prometheus exposition at /metrics."""
+
+    def test_histograms_per_endpoint(self, client, sample_data):
+        client.get('/topics/test-quadratic-equations')
+        client.get('/topics/test-quadratic-equations')
+        client.get('/no-such-page')
+        body = client.get('/metrics').get_data(as_text=True)
+        assert 'mathmerise_requests_total{endpoint="topics.view_topic",status="200"} 2' in body
+        assert 'mathmerise_requests_total{endpoint="unmatched",status="404"} 1' in body
+        assert 'mathmerise_request_duration_seconds_count{endpoint="topics.view_topic"} 2' in body
+        assert 'mathmerise_db_queries_bucket{endpoint="topics.view_topic",le="+Inf"} 2' in body
+        assert '# TYPE mathmerise_render_duration_seconds histogram' in body
+
+    def test_disabled(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('METRICS_ENABLED', '0')
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "metrics.db"}')
+        app = create_app('testing')
+        client = app.test_client()
+        assert 'metrics' not in app.extensions
+        assert 'Server-Timing' not in client.get('/about').headers
+        assert client.get('/metrics').status_code == 404
@@ -0,0 +1,126 @@
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from app import db, queries
+from app.cache import NullCache
+from app.models import Category, Topic
+from app.pagination import Keyset
+
+
+@pytest.fixture
+def topics(app):
+    """Create 25 topics in two categories with tied view counts and dates."""
+    app.extensions['response_cache'].backend = NullCache()
+    app.config['PER_PAGE'] = 4
+    created = datetime(2024, 1, 1)
+    with app.app_context():
+        categories = [Category(name=f'Category {c}', slug=f'category-{c}') for c in range(2)]
+        db.session.add_all(categories)
+        for i in range(25):
+            db.session.add(Topic(
+                title=f'Topic {i:02d}',
+                slug=f'topic-{i:02d}',
+                description='d',
+                content='c',
+                category=categories[i % 2],
+                views=i % 3,
+                created_at=created + timedelta(days=i // 5),
+            ))
+        db.session.commit()
+
+
+def walk(page_for):
+    """Follow next cursors to the end, then prev cursors back to the start."""
+    pages = [page_for()]
+    while pages[-1].has_next:
+        pages.append(page_for(after=pages[-1].next_cursor))
+    back = [pages[-1]]
+    while back[-1].has_prev:
+        back.append(page_for(before=back[-1].prev_cursor))
+    return pages, back[::-1]
+
+
+class TestKeysetPagination:
+    """Test seek pagination over the topic orderings."""
+
+    @pytest.mark.parametrize('sort, key', [
+        ('title', lambda t: (t.title, t.id)),
+        ('popular', lambda t: (-t.views, -t.id)),
+        ('newest', lambda t: (-t.created_at.timestamp(), -t.id)),
+    ])
+    def test_pages_cover_every_topic_once_in_order(self, app, topics, sort, key):
+        with app.app_context():
+            forward, backward = walk(lambda **kw: queries.topic_page(sort=sort, **kw))
+            ids = [t.id for page in forward for t in page]
+            expected = [t.id for t in sorted(db.session.scalars(select(Topic)), key=key)]
+            assert ids == expected
+            assert [[t.id for t in p] for p in backward] == [[t.id for t in p] for p in forward]
+            assert len(forward) == 7
+            assert not forward[0].has_prev
+
+    def test_category_filter(self, app, topics):
+        with app.app_context():
+            category = db.session.scalars(select(Category).filter_by(slug='category-1')).one()
+            forward, _ = walk(lambda **kw: queries.topic_page(category_id=category.id, **kw))
+            assert sum(len(page) for page in forward) == 12
+            assert all(t.category_id == category.id for page in forward for t in page)
+
+    def test_inserts_do_not_shift_later_pages(self, app, topics):
+        with app.app_context():
+            first = queries.topic_page()
+            second_before = [t.id for t in queries.topic_page(after=first.next_cursor)]
+            db.session.add(Topic(title='Topic 00a', slug='topic-00a', content='c', category_id=1))
+            db.session.commit()
+            assert [t.id for t in queries.topic_page(after=first.next_cursor)] == second_before
+
+    def test_cursor_round_trip(self, app, topics):
+        keyset = Keyset(Topic.created_at, Topic.id, descending=True)
+        with app.app_context():
+            topic = db.session.scalars(select(Topic)).first()
+            assert keyset.decode(keyset.encode(topic)) == [topic.created_at, topic.id]
+
+    @pytest.mark.parametrize('cursor', ['!!!', 'bm90IGpzb24', 'WzFd', 'WyJhIiwiYiJd'])
+    def test_malformed_cursor_is_rejected(self, client, topics, cursor):
+        assert client.get(f'/topics/?after={cursor}').status_code == 400
+
+    # [123, 4], [null, 4] and ["x", 4] where a datetime is expected.
+    @pytest.mark.parametrize('cursor', ['WzEyMyw0XQ', 'W251bGwsNF0', 'WyJ4Iiw0XQ'])
+    def test_malformed_date_cursor_is_rejected(self, client, topics, cursor):
+        assert client.get(f'/topics/?sort=newest&after={cursor}').status_code == 400
+
+    def test_uses_composite_index(self, app, topics):
+        keyset = queries.TOPIC_ORDERS['popular']
+        with app.app_context():
+            stmt = select(Topic).filter(keyset.beyond([1, 10])).order_by(*keyset.order_by()).limit(5)
+            compiled = stmt.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = ' '.join(str(row[-1]) for row in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {compiled}')))
+            assert 'ix_topic_views_id' in plan
+            assert 'TEMP B-TREE' not in plan
+
+
+class TestPaginatedPages:
+    """Test the list pages link to their neighbours."""
+
+    def test_all_topics_pages(self, client, topics):
+        response = client.get('/topics/?sort=popular')
+        html = response.data.decode()
+        assert html.count('class="topic-card"') == 4
+        assert 'rel="prev"' not in html
+        next_url = re.search(r'href="([^"]+)"[^>]*rel="next"', html).group(1).replace('&amp;', '&')
+        assert 'sort=popular' in next_url
+        html = client.get(next_url).data.decode()
+        assert 'rel="prev"' in html and 'rel="next"' in html
+
+    def test_category_page(self, client, topics):
+        html = client.get('/topics/category/category-0').data.decode()
+        assert html.count('class="topic-card"') == 4
+        assert 'rel="next"' in html
+
+    def test_admin_lists(self, client, topics):
+        html = client.get('/admin/topics').data.decode()
+        assert 'Topic 24' in html
+        assert 'rel="next"' in html
+        assert 'rel="next"' not in client.get('/admin/categories').data.decode()
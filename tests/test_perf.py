@@ -0,0 +1,75 @@
+import os
+
+import pytest
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from flask_migrate import downgrade, upgrade
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'migrations')
+BASELINE = '02e7e8335999'
+
+
+@pytest.fixture
+def migrated_app(tmp_path, monkeypatch):
+    """An app on its own SQLite file, upgraded to the latest revision."""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "migrated.db"}')
+    app = create_app()
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+def schema_diff():
+    def include_name(name, type_, parent_names):
+        return type_ != 'table' or not name.startswith(('topic_fts', 'alembic_version'))
+
+    with db.engine.connect() as connection:
+        context = MigrationContext.configure(connection, opts={'include_name': include_name})
+        return compare_metadata(context, db.metadata)
+
+
+class TestMigrations:
+    """Test the migration set matches the models."""
+
+    def test_upgrade_matches_models(self, migrated_app):
+        assert schema_diff() == []
+
+    def test_upgrade_from_pre_migration_schema(self, migrated_app):
+        downgrade(directory=MIGRATIONS, revision=BASELINE)
+        with db.engine.begin() as connection:
+            connection.execute(text("INSERT INTO category (name, slug) VALUES ('A', 'a')"))
+            connection.execute(text(
+                "INSERT INTO topic (title, slug, content, category_id, views) VALUES ('T', 't', 'c', 1, NULL)"
+            ))
+        assert 'ix_formula_topic_id' not in {i['name'] for i in inspect(db.engine).get_indexes('formula')}
+
+        upgrade(directory=MIGRATIONS)
+        assert schema_diff() == []
+        with db.engine.connect() as connection:
+            assert connection.execute(text('SELECT views FROM topic')).scalar() == 0
+            # Filled by the data migrations.
+            assert connection.execute(text('SELECT content_html, reading_time FROM topic')).one() == ('c', 1)
+            assert connection.execute(text('SELECT topic_count FROM category')).scalar() == 1
+            assert connection.execute(text("SELECT rows FROM table_count WHERE name = 'topic'")).scalar() == 1
+            assert connection.execute(text("SELECT rowid FROM topic_fts WHERE topic_fts MATCH 't'")).scalar() == 1
+
+
+class TestExplainCommand:
+    """Test the query-plan check over the routes."""
+
+    def test_routes_use_indexes(self, runner, sample_data):
+        result = runner.invoke(args=['perf', 'explain'])
+        assert result.exit_code == 0, result.output
+        assert '/topics/test-quadratic-equations [200]' in result.output
+        assert '/topics/?sort=popular [200]' in result.output
+        assert 'No full scans found.' in result.output
+
+    def test_flags_full_scans(self, runner, sample_data):
+        result = runner.invoke(args=['perf', 'explain', '--url', '/topics/?sort=title', '--allow', 'none'])
+        assert result.exit_code == 1
+        assert '!! SCAN category' in result.output
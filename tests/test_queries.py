@@ -0,0 +1,94 @@
+import pytest
+
+from app import db, queries
+from app.cache import NullCache
+from app.recommend import recommendations
+from app.models import Category, Topic, Formula, Example
+
+
+@pytest.fixture
+def catalog(app):
+    """Create several categories with a few topics, formulas and examples each."""
+    # Budgets cover what a view renders, so keep the response cache out of the way.
+    app.extensions['response_cache'].backend = NullCache()
+    with app.app_context():
+        for c in range(3):
+            category = Category(name=f'Category {c}', slug=f'category-{c}')
+            db.session.add(category)
+            for t in range(3):
+                topic = Topic(
+                    title=f'Topic {c}-{t}',
+                    slug=f'topic-{c}-{t}',
+                    description=f'Description {c}-{t}',
+                    content='<p>Body</p>',
+                    category=category,
+                    views=c * 3 + t
+                )
+                db.session.add(topic)
+                for n in range(2):
+                    db.session.add(Formula(topic=topic, title=f'Formula {n}', latex='x^2'))
+                    db.session.add(Example(topic=topic, title=f'Example {n}', problem='p', solution='s'))
+        db.session.commit()
+        # Built up front, as a running app would have done on an earlier request.
+        recommendations.refresh()
+
+
+class TestQueryBudgets:
+    """Test listing pages issue a constant number of queries."""
+
+    def test_index(self, assert_max_queries, catalog):
+        response = assert_max_queries('/')
+        assert b'Category 2' in response.data
+
+    def test_all_topics(self, assert_max_queries, catalog):
+        response = assert_max_queries('/topics/')
+        assert b'Topic 1-2' in response.data
+
+    def test_category(self, assert_max_queries, catalog):
+        response = assert_max_queries('/topics/category/category-1')
+        assert b'Topic 1-0' in response.data
+
+    def test_view_topic(self, assert_max_queries, catalog):
+        response = assert_max_queries('/topics/topic-0-0')
+        assert b'Formula 1' in response.data
+        assert b'Example 1' in response.data
+        assert b'Topic 0-1' in response.data
+
+    def test_search(self, assert_max_queries, catalog):
+        response = assert_max_queries('/search?q=topic')
+        assert b'Category 2' in response.data
+
+    def test_manage_topics(self, assert_max_queries, catalog):
+        response = assert_max_queries('/admin/topics')
+        assert b'Category 1' in response.data
+
+    def test_manage_categories(self, assert_max_queries, catalog):
+        assert_max_queries('/admin/categories')
+
+    def test_budget_is_enforced(self, assert_max_queries, catalog):
+        """Test the helper fails when a page exceeds its budget."""
+        with pytest.raises(AssertionError):
+            assert_max_queries('/topics/', budget=0)
+
+
+class TestDeferredColumns:
+    """Test listings leave the large text columns in the database."""
+
+    BODY_COLUMNS = ('topic.content', 'topic.content_html', 'topic.toc', 'formula.latex', 'example.problem')
+
+    def statements(self, client, url):
+        client.get(url)  # warm per-process caches so only the page's own queries remain
+        with queries.count_queries() as statements:
+            assert client.get(url).status_code == 200
+        return ' '.join(statements)
+
+    @pytest.mark.parametrize('url', ['/', '/topics/', '/topics/category/category-1', '/search?q=topic', '/admin/topics'])
+    def test_listing_skips_bodies(self, client, catalog, url):
+        sql = self.statements(client, url)
+        for column in self.BODY_COLUMNS:
+            assert column not in sql
+
+    def test_topic_page_loads_bodies_up_front(self, client, catalog):
+        sql = self.statements(client, '/topics/topic-0-0')
+        for column in self.BODY_COLUMNS:
+            assert column in sql
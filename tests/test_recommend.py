@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from app import db
+from app.models import Category, Formula, Topic
+from app.recommend import build_snapshot, recommendations
+
+
+@pytest.fixture
+def catalog(app):
+    """Two categories; the quadratic topics share formula names across them."""
+    with app.app_context():
+        algebra = Category(name='Algebra', slug='algebra')
+        functions = Category(name='Functions', slug='functions')
+        db.session.add_all([algebra, functions])
+        rows = [
+            ('Quadratic Equations', algebra, 'intermediate', 50, ['Quadratic Formula', 'Discriminant']),
+            ('Linear Equations', algebra, 'beginner', 40, ['Slope Intercept']),
+            ('Polynomials', algebra, 'beginner', 30, []),
+            ('Inequalities', algebra, 'beginner', 20, []),
+            ('Quadratic Functions', functions, 'intermediate', 10, ['Vertex Form', 'Discriminant']),
+            ('Exponential Functions', functions, 'advanced', 5, []),
+        ]
+        for title, category, difficulty, views, formulas in rows:
+            slug = title.lower().replace(' ', '-')
+            topic = Topic(title=title, slug=slug, description=f'About {title.lower()}', content='c',
+                          category=category, difficulty=difficulty, views=views)
+            db.session.add(topic)
+            for name in formulas:
+                db.session.add(Formula(topic=topic, title=name, latex='x'))
+        db.session.commit()
+        return {t.slug: t.id for t in Topic.query.all()}
+
+
+class TestBuildSnapshot:
+    """Test the recommendation ranking."""
+
+    def test_shared_formulas_outrank_category(self):
+        rows = [
+            (1, 'Quadratic Equations', '', 1, 'beginner', 0),
+            (2, 'Linear Systems', '', 1, 'beginner', 0),
+            (3, 'Parabolas', '', 2, 'advanced', 0),
+        ] + [(i, f'Filler {i}', '', 3, 'beginner', 0) for i in range(4, 30)]
+        snapshot = build_snapshot(rows, {1: ['Discriminant'], 3: ['Discriminant']}, 6, 2, 2)
+        assert snapshot.related[1] == (3, 2)
+
+    def test_same_category_fills_when_nothing_is_shared(self):
+        rows = [(1, 'Alpha', '', 1, 'beginner', 0), (2, 'Beta', '', 1, 'beginner', 9), (3, 'Gamma', '', 2, 'beginner', 0)]
+        snapshot = build_snapshot(rows, {}, 6, 4, 2)
+        assert snapshot.related[1] == (2,)
+
+    def test_featured_spreads_across_categories(self):
+        rows = [(i, f'T{i}', '', 1 if i < 5 else 2, 'beginner', 100 - i) for i in range(1, 8)]
+        snapshot = build_snapshot(rows, {}, 4, 4, 2)
+        assert snapshot.featured == (1, 2, 5, 6)
+
+
+class TestRecommendations:
+    """Test the pages read recommendations from the snapshot."""
+
+    def test_related_topics_on_topic_page(self, client, catalog):
+        html = client.get('/topics/quadratic-equations').data.decode()
+        related = html[html.index('related-topics'):]
+        assert related.index('Quadratic Functions') < related.index('Linear Equations')
+
+    def test_featured_on_index(self, client, catalog):
+        html = client.get('/').data.decode()
+        featured = html[html.index('featured-topics'):]
+        # At most two per category before the rest: Polynomials (30 views)
+        # comes after Quadratic Functions (10 views) from another category.
+        assert featured.index('Linear Equations') < featured.index('Quadratic Functions') < featured.index('Polynomials')
+
+    def test_new_topic_is_recommended_after_commit(self, client, app, catalog):
+        client.get('/topics/quadratic-equations')
+        with app.app_context():
+            db.session.add(Topic(title='Quadratic Inequalities', slug='quadratic-inequalities',
+                                 description='About quadratic inequalities', content='c',
+                                 category_id=1, difficulty='intermediate'))
+            db.session.commit()
+        html = client.get('/topics/quadratic-equations').data.decode()
+        assert 'Quadratic Inequalities' in html[html.index('related-topics'):]
+        assert client.get('/topics/quadratic-inequalities').status_code == 200
+
+    def test_background_refresh_keeps_serving(self, app, catalog):
+        app.config['RECOMMEND_BACKGROUND'] = True
+        with app.app_context():
+            before = recommendations.snapshot()
+            app.extensions['recommend'].stale = True
+            assert recommendations.snapshot() is before
+            deadline = time.monotonic() + 5
+            while app.extensions['recommend'].refreshing and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert recommendations.snapshot() is not before
+
+    def test_pages_serve_before_the_first_snapshot(self, app, client, catalog, monkeypatch):
+        app.config['RECOMMEND_BACKGROUND'] = True
+        state = app.extensions['recommend']
+        state.snapshot = None
+        ready = threading.Event()
+        compute = recommendations.compute
+
+        def slow_compute():
+            ready.wait(5)
+            return compute()
+
+        monkeypatch.setattr(recommendations, 'compute', slow_compute)
+        assert 'related-topics' not in client.get('/topics/quadratic-equations').data.decode()
+        assert 'Polynomials' in client.get('/').data.decode()
+        ready.set()
+        deadline = time.monotonic() + 5
+        while state.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert state.snapshot is not None
+        html = client.get('/topics/quadratic-equations').data.decode()
+        assert 'Quadratic Functions' in html[html.index('related-topics'):]
+
+    def test_interval_refresh_only_recomputes_featured(self, app, catalog):
+        with app.app_context():
+            before = recommendations.snapshot()
+            db.session.get(Topic, catalog['exponential-functions']).views = 1000
+            db.session.commit()
+            state = app.extensions['recommend']
+            state.stale = False
+            state.built_at = 0
+            after = recommendations.snapshot()
+        assert after.featured[0] == catalog['exponential-functions']
+        assert after.related is before.related
+
+    def test_refresh_command(self, runner, catalog):
+        result = runner.invoke(args=['recommend', 'refresh'])
+        assert result.exit_code == 0
+        assert 'rebuilt for 6 topics' in result.output
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import select, text
+
+from app import create_app, db
+from app.cache import NullCache
+from app.models import Category, Topic
+from app.replicas import STICKY_KEY, replicas, sync_sqlite
+
+
+@pytest.fixture
+def routed(monkeypatch, tmp_path):
+    """An app whose primary and replica are two SQLite files, synced once."""
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "primary.db"}')
+    monkeypatch.setenv('DATABASE_REPLICA_URLS', f'sqlite:///{tmp_path / "replica.db"}')
+    app = create_app('testing')
+    app.config['VIEW_COUNT_FLUSH_INTERVAL'] = 0
+    app.config['RECOMMEND_BACKGROUND'] = False
+    app.config['RESPONSE_CACHE_CHECK_INTERVAL'] = 0
+    app.config['REPLICA_BACKGROUND'] = False
+    with app.app_context():
+        category = Category(name='Algebra', slug='algebra')
+        db.session.add(category)
+        db.session.add(Topic(title='Quadratics', slug='quadratics', content='<p>x</p>', category=category))
+        db.session.commit()
+        app.extensions['replicas'].primary_until = 0.0
+        replica = app.extensions['replicas'].replicas[0]
+        sync_sqlite(db.engine, replica.engine)
+    return app, replica
+
+
+def add_behind_replica(app, title):
+    """Write to the primary only, as if replication had not caught up yet."""
+    with app.app_context():
+        db.session.execute(text(
+            "INSERT INTO topic (title, slug, content, category_id, created_at, views) "
+            "VALUES (:title, :slug, '', 1, CURRENT_TIMESTAMP, 0)"
+        ), {'title': title, 'slug': title.lower()})
+        db.session.commit()
+
+
+class TestReplicaRouting:
+    """Test reads go to a replica and writes to the primary."""
+
+    def test_get_reads_replica(self, routed):
+        app, _ = routed
+        add_behind_replica(app, 'Logarithms')
+        html = app.test_client().get('/topics/').data.decode()
+        assert 'Quadratics' in html
+        assert 'Logarithms' not in html
+
+    def test_lagging_replica_falls_back_to_primary(self, routed):
+        app, replica = routed
+        add_behind_replica(app, 'Logarithms')
+        with replica.engine.begin() as connection:
+            connection.exec_driver_sql('UPDATE replica_sync SET synced_at = ?', (time.time() - 60,))
+        app.config['REPLICA_CHECK_INTERVAL'] = 0
+        assert 'Logarithms' in app.test_client().get('/topics/').data.decode()
+
+    def test_missing_replica_falls_back_to_primary(self, routed):
+        app, replica = routed
+        with replica.engine.begin() as connection:
+            connection.exec_driver_sql('DROP TABLE replica_sync')
+        app.config['REPLICA_CHECK_INTERVAL'] = 0
+        add_behind_replica(app, 'Logarithms')
+        assert 'Logarithms' in app.test_client().get('/topics/').data.decode()
+
+    def test_view_count_is_written_to_primary(self, routed):
+        app, replica = routed
+        assert app.test_client().get('/topics/quadratics').status_code == 200
+        with app.app_context():
+            assert db.session.scalar(select(Topic.views)) == 1
+        with replica.engine.connect() as connection:
+            assert connection.exec_driver_sql('SELECT views FROM topic').scalar() == 0
+
+    def test_writer_reads_primary_after_commit(self, routed):
+        app, _ = routed
+        client = app.test_client()
+        response = client.post('/admin/categories/add', data={'name': 'Geometry', 'slug': 'geometry'},
+                               follow_redirects=True)
+        assert b'Geometry' in response.data
+        with client.session_transaction() as cookie:
+            assert cookie[STICKY_KEY] > time.time()
+        with app.test_request_context():
+            assert app.extensions['replicas'].primary_until > time.monotonic()
+
+    def test_post_uses_primary(self, routed):
+        app, replica = routed
+        app.test_client().post('/admin/categories/add', data={'name': 'Geometry', 'slug': 'geometry'})
+        with app.app_context():
+            assert db.session.scalar(select(Category.id).filter_by(slug='geometry')) is not None
+        with replica.engine.connect() as connection:
+            assert connection.exec_driver_sql("SELECT count(*) FROM category WHERE slug = 'geometry'").scalar() == 0
+
+    def test_background_checks_keep_lag_off_requests(self, routed, monkeypatch):
+        app, replica = routed
+        add_behind_replica(app, 'Logarithms')
+        app.extensions['response_cache'].backend = NullCache()
+        app.config['REPLICA_BACKGROUND'] = True
+        app.config['REPLICA_CHECK_INTERVAL'] = 0.05
+        release, checked = threading.Event(), threading.Event()
+
+        def check(self):
+            release.wait(5)
+            self.lag, self.checked_at = 0.0, time.monotonic()
+            checked.set()
+
+        monkeypatch.setattr(type(replica), 'check', check)
+        client = app.test_client()
+        # No reading yet: the primary, while the thread takes the first one.
+        assert 'Logarithms' in client.get('/topics/').data.decode()
+        release.set()
+        assert checked.wait(5)
+        assert 'Logarithms' not in client.get('/topics/').data.decode()
+        # A checker stuck on the replica leaves an old reading: the primary again.
+        monkeypatch.setattr(type(replica), 'check', lambda self: None)
+        replica.checked_at -= 1
+        assert 'Logarithms' in client.get('/topics/').data.decode()
+        app.extensions['replicas'].checking = False
+
+    def test_no_replicas_reads_primary(self, app):
+        with app.test_request_context('/topics/'):
+            app.preprocess_request()
+            assert replicas.read_engine() is None
+
+
+class TestReplicaCommands:
+    """Test the replica CLI."""
+
+    def test_sync_and_status(self, routed):
+        app, _ = routed
+        add_behind_replica(app, 'Logarithms')
+        runner = app.test_cli_runner()
+        assert 'Synced 1 replica(s)' in runner.invoke(args=['replica', 'sync']).output
+        assert 's behind' in runner.invoke(args=['replica', 'status']).output
+        app.extensions['replicas'].primary_until = 0.0
+        assert 'Logarithms' in app.test_client().get('/topics/').data.decode()
@@ -0,0 +1,249 @@
+import pytest
+
+from app import create_app, db
+from app.models import Category, Topic, Formula, Example
+from app.search import search_index
+
+
+@pytest.fixture
+def search_data(app):
+    """Create topics whose matches live in different fields."""
+    with app.app_context():
+        category = Category(name='Analysis', slug='analysis')
+        db.session.add(category)
+        db.session.add_all([
+            Topic(title='Limits', slug='limits', category=category,
+                  description='Approaching values', content='<p>The <b>epsilon</b> definition</p>'),
+            Topic(title='Epsilon Delta Proofs', slug='epsilon-delta', category=category,
+                  description='Rigorous proofs', content='<p>Proof techniques</p>'),
+        ])
+        topic = Topic(title='Series', slug='series', category=category,
+                      description='Infinite sums', content='<p>Sums</p>')
+        db.session.add(topic)
+        db.session.add(Formula(topic=topic, title='Geometric series', latex='\\sum ar^n'))
+        db.session.add(Example(topic=topic, title='Telescoping', problem='Sum 1/(n(n+1))', solution='Converges to 1'))
+        db.session.commit()
+
+
+class TestSearch:
+    """Test the full-text search subsystem."""
+
+    def test_sqlite_uses_fts5(self, app):
+        with app.app_context():
+            assert search_index.backend(db.session.connection()).name == 'sqlite'
+
+    def test_title_match_ranks_first(self, app, search_data):
+        with app.app_context():
+            results = search_index.search('epsilon')
+            assert results.total == 2
+            assert [r.topic.slug for r in results] == ['epsilon-delta', 'limits']
+
+    def test_searches_content_formulas_and_examples(self, app, search_data):
+        with app.app_context():
+            assert [r.topic.slug for r in search_index.search('geometric')] == ['series']
+            assert [r.topic.slug for r in search_index.search('telescoping')] == ['series']
+            assert [r.topic.slug for r in search_index.search('definition')] == ['limits']
+
+    def test_prefix_of_last_word_matches(self, app, search_data):
+        with app.app_context():
+            assert [r.topic.slug for r in search_index.search('infin')] == ['series']
+
+    def test_highlighting_escapes_text(self, app, search_data):
+        with app.app_context():
+            result = search_index.search('proofs').items[0]
+            assert '<mark>Proofs</mark>' in result.title
+
+            topic = Topic.query.filter_by(slug='limits').first()
+            topic.title = '<script>Limits</script>'
+            db.session.commit()
+            result = search_index.search('limits').items[0]
+            assert '<script>' not in result.title
+            assert '&lt;script&gt;<mark>Limits</mark>' in result.title
+
+    def test_pagination(self, app, search_data):
+        with app.app_context():
+            first = search_index.search('epsilon', page=1, per_page=1)
+            second = search_index.search('epsilon', page=2, per_page=1)
+            assert first.pages == 2 and first.has_next and not first.has_prev
+            assert second.has_prev and not second.has_next
+            assert first.items[0].topic.slug != second.items[0].topic.slug
+
+    def test_index_follows_writes(self, app, search_data):
+        with app.app_context():
+            topic = Topic.query.filter_by(slug='series').first()
+            db.session.add(Formula(topic=topic, title='Ratio test', latex='L < 1'))
+            db.session.commit()
+            assert [r.topic.slug for r in search_index.search('ratio')] == ['series']
+
+            topic.description = 'Convergent expansions'
+            db.session.commit()
+            assert search_index.search('infinite').total == 0
+            assert search_index.search('expansions').total == 1
+
+            db.session.delete(topic)
+            db.session.commit()
+            assert search_index.search('ratio').total == 0
+
+    def test_admin_added_topic_is_searchable(self, client, app, sample_data):
+        client.post('/admin/topics/add', data={
+            'title': 'Matrices',
+            'slug': 'matrices',
+            'category_id': sample_data['category_id'],
+            'description': 'Determinants and inverses',
+            'content': '<p>Row reduction</p>',
+        })
+        response = client.get('/search?q=determinants')
+        assert b'<mark>Determinants</mark>' in response.data
+
+    def test_like_backend(self, app, search_data):
+        app.config['SEARCH_BACKEND'] = 'like'
+        app.extensions['search'].backend = None
+        with app.app_context():
+            results = search_index.search('epsilon')
+            assert [r.topic.slug for r in results] == ['epsilon-delta', 'limits']
+            assert '<mark>Epsilon</mark>' in results.items[0].title
+
+    def test_reindex_command(self, runner, app, search_data):
+        result = runner.invoke(args=['search', 'reindex'])
+        assert 'sqlite' in result.output
+        with app.app_context():
+            assert search_index.search('geometric').total == 1
+
+    def test_missing_index_is_not_created_by_a_search(self, client, runner, app, search_data):
+        with app.app_context():
+            db.session.execute(db.text('DROP TABLE topic_fts'))
+            db.session.commit()
+        app.extensions['search'].backend = None
+        response = client.get('/search?q=epsilon')
+        assert response.status_code == 200
+        assert b'/topics/limits' in response.data
+        exists = db.text("SELECT 1 FROM sqlite_master WHERE name = 'topic_fts'")
+        with app.app_context():
+            assert db.session.execute(exists).scalar() is None
+        runner.invoke(args=['search', 'reindex'])
+        with app.app_context():
+            assert db.session.execute(exists).scalar() == 1
+            assert search_index.search('epsilon').total == 2
+
+
+@pytest.fixture
+def memory_search(app, tmp_path):
+    """Switch the app to the in-memory backend with a temporary snapshot file."""
+    app.config['SEARCH_BACKEND'] = 'memory'
+    app.config['SEARCH_INDEX_SNAPSHOT'] = str(tmp_path / 'search.snapshot')
+    app.extensions['search'].backend = None
+    return app.config['SEARCH_INDEX_SNAPSHOT']
+
+
+class TestMemorySearch:
+    """Test the pure-Python inverted index backend."""
+
+    def test_built_lazily_on_first_search(self, app, search_data, memory_search):
+        import os
+        with app.app_context():
+            backend = search_index.backend(db.session.connection())
+            assert backend.index is None
+            results = search_index.search('epsilon')
+            assert [r.topic.slug for r in results] == ['epsilon-delta', 'limits']
+            assert len(backend.index) == 3
+            assert os.path.exists(memory_search)
+
+    def test_fields_and_highlighting(self, app, search_data, memory_search):
+        with app.app_context():
+            assert [r.topic.slug for r in search_index.search('telescoping')] == ['series']
+            assert [r.topic.slug for r in search_index.search('sum ar')] == ['series']
+            result = search_index.search('proofs').items[0]
+            assert '<mark>Proofs</mark>' in result.title
+
+    def test_incremental_updates(self, app, search_data, memory_search):
+        with app.app_context():
+            search_index.search('anything')
+            topic = Topic.query.filter_by(slug='series').first()
+            db.session.add(Formula(topic=topic, title='Ratio test', latex='L < 1'))
+            db.session.commit()
+            assert [r.topic.slug for r in search_index.search('ratio')] == ['series']
+
+            db.session.delete(topic)
+            db.session.commit()
+            assert search_index.search('ratio').total == 0
+            assert 'ratio' not in search_index.backend(db.session.connection()).index.postings
+
+    def test_only_committed_changes_are_indexed(self, app, search_data, memory_search):
+        with app.app_context():
+            search_index.search('anything')
+            topic = Topic.query.filter_by(slug='series').first()
+            db.session.add(Formula(topic=topic, title='Ratio test', latex='L < 1'))
+            db.session.flush()
+            assert search_index.search('ratio').total == 0
+            db.session.rollback()
+            assert search_index.search('ratio').total == 0
+
+            db.session.add(Formula(topic=topic, title='Root test', latex='L < 1'))
+            db.session.flush()
+            assert search_index.search('root').total == 0
+            db.session.commit()
+            assert [r.topic.slug for r in search_index.search('root')] == ['series']
+
+    def test_edits_by_other_workers_are_seen(self, app, search_data, memory_search):
+        from app.search.memory import MemoryBackend
+        with app.app_context():
+            other = MemoryBackend()
+            assert other.search(db.session.connection(), 'ratio', 10, 0)[0] == 0
+            formula = Formula.query.first()
+            formula.title = 'Ratio test'
+            db.session.commit()
+            other.checked_at = 0.0
+            assert other.search(db.session.connection(), 'ratio', 10, 0)[0] == 1
+
+    def test_own_write_does_not_hide_another_workers(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "shared.db"}')
+        monkeypatch.setenv('SEARCH_BACKEND', 'memory')
+        workers = []
+        for name in 'ab':
+            worker = create_app('testing')
+            worker.config['RECOMMEND_BACKGROUND'] = False
+            worker.config['SEARCH_INDEX_SNAPSHOT'] = str(tmp_path / f'{name}.snapshot')
+            workers.append(worker)
+        a, b = workers
+        with a.app_context():
+            category = Category(name='Animals', slug='animals')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+            search_index.search('anything')
+        with b.app_context():
+            search_index.search('anything')
+            db.session.add(Topic(title='Zebra', slug='zebra', category_id=category_id, content='x'))
+            db.session.commit()
+        with a.app_context():
+            db.session.add(Topic(title='Yak', slug='yak', category_id=category_id, content='x'))
+            db.session.commit()
+            assert search_index.search('yak').total == 1
+            search_index.backend(db.session.connection()).checked_at = 0.0
+            assert search_index.search('zebra').total == 1
+
+    def test_prefix_completion(self, app, search_data, memory_search):
+        with app.app_context():
+            backend = search_index.backend(db.session.connection())
+            assert backend.complete(db.session.connection(), 'pro') == ['proof', 'proofs']
+            assert [r.topic.slug for r in search_index.search('epsil')] == ['epsilon-delta', 'limits']
+
+    def test_worker_starts_from_snapshot(self, app, search_data, memory_search):
+        from app.search.memory import MemoryBackend
+        with app.app_context():
+            search_index.search('epsilon')
+            fresh = MemoryBackend()
+            connection = db.session.connection()
+            fresh._build = None  # a warm start must not rebuild
+            total, hits = fresh.search(connection, 'epsilon', 10, 0)
+            assert total == 2
+
+    def test_stale_snapshot_is_rebuilt(self, app, search_data, memory_search):
+        from app.search.memory import MemoryBackend
+        with app.app_context():
+            search_index.search('epsilon')
+            category = Category.query.first()
+            db.session.add(Topic(title='Epsilon Nets', slug='epsilon-nets', category=category, content='x'))
+            db.session.commit()
+            total, hits = MemoryBackend().search(db.session.connection(), 'epsilon', 10, 0)
+            assert total == 3
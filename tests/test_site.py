@@ -0,0 +1,67 @@
+import json
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Topic
+from app.site import MANIFEST, page_file, public_pages
+
+
+def build(runner, destination, *args):
+    result = runner.invoke(args=['site', 'build', str(destination), '--jobs', '1', *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+class TestSiteBuild:
+    """Test rendering the public pages to static files."""
+
+    def test_page_files(self):
+        assert page_file('/') == 'index.html'
+        assert page_file('/topics/') == 'topics/index.html'
+        assert page_file('/topics/quadratics') == 'topics/quadratics.html'
+
+    def test_builds_every_public_page(self, runner, sample_data, tmp_path):
+        assert 'Rendered 5 pages (0 unchanged, 0 removed)' in build(runner, tmp_path)
+        assert 'Test Quadratic Equations' in (tmp_path / 'topics/test-quadratic-equations.html').read_text()
+        assert 'Test Algebra' in (tmp_path / 'topics/category/test-algebra.html').read_text()
+        assert (tmp_path / 'index.html').exists()
+        assert (tmp_path / 'topics/index.html').exists()
+        assert (tmp_path / 'about.html').exists()
+        assert (tmp_path / 'static/css').is_dir()
+
+    def test_does_not_count_views(self, runner, app, sample_data, tmp_path):
+        build(runner, tmp_path)
+        with app.app_context():
+            assert db.session.scalar(select(Topic.views)) == 0
+
+    def test_rebuilds_only_changed_pages(self, runner, app, sample_data, tmp_path):
+        build(runner, tmp_path)
+        assert 'Rendered 0 pages (5 unchanged' in build(runner, tmp_path)
+        with app.app_context():
+            db.session.get(Topic, sample_data['topic_id']).title = 'Completing the Square'
+            db.session.commit()
+        output = build(runner, tmp_path)
+        # The topic, its category, the topic list and the home page show it.
+        assert 'Rendered 4 pages (1 unchanged' in output
+        assert 'Completing the Square' in (tmp_path / 'topics/test-quadratic-equations.html').read_text()
+
+    def test_removes_deleted_pages(self, runner, app, sample_data, tmp_path):
+        build(runner, tmp_path)
+        with app.app_context():
+            topic = db.session.get(Topic, sample_data['topic_id'])
+            db.session.delete(topic)
+            db.session.commit()
+        assert '1 removed' in build(runner, tmp_path)
+        assert not (tmp_path / 'topics/test-quadratic-equations.html').exists()
+        assert '/topics/test-quadratic-equations' not in json.loads((tmp_path / MANIFEST).read_text())['pages']
+
+    def test_full_rebuild(self, runner, sample_data, tmp_path):
+        build(runner, tmp_path)
+        assert 'Rendered 5 pages' in build(runner, tmp_path, '--full')
+
+    def test_fingerprints_match_page_etags(self, app, client, sample_data):
+        with app.app_context():
+            pages = public_pages()
+        for path in ('/', '/topics/', '/topics/category/test-algebra', '/topics/test-quadratic-equations'):
+            assert client.get(path).headers['ETag'] == f'W/"{pages[path]}"'
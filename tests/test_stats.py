@@ -0,0 +1,120 @@
+from sqlalchemy import text
+
+from app import db
+from app.models import Category, Example, Formula, Topic
+from app.stats import reconcile, table_counts
+from app.transfer import Importer
+
+
+def add_topic(category, slug, formulas=0, examples=0):
+    topic = Topic(title=slug.title(), slug=slug, content='<p>x</p>', category=category)
+    topic.formulas = [Formula(title=f'F{n}', latex='x') for n in range(formulas)]
+    topic.examples = [Example(title=f'E{n}', problem='p', solution='s') for n in range(examples)]
+    db.session.add(topic)
+    return topic
+
+
+def stored_counts():
+    """Maintained counts alongside what the rows say."""
+    categories = {c.slug: c.topic_count for c in Category.query.all()}
+    topics = {t.slug: (t.formula_count, t.example_count) for t in Topic.query.all()}
+    return table_counts(), categories, topics
+
+
+class TestMaintainedCounts:
+    """Test incremental count maintenance through session events."""
+
+    def test_sample_data(self, app, sample_data):
+        assert table_counts() == {'category': 1, 'topic': 1, 'formula': 1, 'example': 1}
+        assert db.session.get(Category, sample_data['category_id']).topic_count == 1
+        topic = db.session.get(Topic, sample_data['topic_id'])
+        assert (topic.formula_count, topic.example_count) == (1, 1)
+
+    def test_inserts_and_cascading_deletes(self, app):
+        algebra = Category(name='Algebra', slug='algebra')
+        add_topic(algebra, 'lines', formulas=2, examples=1)
+        add_topic(algebra, 'planes', formulas=3)
+        db.session.commit()
+        counts, categories, topics = stored_counts()
+        assert counts == {'category': 1, 'topic': 2, 'formula': 5, 'example': 1}
+        assert categories == {'algebra': 2}
+        assert topics == {'lines': (2, 1), 'planes': (3, 0)}
+
+        db.session.delete(Topic.query.filter_by(slug='lines').one())
+        db.session.commit()
+        assert stored_counts() == ({'category': 1, 'topic': 1, 'formula': 3, 'example': 0},
+                                   {'algebra': 1}, {'planes': (3, 0)})
+
+        db.session.delete(algebra)
+        db.session.commit()
+        assert table_counts() == {'category': 0, 'topic': 0, 'formula': 0, 'example': 0}
+
+    def test_moves_between_parents(self, app):
+        algebra, geometry = Category(name='Algebra', slug='algebra'), Category(name='Geometry', slug='geometry')
+        lines = add_topic(algebra, 'lines', formulas=2)
+        planes = add_topic(algebra, 'planes')
+        db.session.commit()
+        lines.category = geometry
+        lines.formulas[0].topic = planes
+        db.session.commit()
+        _, categories, topics = stored_counts()
+        assert categories == {'algebra': 1, 'geometry': 1}
+        assert topics == {'lines': (1, 0), 'planes': (1, 0)}
+        # Expired by the commit: the old foreign key was never loaded.
+        planes.category_id = geometry.id
+        db.session.delete(lines.formulas[0])
+        db.session.commit()
+        counts, categories, topics = stored_counts()
+        assert counts['formula'] == 1
+        assert categories == {'algebra': 0, 'geometry': 2}
+        assert topics == {'lines': (0, 0), 'planes': (1, 0)}
+
+    def test_loaded_objects_see_new_counts(self, app, sample_data):
+        category = db.session.get(Category, sample_data['category_id'])
+        assert category.topic_count == 1
+        add_topic(category, 'cubics')
+        db.session.commit()
+        assert category.topic_count == 2
+
+    def test_count_updates_do_not_touch_topics(self, app, sample_data):
+        topic = db.session.get(Topic, sample_data['topic_id'])
+        db.session.add(Formula(topic_id=topic.id, title='Vertex', latex='x'))
+        db.session.commit()
+        before = topic.updated_at
+        db.session.execute(text('UPDATE topic SET formula_count = 0'))
+        reconcile(db.session.connection())
+        db.session.commit()
+        db.session.refresh(topic)
+        assert topic.formula_count == 2
+        assert topic.updated_at == before
+
+
+class TestReconcile:
+    """Test recomputing counts after writes that bypassed the session."""
+
+    def test_fixes_drift(self, app, runner, sample_data):
+        db.session.execute(text('UPDATE category SET topic_count = 7'))
+        db.session.execute(text("UPDATE table_count SET rows = 0 WHERE name = 'formula'"))
+        db.session.execute(text('DELETE FROM example'))
+        db.session.commit()
+        result = runner.invoke(args=['stats', 'reconcile'])
+        assert '4 stored values were out of date' in result.output
+        db.session.expire_all()
+        assert stored_counts() == ({'category': 1, 'topic': 1, 'formula': 1, 'example': 0},
+                                   {'test-algebra': 1}, {'test-quadratic-equations': (1, 0)})
+        assert '; 0 stored values' in runner.invoke(args=['stats', 'reconcile']).output
+
+    def test_import_leaves_counts_consistent(self, app):
+        importer = Importer(db.engine, render=False)
+        importer.add('category', {'slug': 'algebra', 'name': 'Algebra', 'description': None, 'icon': None})
+        for n in range(3):
+            importer.add('topic', {'slug': f't{n}', 'title': f'T{n}', 'category': 'algebra', 'content': '<p>x</p>',
+                                   'description': None, 'difficulty': None, 'views': None, 'created_at': None})
+        importer.add('formula', {'topic': 't0', 'title': 'F', 'latex': 'x', 'description': None})
+        importer.finish()
+        assert stored_counts() == ({'category': 1, 'topic': 3, 'formula': 1, 'example': 0},
+                                   {'algebra': 3}, {'t0': (1, 0), 't1': (0, 0), 't2': (0, 0)})
+
+    def test_dashboard_reads_stored_counts(self, app, sample_data, assert_max_queries):
+        response = assert_max_queries('/admin/', budget=1)
+        assert response.status_code == 200
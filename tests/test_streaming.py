@@ -0,0 +1,94 @@
+import pytest
+
+from app import db, queries
+from app.cache import NullCache
+from app.models import Category, Topic
+from app.queries import count_queries
+
+
+@pytest.fixture
+def topics(app):
+    """Ten topics in one category, paged four at a time."""
+    app.config['PER_PAGE'] = 4
+    category = Category(name='Algebra', slug='algebra')
+    db.session.add_all([
+        Topic(title=f'Topic {n:02d}', slug=f'topic-{n:02d}', content='<p>x</p>', category=category)
+        for n in range(10)
+    ])
+    db.session.commit()
+
+
+def first_chunk(client, url):
+    """GET ``url`` unbuffered; returns the response and its first body chunk."""
+    response = client.get(url, buffered=False)
+    chunks = response.iter_encoded()
+    return response, chunks, next(chunks)
+
+
+class TestStreamedPages:
+    """Test the list pages are sent while they render."""
+
+    @pytest.mark.parametrize('url', ['/topics/', '/admin/topics', '/search?q=topic'])
+    def test_head_is_sent_before_the_rows_are_queried(self, app, client, topics, url):
+        app.extensions['response_cache'].backend = NullCache()
+        with count_queries() as statements:
+            response, chunks, head = first_chunk(client, url)
+            assert response.is_streamed
+            assert b'<link rel="stylesheet"' in head
+            before = len(statements)
+            rest = b''.join(chunks)
+            response.close()
+        assert len(statements) > before
+        assert b'/topics/topic-0' in rest
+
+    @pytest.mark.parametrize('url', ['/topics/', '/topics/?sort=newest', '/admin/topics', '/search?q=topic'])
+    def test_same_page_as_render_template(self, app, client, topics, url):
+        app.extensions['response_cache'].backend = NullCache()
+        streamed = client.get(url)
+        assert 'Content-Length' not in streamed.headers
+        streamed = streamed.data
+        app.config['STREAM_PAGES'] = False
+        rendered = client.get(url)
+        assert 'Content-Length' in rendered.headers
+        assert streamed == rendered.data
+
+    def test_cursors_walk_every_topic(self, app, client, topics):
+        app.extensions['response_cache'].backend = NullCache()
+        page = queries.topic_page(stream=True)
+        with pytest.raises(RuntimeError):
+            page.has_next
+        seen = []
+        while True:
+            seen.extend(topic.slug for topic in page)
+            if not page.has_next:
+                break
+            page = queries.topic_page(stream=True, after=page.next_cursor)
+        assert seen == [f'topic-{n:02d}' for n in range(10)]
+        assert page.has_prev
+        earlier = queries.topic_page(stream=True, before=page.prev_cursor)
+        assert [topic.slug for topic in earlier] == ['topic-04', 'topic-05', 'topic-06', 'topic-07']
+        assert b'No topics found.' in client.get('/topics/?category=999').data
+
+    def test_pending_flash_renders_whole_page(self, client, topics):
+        with client.session_transaction() as session:
+            session['_flashes'] = [('message', 'Saved')]
+        response = client.get('/admin/topics')
+        assert 'Content-Length' in response.headers
+        assert b'Saved' in response.data
+
+
+class TestStreamedCache:
+    """Test the response cache stores streamed pages as they go out."""
+
+    def test_stored_once_sent(self, client, topics):
+        first = client.get('/topics/')
+        assert 'Content-Length' not in first.headers
+        second = client.get('/topics/')
+        assert second.headers['X-Cache'] == 'HIT'
+        assert second.data == first.data
+
+    def test_cut_short_is_not_stored(self, client, topics):
+        response, _, _ = first_chunk(client, '/topics/')
+        response.close()
+        assert client.get('/topics/').headers['X-Cache'] == 'MISS'
+        assert client.get('/admin/cache').get_json()['stores'] == 1
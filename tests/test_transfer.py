@@ -0,0 +1,149 @@
+import json
+
+from sqlalchemy import func, select
+
+from app import db
+from app.models import Category, Example, Formula, Topic
+from app.search import search_index
+from app.transfer import _copy
+
+
+def write_jsonl(path, records):
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    return str(path)
+
+
+CATALOG = [
+    {'type': 'category', 'slug': 'series', 'name': 'Series', 'icon': '∑'},
+    {'type': 'topic', 'slug': 'geometric-series', 'title': 'Geometric Series', 'category': 'series',
+     'description': 'Sums of ratios', 'content': '<h2>Sum</h2><p>Converges when \\(|r| < 1\\)</p>',
+     'views': 7, 'created_at': '2024-01-02T03:04:05'},
+    {'type': 'formula', 'topic': 'geometric-series', 'title': 'Sum', 'latex': 'S = \\frac{a}{1 - r}'},
+    {'type': 'example', 'topic': 'geometric-series', 'title': 'Halves', 'problem': '1/2 + 1/4 + ...', 'solution': '1'},
+]
+
+
+def count(model):
+    return db.session.scalar(select(func.count()).select_from(model))
+
+
+class TestImport:
+    """Test loading a catalog from JSON Lines and CSV."""
+
+    def test_import_jsonl(self, runner, app, tmp_path):
+        result = runner.invoke(args=['content', 'import', write_jsonl(tmp_path / 'catalog.jsonl', CATALOG)])
+        assert result.exit_code == 0, result.output
+        assert 'Imported 4 rows' in result.output
+        with app.app_context():
+            topic = Topic.query.filter_by(slug='geometric-series').one()
+            assert topic.category.slug == 'series'
+            assert topic.views == 7
+            assert topic.created_at.year == 2024
+            assert topic.toc == [{'level': 2, 'id': 'sum', 'title': 'Sum'}]
+            assert topic.has_tex
+            assert [f.title for f in topic.formulas] == ['Sum']
+            assert [e.title for e in topic.examples] == ['Halves']
+            assert [hit.topic.slug for hit in search_index.search('ratios')] == ['geometric-series']
+
+    def test_reimport_updates_in_place(self, runner, app, tmp_path):
+        path = write_jsonl(tmp_path / 'catalog.jsonl', CATALOG)
+        runner.invoke(args=['content', 'import', path])
+        with app.app_context():
+            db.session.execute(Topic.__table__.update().values(views=100))
+            db.session.commit()
+        changed = [dict(record) for record in CATALOG]
+        changed[1]['title'] = 'Geometric Sums'
+        result = runner.invoke(args=['content', 'import', write_jsonl(tmp_path / 'again.jsonl', changed)])
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            assert count(Topic) == 1
+            assert count(Formula) == 1
+            assert count(Example) == 1
+            topic = Topic.query.one()
+            assert topic.title == 'Geometric Sums'
+            assert topic.views == 100
+
+    def test_children_resolve_across_batches(self, runner, app, tmp_path):
+        records = [CATALOG[0]] + [
+            {'type': 'topic', 'slug': f't{n}', 'title': f'T{n}', 'category': 'series', 'content': 'c'}
+            for n in range(5)
+        ] + [{'type': 'formula', 'topic': f't{n}', 'title': 'F', 'latex': 'x'} for n in range(5)]
+        result = runner.invoke(args=['content', 'import', '--batch-size', '2',
+                                     write_jsonl(tmp_path / 'catalog.jsonl', records)])
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            assert count(Formula) == 5
+
+    def test_unknown_category_is_reported(self, runner, tmp_path):
+        records = [dict(CATALOG[1], category='missing')]
+        result = runner.invoke(args=['content', 'import', write_jsonl(tmp_path / 'bad.jsonl', records)])
+        assert result.exit_code == 1
+        assert "unknown category 'missing'" in result.output
+
+    def test_missing_field_is_reported(self, runner, tmp_path):
+        result = runner.invoke(args=['content', 'import', write_jsonl(tmp_path / 'bad.jsonl', [{'type': 'category'}])])
+        assert result.exit_code == 1
+        assert 'line 1: category is missing slug, name' in result.output
+
+
+class TestExport:
+    """Test dumping the catalog and loading it back."""
+
+    def test_jsonl_round_trip(self, runner, app, sample_data, tmp_path):
+        path = tmp_path / 'dump.jsonl'
+        assert runner.invoke(args=['content', 'export', str(path)]).exit_code == 0
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [r['type'] for r in records] == ['category', 'topic', 'formula', 'example']
+        assert records[1]['category'] == 'test-algebra'
+        with app.app_context():
+            db.session.execute(Category.__table__.delete())
+            db.session.execute(Topic.__table__.delete())
+            db.session.execute(Formula.__table__.delete())
+            db.session.execute(Example.__table__.delete())
+            db.session.commit()
+        assert runner.invoke(args=['content', 'import', str(path)]).exit_code == 0
+        again = tmp_path / 'again.jsonl'
+        runner.invoke(args=['content', 'export', str(again)])
+        assert again.read_text() == path.read_text()
+
+    def test_csv_round_trip(self, runner, app, sample_data, tmp_path):
+        directory = tmp_path / 'dump'
+        assert runner.invoke(args=['content', 'export', str(directory)]).exit_code == 0
+        assert sorted(p.name for p in directory.iterdir()) == [
+            'categories.csv', 'examples.csv', 'formulas.csv', 'topics.csv'
+        ]
+        result = runner.invoke(args=['content', 'import', str(directory)])
+        assert result.exit_code == 0, result.output
+        with app.app_context():
+            assert count(Topic) == 1
+            assert count(Formula) == 1
+
+
+class TestCopy:
+    """Test the CSV written for PostgreSQL's COPY."""
+
+    def test_none_is_null_and_strings_stay_strings(self):
+        copied = []
+
+        class Cursor:
+            def copy_expert(self, sql, buffer):
+                copied.append((sql, buffer.read()))
+
+            def close(self):
+                pass
+
+        class Connection:
+            class connection:
+                cursor = Cursor
+
+        rows = [
+            {'name': 'Series', 'description': None, 'icon': '', 'views': 3, 'toc': [{'id': 'a "b"'}]},
+            {'name': '\\N', 'description': 'Sums, "closed"\nforms', 'icon': None, 'views': 0, 'toc': None},
+        ]
+        _copy(Connection(), 'topic', list(rows[0]), rows)
+        sql, data = copied[0]
+        assert "NULL '\\N'" in sql
+        assert data == (
+            '"Series",\\N,"",3,"[{""id"": ""a \\""b\\""""}]"\n'
+            '"\\N","Sums, ""closed""\nforms",\\N,0,\\N\n'
+        )
@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import event
+
+from app import db, view_counter
+
+
+class TestViewCounter:
+    """Test buffered topic view counting."""
+
+    def test_views_are_buffered_until_flush(self, client, app, sample_data):
+        """Test views are held in memory until flushed."""
+        app.config['VIEW_COUNT_FLUSH_INTERVAL'] = 3600
+        with app.app_context():
+            from app.models import Topic
+            client.get(f"/topics/{sample_data['topic_slug']}")
+            client.get(f"/topics/{sample_data['topic_slug']}")
+
+            topic = db.session.get(Topic, sample_data['topic_id'])
+            assert topic.views == 0
+
+            assert view_counter.flush() == 1
+            topic = Topic.query.filter_by(slug=sample_data['topic_slug']).first()
+            assert topic.views == 2
+
+    def test_flush_issues_one_update_per_batch(self, app, sample_data):
+        """Test buffered views for many topics are written in one statement."""
+        app.config['VIEW_COUNT_FLUSH_INTERVAL'] = 3600
+        with app.app_context():
+            from app.models import Topic
+            other = Topic(
+                title='Other Topic',
+                slug='other-topic',
+                category_id=sample_data['category_id'],
+                content='Test'
+            )
+            db.session.add(other)
+            db.session.commit()
+            other_id = other.id
+
+            for _ in range(3):
+                view_counter.record(sample_data['topic_id'])
+            view_counter.record(other_id)
+
+            updates = []
+
+            def capture(conn, cursor, statement, parameters, context, executemany):
+                if statement.lstrip().upper().startswith('UPDATE'):
+                    updates.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', capture)
+            try:
+                view_counter.flush()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', capture)
+
+            assert len(updates) == 1
+            assert 'CASE' in updates[0]
+            assert db.session.get(Topic, sample_data['topic_id']).views == 3
+            assert db.session.get(Topic, other_id).views == 1
+
+    def test_views_do_not_touch_updated_at(self, client, app, sample_data):
+        """Test counting a view does not look like a content edit."""
+        with app.app_context():
+            from app.models import Topic
+            before = db.session.get(Topic, sample_data['topic_id']).updated_at
+            client.get(f"/topics/{sample_data['topic_slug']}")
+            db.session.expire_all()
+            assert db.session.get(Topic, sample_data['topic_id']).updated_at == before
+
+    def test_flush_with_nothing_pending(self, app):
+        """Test flushing an empty buffer is a no-op."""
+        with app.app_context():
+            assert view_counter.flush() == 0